@@ -1,12 +1,22 @@
 import os
-from flask import Flask, render_template, abort, session, current_app, flash, redirect, url_for
+import threading
+import time
+import click
+from flask import Flask, render_template, abort, current_app, flash, redirect, url_for, \
+    request
 import config
 from logging_config.setup_logger import setup_logger
-from blueprint_modules.user.user_routes import user_routes
+from blueprint_modules.user.user_routes import user_routes, get_session_user, user_profile_cache
 from blueprint_modules.movie.movie_routes import movie_routes
 from blueprint_modules.api.api_routes import api_routes
 from data_managers.omdb_api_data_handler import MovieAPIHandler
 from data_managers.sql_data_manager import SQLiteDataManager
+from data_managers.session_store import create_session_interface
+from data_managers.page_cache import get_default_page_cache, page_etag, conditional_page_response
+from data_managers.title_index import get_default_title_index
+from data_managers.library_archive import write_archive, read_archive
+from data_managers.backend_migrator import migrate_json_to_sqlite, migrate_sqlite_to_json
+from markupsafe import Markup
 
 # Initialize the Flask application
 app = Flask(__name__)
@@ -19,17 +29,54 @@ app.register_blueprint(api_routes)
 # Set the secret key for session management, with a fallback value
 app.secret_key = os.environ.get('SECRET_KEY', 'KAPUT BARTUXA')
 
+# optional server side sessions, cookie keeps only the session id
+if config.SESSION_STORE:
+    app.session_interface = create_session_interface()
+
 app.data_manager = SQLiteDataManager(config.SQL_DB_FILE_NAME, app)
 logger = setup_logger()
+page_cache = get_default_page_cache()
+title_index = get_default_title_index()
+_is_data_prepared = False
+_prepare_data_lock = threading.Lock()
+
+@app.before_request
+def prepare_data():
+    """
+    Upgrades the db schema and builds the movie titles index (suggestions are served
+    from memory) before the first request of the process, importing the app doesnt touch the db
+    """
+    global _is_data_prepared
+    if _is_data_prepared:
+        return
+    with _prepare_data_lock:
+        if not _is_data_prepared:
+            app.data_manager.upgrade_db()
+            title_index.update(app.data_manager)
+            _is_data_prepared = True
 
 @app.route('/')
 def list_users():
     """Main page endpoint, return rendered page with users"""
     try:
-        users = current_app.data_manager.get_all_public_users()
-        session_user = session['username'] if 'username' in session else None
-        return render_template('users.html', users=users,
-                               session_user=session_user)
+        after = request.args.get('after')
+        data_version = current_app.data_manager.get_data_version()
+        session_user = get_session_user()
+        etag = page_etag('users', after, data_version, session_user)
+
+        def render_users_list():
+            users = current_app.data_manager.get_all_public_users(
+                limit=config.WEB_PAGE_SIZE, after=after)
+            # id of the last user is the cursor of the next page, if the page is full
+            next_after = users[-1]['id'] if len(users) == config.WEB_PAGE_SIZE else None
+            return Markup(render_template('fragments/users_list.html', users=users,
+                                          next_after=next_after))
+
+        # list of users is rendered again only after the data changed
+        return conditional_page_response(etag, lambda: render_template(
+            'users.html', session_user=session_user,
+            users_fragment=page_cache.get_or_render(('users', after, data_version),
+                                                    render_users_list)))
     except Exception:
         logger.exception("Exception occurred")
         abort(404)
@@ -40,11 +87,79 @@ def api_explain():
 
 @app.route('/restore_data')
 def restore_default_db():
-    app.data_manager.restore_db_to_default()
-    message_for_user = 'Database RESTORED!'
+    restore_result = app.data_manager.restore_db_to_default()
+    user_profile_cache.clear()
+    page_cache.clear()
+    title_index.clear()
+    logger.info(f"Database restored: {restore_result}")
+    message_for_user = f"Database RESTORED in {restore_result['duration_ms']} ms!"
     flash(message_for_user)
     return redirect(url_for('list_users'))
 
+@app.cli.command('upgrade-db')
+def upgrade_db():
+    """Upgrades schema of the db file, the app also does it before its first request"""
+    with app.app_context():
+        migrations_count = app.data_manager.upgrade_db()
+    print(f"Executed {migrations_count} db migrations")
+
+@app.cli.command('repair-movie-counters')
+def repair_movie_counters():
+    """Recomputes owners and reviews counters of all movies"""
+    with app.app_context():
+        repaired_count = app.data_manager.repair_movie_counters()
+    print(f"Repaired counters of {repaired_count} movies")
+
+@app.cli.command('refresh-read-replica')
+def refresh_read_replica():
+    """Copies the db to the read replica file (config.READ_REPLICA_DB_FILE_NAME)"""
+    with app.app_context():
+        data_version = app.data_manager.refresh_read_replica()
+    print(f"Read replica refreshed to data version {data_version}")
+
+@app.cli.command('delete-users')
+@click.argument('user_ids', nargs=-1, type=int, required=True)
+def delete_users(user_ids):
+    """Deletes users with their libraries and reviews, movies nobody else got are deleted too"""
+    deleted_ids = []
+    with app.app_context():
+        for start in range(0, len(user_ids), config.BULK_DELETE_MAX_USERS):
+            deleted_ids += app.data_manager.delete_users(
+                list(user_ids[start:start + config.BULK_DELETE_MAX_USERS]))
+    print(f"Deleted {len(deleted_ids)} users, not found: {sorted(set(user_ids) - set(deleted_ids))}")
+
+@app.cli.command('export-library')
+@click.argument('archive_path')
+def export_library(archive_path):
+    """Writes the whole library to a library archive file"""
+    started = time.perf_counter()
+    with app.app_context(), open(archive_path, 'wb') as archive_file, \
+            app.data_manager.export_library() as (header, batches):
+        archive_size = write_archive(archive_file, header, batches)
+    print(f"Exported library ({archive_size} bytes) in {time.perf_counter() - started:.2f} s")
+
+@app.cli.command('import-library')
+@click.argument('archive_path')
+def import_library(archive_path):
+    """Replaces the whole library with the library archive file"""
+    started = time.perf_counter()
+    with app.app_context(), open(archive_path, 'rb') as archive_file:
+        header, batches = read_archive(archive_file)
+        counts = app.data_manager.import_library(header, batches)
+    print(f"Imported {counts} in {time.perf_counter() - started:.2f} s")
+
+@app.cli.command('migrate-backend')
+@click.argument('direction', type=click.Choice(['json-to-sqlite', 'sqlite-to-json']))
+@click.argument('source_path')
+@click.argument('target_path')
+@click.option('--chunk-size', type=int, default=None, help='Users copied in one transaction')
+def migrate_backend(direction, source_path, target_path, chunk_size):
+    """Copies the library between JSON file and sqlite db, continues a stopped migration"""
+    started = time.perf_counter()
+    migrate = migrate_json_to_sqlite if direction == 'json-to-sqlite' else migrate_sqlite_to_json
+    counts = migrate(source_path, target_path, chunk_size=chunk_size)
+    print(f"Migrated {counts} in {time.perf_counter() - started:.2f} s")
+
 @app.errorhandler(404)
 def page_not_found(e):
     """Renders a custom '404.html' template whenever a 404 error
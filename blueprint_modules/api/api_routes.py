@@ -1,8 +1,97 @@
-from flask import Blueprint, request, current_app, jsonify
-from data_managers.omdb_api_data_handler import MovieAPIHandler
+from flask import Blueprint, request, current_app, jsonify, url_for, Response, \
+    stream_with_context
+from itertools import islice
+import json
+import config
+from data_managers.omdb_api_data_handler import get_default_cache
+from data_managers.password_hasher import get_default_hasher
+from data_managers.user_profile_cache import get_default_profile_cache
+from data_managers.page_cache import get_default_page_cache, page_etag
+from data_managers.title_index import get_default_title_index
+from data_managers.movie_lookup import get_movies_local_first
 
 api_routes = Blueprint('api_routes', __name__)
-movies_api_handler = MovieAPIHandler()
+
+
+def get_page_args():
+    """
+    Reads keyset pagination query parameters: 'limit' (page size, DEFAULT_PAGE_SIZE
+    if not passed) and 'after' (id of the last item of the previous page).
+    Raises ValueError for invalid limit.
+    """
+    limit = request.args.get('limit', config.DEFAULT_PAGE_SIZE)
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError(f"limit must be a number, got: {limit}")
+    if not 1 <= limit <= config.MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {config.MAX_PAGE_SIZE}")
+    return limit, request.args.get('after')
+
+
+def paged_response(items: list, limit: int):
+    """
+    Returns JSON array response of the page. When the page is full, 'Link' header
+    points to the next page: <url?limit=..&after=..>; rel="next"
+    """
+    response = jsonify(items)
+    if len(items) == limit:
+        next_page_url = url_for(request.endpoint, **request.view_args, limit=limit,
+                                after=items[-1]['id'])
+        response.headers['Link'] = f'<{next_page_url}>; rel="next"'
+    return response
+
+
+def conditional_response(revision, build_response):
+    """
+    Returns 304 response without building the body if the client already got
+    the resource in this revision (If-None-Match header), otherwise response
+    of build_response(). ETag is made from the revision and the request url,
+    so every page and format of a list has its own ETag.
+    """
+    etag = page_etag(request.path, sorted(request.args.items(multi=True)), revision)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = build_response()
+    response.set_etag(etag)
+    return response
+
+
+STREAM_FORMATS = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+
+def get_stream_format():
+    """
+    Reads 'stream' query parameter: 'json' for streamed JSON array, 'ndjson' for
+    one JSON object per line, None if the response should not be streamed.
+    """
+    stream_format = request.args.get('stream')
+    if stream_format is not None and stream_format not in STREAM_FORMATS:
+        raise ValueError(f"stream must be one of: {', '.join(STREAM_FORMATS)}")
+    return stream_format
+
+
+def streamed_response(items, stream_format: str):
+    """
+    Returns response that sends items while iterating them, STREAM_BATCH_SIZE
+    items per chunk, so the whole collection is never held in memory.
+    """
+    def generate_json_array():
+        yield '['
+        separator = ''
+        while batch := list(islice(items, config.STREAM_BATCH_SIZE)):
+            yield separator + ','.join(json.dumps(item) for item in batch)
+            separator = ','
+        yield ']'
+
+    def generate_ndjson():
+        while batch := list(islice(items, config.STREAM_BATCH_SIZE)):
+            yield ''.join(json.dumps(item) + '\n' for item in batch)
+
+    generator = generate_ndjson() if stream_format == 'ndjson' else generate_json_array()
+    # keeping app context (db session) alive while the response is sent
+    return Response(stream_with_context(generator), mimetype=STREAM_FORMATS[stream_format])
 
 
 @api_routes.route('/api/users', methods=['POST', 'GET'])
@@ -11,7 +100,9 @@ def manage_users():
     Endpoint to retrieve all users or add a new user.
 
     GET:
-        Returns a JSON array of all users.
+        Returns a JSON array of users, one page at a time ('limit' and 'after'
+        query parameters, 'Link' header points to the next page).
+        With 'stream' query parameter ('json' or 'ndjson') all users are streamed.
 
     POST:
         Expects a JSON payload with the following structure:
@@ -24,8 +115,19 @@ def manage_users():
     """
     try:
         if request.method == "GET":
-            users = current_app.data_manager.get_all_users()
-            return jsonify(users), 200
+            stream_format = get_stream_format()
+            limit, after = get_page_args()
+
+            def build_users_response():
+                if stream_format:
+                    return streamed_response(current_app.data_manager.iter_all_users(),
+                                             stream_format)
+                users = current_app.data_manager.get_all_users(limit=limit, after=after)
+                return paged_response(users, limit)
+
+            # users list changes with any change of the data
+            return conditional_response(current_app.data_manager.get_data_version(),
+                                        build_users_response)
 
         if request.method == "POST":
             # Check if JSON data is passed
@@ -52,6 +154,7 @@ def delete_user_by_id(user_id):
     try:
         user_id = int(user_id)
         current_app.data_manager.delete_user(user_id)
+        get_default_profile_cache().invalidate(user_id)
         return jsonify({'message': f'User with ID {user_id} successfully deleted.'}), 200
 
 
@@ -71,6 +174,8 @@ def get_user_movies(user_id):
 
     Accepts a GET request and takes a user_id as a URL parameter.
     Returns a JSON list of movies associated with the user if found, or an error message if something goes wrong.
+    The list is paged with 'limit' and 'after' (movie id) query parameters, with
+    'stream' query parameter ('json' or 'ndjson') all movies are streamed.
 
     Args:
         user_id(int): The unique identifier of the user for whom to retrieve movies.
@@ -81,8 +186,20 @@ def get_user_movies(user_id):
                corresponding error status code if unsuccessful.
     """
     try:
-        movies = current_app.data_manager.get_user_movies(user_id)
-        return jsonify(movies), 200
+        stream_format = get_stream_format()
+        limit, after = get_page_args()
+
+        def build_movies_response():
+            if stream_format:
+                return streamed_response(current_app.data_manager.iter_user_movies(user_id),
+                                         stream_format)
+            movies = current_app.data_manager.get_user_movies(user_id, limit=limit, after=after)
+            return paged_response(movies, limit)
+
+        revision = current_app.data_manager.get_user_revision(user_id)
+        if revision is None:
+            return build_movies_response()  # reports the missing user
+        return conditional_response(revision, build_movies_response)
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
     except Exception as e:
@@ -115,8 +232,8 @@ def add_movie_to_user(user_id):
         if movie_title is None:
             return jsonify({'error': 'Movie title is required'}), 400
 
-        # search for movie by provided title and validate the data
-        movie_data = movies_api_handler.get_movie_by_title(movie_title)
+        # search for movie by provided title in local catalog, then in OMDb
+        movie_data = get_movies_local_first(current_app.data_manager, [movie_title])[0]
         if movie_data is None:
             return jsonify({'message': f'Movie with name:{movie_title}, not found.'}), 404
 
@@ -132,6 +249,67 @@ def add_movie_to_user(user_id):
         return jsonify({'error': str(e)}), 500
 
 
+@api_routes.route('/api/users/<user_id>/movies/bulk', methods=['POST'])
+def add_movies_to_user(user_id):
+    """
+    API Endpoint to add many movies by their titles or imdbIDs.
+
+    Accepts a POST request with JSON data in the format:
+    {"titles": ["movie_name", "tt0120338", ...]}.
+    Titles are resolved through OMDb concurrently and all found movies are
+    added to the user in a single transaction.
+
+    Returns:
+        dict: A JSON response with result for every passed title, in the same order:
+        {"results": [{"title": ..., "status": "added"|"already_in_library"|"not_found",
+                      "movie": {...}}, ...]}
+    """
+    try:
+        user_id = int(user_id)
+
+        # Check if JSON data is passed
+        request_data = request.get_json()
+        if request_data is None:
+            return jsonify({'error': 'JSON payload is required'}), 400
+
+        # Check if titles list is present in the JSON data
+        movie_titles = request_data.get('titles')
+        if not isinstance(movie_titles, list) or not movie_titles:
+            return jsonify({'error': 'Non empty list of movie titles is required'}), 400
+        if not all(isinstance(title, str) and title.strip() for title in movie_titles):
+            return jsonify({'error': 'Every movie title must be a non empty string'}), 400
+        if len(movie_titles) > config.BULK_IMPORT_MAX_ITEMS:
+            return jsonify(
+                {'error': f'Up to {config.BULK_IMPORT_MAX_ITEMS} titles can be added at once'}), 400
+
+        # movies missing in local catalog are searched in OMDb concurrently,
+        # found ones are added to db in one transaction
+        found_movies = get_movies_local_first(current_app.data_manager, movie_titles)
+        added_movie_ids = current_app.data_manager.add_movies_to_user(
+            user_id, [movie for movie in found_movies if movie is not None])
+
+        results = []
+        for title, movie in zip(movie_titles, found_movies):
+            if movie is None:
+                results.append({'title': title, 'status': 'not_found'})
+                continue
+            if movie['id'] in added_movie_ids:
+                status = 'added'
+                added_movie_ids.discard(movie['id'])  # same movie passed twice is added once
+            else:
+                status = 'already_in_library'
+            results.append({'title': title, 'status': status, 'movie': movie})
+
+        return jsonify({'results': results}), 201
+
+    except TypeError as e:
+        return jsonify({'error': str(e)}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @api_routes.route('/api/users/<user_id>/movies/<movie_id>', methods=['DELETE'])
 def delete_movie_of_user(user_id, movie_id):
     """
@@ -201,18 +379,108 @@ def review_manager(user_id, movie_id):
 
 
 
+@api_routes.route('/api/movies/search')
+def search_movies():
+    """
+    Searches the local movies catalog by name, director and year.
+    'q' query parameter is the search text, every word of it matches beginnings of
+    words ('pol' finds 'Polanski'). Best matches are returned first, up to 'limit'.
+    """
+    try:
+        limit, _ = get_page_args()
+        search_text = request.args.get('q', '').strip()
+        if not search_text:
+            return jsonify({'error': 'q query parameter is required'}), 400
+        return jsonify(current_app.data_manager.search_movies(search_text, limit)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_routes.route('/api/movies/suggest')
+def suggest_movies():
+    """
+    Returns movies of the local catalog which title has a word starting with the
+    'q' query parameter, for typeahead of movie titles. Served from the in-memory
+    title index, up to 'limit' (TITLE_SUGGESTIONS_LIMIT if not passed) movies.
+    """
+    try:
+        limit = config.TITLE_SUGGESTIONS_LIMIT
+        if 'limit' in request.args:
+            limit, _ = get_page_args()
+        title_index = get_default_title_index()
+        title_index.update(current_app.data_manager)
+        return jsonify(title_index.suggest(request.args.get('q', ''), limit)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_routes.route('/api/movies/most_collected')
+def get_most_collected_movies():
+    """
+    Returns movies owned by the most users first, with 'owners_count' and
+    'reviews_count' of every movie. 'limit' query parameter sets number of movies.
+    """
+    try:
+        limit, _ = get_page_args()
+        return conditional_response(
+            current_app.data_manager.get_data_version(),
+            lambda: jsonify(current_app.data_manager.get_most_collected_movies(limit)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @api_routes.route('/api/movies/<movie_id>/reviews')
 def get_all_review_for_movie(movie_id):
     """
     Retrieves all reviews for a given movie by its ID.
+    The list is paged with 'limit' and 'after' (review id) query parameters, with
+    'stream' query parameter ('json' or 'ndjson') all reviews are streamed.
 
     :param movie_id: The ID of the movie.
     :return: A JSON response containing the reviews or an error message.
     """
     try:
-        reviews = current_app.data_manager.get_all_reviews_for_movie(movie_id)
-        return jsonify(reviews), 200
+        stream_format = get_stream_format()
+        limit, after = get_page_args()
+
+        def build_reviews_response():
+            if stream_format:
+                return streamed_response(
+                    current_app.data_manager.iter_reviews_for_movie(movie_id), stream_format)
+            reviews = current_app.data_manager.get_all_reviews_for_movie(movie_id, limit=limit,
+                                                                         after=after)
+            return paged_response(reviews, limit)
+
+        revision = current_app.data_manager.get_movie_revision(movie_id)
+        if revision is None:
+            return build_reviews_response()  # reports the missing movie
+        return conditional_response(revision, build_reviews_response)
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+@api_routes.route('/api/stats')
+def get_stats():
+    """
+    Returns runtime metrics of the process: OMDb response cache and rendered
+    pages cache counters, title index size, password hashing pool queue depth
+    and latency. Only requests from config.STATS_ALLOWED_ADDRESSES (local) are
+    answered, others get 403. Reading the stats doesn't start the hashing pool.
+    """
+    if request.remote_addr not in config.STATS_ALLOWED_ADDRESSES:
+        return jsonify({'error': 'Stats are available only from the server itself'}), 403
+    try:
+        return jsonify({'omdb_cache': get_default_cache().stats(),
+                        'page_cache': get_default_page_cache().stats(),
+                        'title_index': get_default_title_index().stats(),
+                        'password_hasher': get_default_hasher().stats()}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,11 +1,15 @@
-from flask import Blueprint, session, request, abort, redirect, url_for, render_template, \
+from flask import Blueprint, request, abort, redirect, url_for, render_template, \
     current_app, flash
-from data_managers.omdb_api_data_handler import MovieAPIHandler
+import config
+from data_managers.movie_lookup import get_movies_local_first
+from blueprint_modules.user.user_routes import get_session_user
+from data_managers.page_cache import get_default_page_cache, page_etag, conditional_page_response
+from markupsafe import Markup
 from logging_config.setup_logger import setup_logger
 
 movie_routes = Blueprint('movie_routes', __name__)
-movies_api_handler = MovieAPIHandler()
 logger = setup_logger()
+page_cache = get_default_page_cache()
 
 
 @movie_routes.route('/user_movies')
@@ -14,13 +18,35 @@ def user_movies():
     try:
         # render page of user movies if found user by id
         user_id = int(request.args.get('user_id'))
-        user_data = current_app.data_manager.get_user_by_id(user_id)
-        session_user = session['username'] if session else None
-        if user_data:
-            return render_template('user_movies.html', user=user_data,
-                                   session_user=session_user)
-
-        # if user id not found redirect to main page
+        after = request.args.get('after')
+        # revision of the user changes only with changes of the user's movies
+        revision = current_app.data_manager.get_user_revision(user_id)
+        if revision is None:
+            # if user id not found redirect to main page
+            return redirect(url_for("list_users"))
+
+        def render_movies_list():
+            user_data = current_app.data_manager.get_user_by_id(
+                user_id, movies_limit=config.WEB_PAGE_SIZE, movies_after=after)
+            if user_data:
+                # id of the last movie is the cursor of the next page, if the page is full
+                movies = user_data['movies']
+                next_after = movies[-1]['id'] if len(movies) == config.WEB_PAGE_SIZE else None
+                return user_data['name'], Markup(render_template(
+                    'fragments/user_movies_list.html', user=user_data, next_after=next_after))
+
+        # movies list is rendered again only after the user's movies changed
+        cached_page = page_cache.get_or_render(('user_movies', user_id, after, revision),
+                                               render_movies_list)
+        session_user = get_session_user()
+        if cached_page:
+            user_name, movies_fragment = cached_page
+            etag = page_etag('user_movies', user_id, after, revision, session_user)
+            return conditional_page_response(etag, lambda: render_template(
+                'user_movies.html', user={'id': user_id, 'name': user_name},
+                session_user=session_user, movies_fragment=movies_fragment))
+
+        # user was deleted after the revision was read
         return redirect(url_for("list_users"))
 
     except Exception:
@@ -37,8 +63,8 @@ def add_movie():
         movie_name_to_search: str = request.form.get('search_name')
         user_id = int(request.form.get('user_id'))
         if movie_name_to_search:
-            movie_to_add = movies_api_handler.get_movie_by_title(
-                movie_name_to_search)
+            movie_to_add = get_movies_local_first(current_app.data_manager,
+                                                  [movie_name_to_search])[0]
             if movie_to_add:
                 current_app.data_manager.add_movie_to_user(user_id, movie_to_add)
 
@@ -48,6 +74,21 @@ def add_movie():
         abort(404)
 
 
+@movie_routes.route('/movies/search')
+def search_movies():
+    """Render page with movies of the local catalog matching 'q' query parameter,
+    'user_id' query parameter is the user the found movies can be added to"""
+    try:
+        search_text = request.args.get('q', '')
+        user_id = int(request.args.get('user_id'))
+        movies = current_app.data_manager.search_movies(search_text)
+        return render_template('movie_search.html', movies=movies, search_text=search_text,
+                               user_id=user_id)
+    except Exception:
+        logger.exception("Exception occurred")
+        abort(404)
+
+
 @movie_routes.route('/users/<int:user_id>/edit_movie/<movie_id>',
                     methods=['GET', 'POST'])
 def update_movie(user_id, movie_id):
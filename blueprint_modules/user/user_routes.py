@@ -1,11 +1,35 @@
+import math
 from flask import Blueprint, session, request, abort, redirect, url_for, \
     render_template, flash, current_app
-from data_managers.omdb_api_data_handler import MovieAPIHandler
+from data_managers.async_omdb_api_data_handler import get_default_handler
+from data_managers.password_hasher import PasswordHasherBusyError
+from data_managers.login_rate_limiter import get_default_limiter
+from data_managers.user_profile_cache import get_default_profile_cache
 from logging_config.setup_logger import setup_logger
 
 user_routes = Blueprint('user_routes', __name__)
-movies_api_handler = MovieAPIHandler()
+movies_api_handler = get_default_handler()
 logger = setup_logger()
+login_rate_limiter = get_default_limiter()
+user_profile_cache = get_default_profile_cache()
+
+
+def get_session_user():
+    """
+    Returns profile ({'id', 'name', 'avatar'}) of the logged in user or None.
+    Session keeps only the user id, profile is resolved through the profile cache.
+    """
+    if 'username' in session:
+        # session of older versions kept whole user data, keeping only its id
+        session['user_id'] = session.pop('username')['id']
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+
+    profile = user_profile_cache.get(user_id, current_app.data_manager.get_user_profile)
+    if profile is None:
+        session.pop('user_id', None)  # user was deleted
+    return profile
 
 
 @user_routes.route('/users', methods=["POST"])
@@ -29,6 +53,11 @@ def add_user():
 
         return redirect(url_for('list_users'))
 
+    # all password hashing workers are busy
+    except PasswordHasherBusyError:
+        flash("Server is busy right now, try again later")
+        return redirect(url_for('user_routes.user_register'))
+
     except Exception:
         logger.exception("Exception occurred")
         abort(404)
@@ -40,6 +69,7 @@ def delete_user(user_id):
     try:
         user_id = int(user_id)
         current_app.data_manager.delete_user(user_id)
+        user_profile_cache.invalidate(user_id)
         return redirect(url_for('list_users'))
     except Exception:
         logger.exception("Exception occurred")
@@ -60,21 +90,36 @@ def user_register():
 def login():
     """
     This Flask route function login handles user login by validating their
-    username and password, and on successful validation, stores the user data
+    username and password, and on successful validation, stores the user id
     in session and redirects to the 'list_users' route.
     """
     try:
         username = request.form['username']
         password = request.form['password']
+        # over the limit attempts are rejected before the password is hashed
+        retry_after = login_rate_limiter.check(username, request.remote_addr)
+        if retry_after:
+            flash(f"Too many login attempts, try again in {math.ceil(retry_after)} seconds")
+            return redirect(url_for('list_users'))
+
         if current_app.data_manager.is_password_valid(username, password):
-            user_data: dict = current_app.data_manager.get_user_by_name(username)
-            session['username'] = user_data
+            login_rate_limiter.record_success(username)
+            user_id = current_app.data_manager.get_user_id_by_name(username)
+            # only id goes to the signed cookie, profile is looked up by it on every page,
+            # server side session is moved to a new session id when the user id changes
+            session['user_id'] = user_id
             flash(f"Welcome {username}")
         else:
+            login_rate_limiter.record_failure(username, request.remote_addr)
             flash("Wrong password or username or both, try again")
 
         return redirect(url_for('list_users'))
 
+    # all password hashing workers are busy
+    except PasswordHasherBusyError:
+        flash("Too many login attempts right now, try again later")
+        return redirect(url_for('list_users'))
+
     except Exception:
         logger.exception("Exception occurred")
         abort(404)
@@ -83,11 +128,12 @@ def login():
 @user_routes.route('/logout')
 def logout():
     """
-    This Flask route function logout removes user data from the session,
+    This Flask route function logout removes user id from the session,
     effectively logging out the user, and then redirects to the 'list_users' route.
     """
     try:
-        # remove the username from the session if it's there
+        # remove the user id from the session if it's there
+        session.pop('user_id', None)
         session.pop('username', None)
         return redirect(url_for('list_users'))
 
@@ -1,4 +1,5 @@
 from data_managers.json_data_manager import JSONDataManager
+from data_managers.indexed_json_data_manager import IndexedJSONDataManager
 from data_managers.sql_data_manager import SQLiteDataManager
 import os
 
@@ -12,7 +13,12 @@ def get_absolute_db_uri(db_name):
     return 'sqlite:///' + db_path
 
 def get_json_data_manager():
-    return JSONDataManager(JSON_DB_DEFAULT_NAME)
+    """Returns json data manager for JSON_STORAGE_MODE ('file' or 'indexed')"""
+    if JSON_STORAGE_MODE == 'file':
+        return JSONDataManager(JSON_DB_DEFAULT_NAME)
+    if JSON_STORAGE_MODE == 'indexed':
+        return IndexedJSONDataManager(JSON_DB_DEFAULT_NAME)
+    raise ValueError(f"Unknown json storage mode: {JSON_STORAGE_MODE}")
 
 def get_absolute_path_to_project_folder_folders(folder_name: str):
     project_folder_path = os.path.abspath(os.path.dirname(__file__))
@@ -26,4 +32,104 @@ def get_absolute_path_current_db():
 
 def get_absolute_path_default_db():
     abs_path_data = get_absolute_path_to_project_folder_folders('data')
-    return os.path.join(abs_path_data, SQL_DB_DEFAULT_NAME)
\ No newline at end of file
+    return os.path.join(abs_path_data, SQL_DB_DEFAULT_NAME)
+
+# sqlite connection profile, pragmas are applied in this order on every new connection
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,  # ms a connection waits for a lock before 'database is locked'
+    'journal_mode': 'WAL',  # readers don't wait for the writer and the writer for readers
+    'synchronous': 'NORMAL',  # in WAL mode fsync on checkpoints only, not on every commit
+    'cache_size': -32768,  # page cache of every connection, negative value is in KiB
+    'mmap_size': 256 * 1024 * 1024,  # db file pages are read through memory map
+    'foreign_keys': 'ON',
+}
+SQLITE_POOL_SIZE = 8  # connections kept open by every worker process
+SQLITE_MAX_OVERFLOW = 8  # extra connections opened under load, closed when returned
+SQLITE_POOL_TIMEOUT_SECONDS = 10  # waiting for a free connection before error
+
+# read replica settings. Reads of listing methods go to the replica file, a snapshot of
+# the db refreshed with 'flask refresh-read-replica' (e.g. from cron). Clients read the
+# primary after their own changes until the replica got them
+READ_REPLICA_DB_FILE_NAME = None  # e.g. 'movies_replica.sqlite', None reads from the db
+
+# OMDb response cache settings
+OMDB_CACHE_FILE_NAME = 'omdb_cache.sqlite'
+OMDB_CACHE_TTL_SECONDS = 7 * 24 * 3600  # movie data rarely changes
+OMDB_CACHE_NEGATIVE_TTL_SECONDS = 3600  # "not found" titles are retried after an hour
+OMDB_CACHE_LRU_MAX_SIZE = 512
+OMDB_CACHE_DISK_MAX_SIZE = 50000
+OMDB_CACHE_DISK_EVICT_EVERY = 100  # disk writes between evictions, size may exceed max by that much
+
+
+def get_absolute_path_omdb_cache():
+    abs_path_data = get_absolute_path_to_project_folder_folders('data')
+    return os.path.join(abs_path_data, OMDB_CACHE_FILE_NAME)
+
+# OMDb http client settings
+OMDB_API_URL = 'https://www.omdbapi.com/'
+OMDB_POOL_SIZE = 10
+OMDB_CONNECT_TIMEOUT_SECONDS = 3.05
+OMDB_READ_TIMEOUT_SECONDS = 5
+OMDB_MAX_RETRIES = 2
+OMDB_RETRY_BACKOFF_FACTOR = 0.3
+OMDB_CIRCUIT_FAILURE_THRESHOLD = 5  # failed calls in a row before OMDb is skipped
+OMDB_CIRCUIT_RESET_TIMEOUT_SECONDS = 30
+OMDB_MAX_CONCURRENT_REQUESTS = 8  # upper bound of simultaneous calls to OMDb per process
+BULK_IMPORT_MAX_ITEMS = 500  # max titles/imdbIDs in one bulk import request
+BULK_DELETE_MAX_USERS = 1000  # users deleted in one transaction by the delete-users command
+
+# pagination of users, movies and reviews lists
+DEFAULT_PAGE_SIZE = 100  # used by api when 'limit' parameter is not passed
+MAX_PAGE_SIZE = 1000
+WEB_PAGE_SIZE = 60  # users/movies shown on one rendered page
+STREAM_BATCH_SIZE = 500  # rows fetched from db and sent to client at once by streamed api responses
+LIBRARY_ARCHIVE_BATCH_SIZE = 5000  # rows in one frame of library archive and one insert of import
+MIGRATION_CHUNK_SIZE = 1000  # users copied in one transaction and checkpoint by backend migrator
+JSON_STORAGE_MODE = 'file'  # 'file' rewrites json db file on every change, 'indexed' logs changes
+JSON_WAL_COMPACT_EVERY = 1000  # logged mutations after which indexed json db file is rewritten
+
+# password hashing settings
+BCRYPT_ROUNDS = 12  # changing it rehashes passwords of users on their next login
+PASSWORD_HASHER_WORKERS = os.cpu_count()
+PASSWORD_HASHER_MAX_QUEUE = 64  # password operations running or waiting for a worker
+PASSWORD_HASHER_USE_PROCESSES = True
+
+# login rate limiting settings
+LOGIN_RATE_LIMIT_DB_FILE_NAME = None  # sqlite file shared by workers, None keeps limits in memory
+LOGIN_USER_BUCKET_CAPACITY = 5  # login attempts per user name in a burst
+LOGIN_USER_BUCKET_REFILL_SECONDS = 12.0  # one more attempt per user name every 12 seconds
+LOGIN_IP_BUCKET_CAPACITY = 20
+LOGIN_IP_BUCKET_REFILL_SECONDS = 3.0
+LOGIN_BACKOFF_AFTER_FAILURES = 3  # failed logins in a row before blocking starts
+LOGIN_BACKOFF_BASE_SECONDS = 1.0  # doubled with every next failure
+LOGIN_BACKOFF_MAX_SECONDS = 900.0
+
+
+def get_absolute_path_login_rate_limit_db():
+    abs_path_data = get_absolute_path_to_project_folder_folders('data')
+    return os.path.join(abs_path_data, LOGIN_RATE_LIMIT_DB_FILE_NAME)
+
+# logged in user profile cache settings
+USER_PROFILE_CACHE_MAX_SIZE = 1024
+USER_PROFILE_CACHE_TTL_SECONDS = 60  # changes made by other workers are seen after this time
+
+# server side sessions settings
+SESSION_STORE = None  # 'sqlite', 'memory' (single worker) or None for signed cookie sessions
+SESSION_DB_FILE_NAME = 'sessions.sqlite'
+SESSION_TTL_SECONDS = 7 * 24 * 3600  # session expires after a week without requests
+SESSION_SWEEP_INTERVAL_SECONDS = 60  # expired sessions deletion and last seen times writes
+SESSION_LAST_SEEN_BATCH_SIZE = 100
+
+
+def get_absolute_path_session_db():
+    abs_path_data = get_absolute_path_to_project_folder_folders('data')
+    return os.path.join(abs_path_data, SESSION_DB_FILE_NAME)
+
+# runtime metrics of the serving process, /api/stats answers only requests from these addresses
+STATS_ALLOWED_ADDRESSES = ('127.0.0.1', '::1')
+
+# rendered pages cache settings
+PAGE_CACHE_MAX_SIZE = 256  # rendered users and user movies lists kept in memory
+
+# movie title suggestions settings
+TITLE_SUGGESTIONS_LIMIT = 10  # used by /api/movies/suggest when 'limit' parameter is not passed
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+from .omdb_api_data_handler import MovieAPIHandler
+from .omdb_cache import OmdbResponseCache
+
+_default_handler = None
+_default_handler_lock = threading.Lock()
+
+
+def get_default_handler():
+    """
+    Returns SyncMovieAPIHandler shared by all blueprints of the process,
+    so identical lookups from different routes are coalesced together.
+    """
+    global _default_handler
+    with _default_handler_lock:
+        if _default_handler is None:
+            _default_handler = SyncMovieAPIHandler()
+    return _default_handler
+
+
+class AsyncMovieAPIHandler():
+    """
+    Asyncio variant of MovieAPIHandler.
+
+    Identical lookups that are in flight at the same time share a single
+    upstream request ("singleflight"), and the number of simultaneous
+    upstream requests is capped by a semaphore. The blocking http call of
+    the wrapped MovieAPIHandler (pooled session, retries, circuit breaker,
+    cache) runs in a thread pool, so the event loop is never blocked.
+    Must be used from one event loop.
+    """
+
+    def __init__(self, handler: MovieAPIHandler = None,
+                 max_concurrent_requests=config.OMDB_MAX_CONCURRENT_REQUESTS):
+        self._handler = handler or MovieAPIHandler()
+        self._semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_requests,
+                                            thread_name_prefix='omdb')
+        self._in_flight = {}  # cache key -> asyncio.Task of the upstream lookup
+        self.upstream_requests = 0
+        self.coalesced_requests = 0
+
+    async def get_movie_by_title(self, title: str) -> dict:
+        """Search for movie by title. Returns dict with data of found movie
+        and None if didn't find movie"""
+        return await self._get_movie(OmdbResponseCache.title_key(title), {'t': title})
+
+    async def get_movie_by_imdb_id(self, imdb_id: str) -> dict:
+        """Search for movie by imdbID. Returns dict with data of found movie
+        and None if didn't find movie"""
+        return await self._get_movie(OmdbResponseCache.imdb_id_key(imdb_id), {'i': imdb_id})
+
+    async def get_movies(self, search_texts: list) -> list:
+        """
+        Resolves many titles/imdbIDs concurrently, at most max_concurrent_requests
+        at a time. Returns list of movie dicts (None for not found) in the same order.
+        """
+        return await asyncio.gather(*(self._search_movie(text) for text in search_texts))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def _search_movie(self, search_text: str) -> dict:
+        if MovieAPIHandler.is_imdb_id(search_text):
+            return await self.get_movie_by_imdb_id(search_text.strip())
+        return await self.get_movie_by_title(search_text)
+
+    async def _get_movie(self, cache_key: str, search_params: dict) -> dict:
+        loop = asyncio.get_running_loop()
+        is_cached, cached_movie = await loop.run_in_executor(
+            self._executor, self._handler.get_cached_movie, cache_key)
+        if is_cached:
+            return cached_movie
+
+        # joining the lookup of the same movie that is already in flight
+        task = self._in_flight.get(cache_key)
+        if task is not None:
+            self.coalesced_requests += 1
+        else:
+            task = asyncio.ensure_future(self._fetch_movie(cache_key, search_params))
+            self._in_flight[cache_key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(cache_key, None))
+        # shield - cancelling one waiting caller must not cancel lookup of the others
+        return await asyncio.shield(task)
+
+    async def _fetch_movie(self, cache_key: str, search_params: dict) -> dict:
+        async with self._semaphore:
+            self.upstream_requests += 1
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, self._handler.fetch_and_cache_movie, cache_key, search_params)
+
+
+class SyncMovieAPIHandler():
+    """
+    Blocking facade over AsyncMovieAPIHandler with the same methods as
+    MovieAPIHandler. Owns an event loop running in a daemon thread, Flask
+    worker threads submit lookups to it and wait for the result.
+    """
+
+    def __init__(self, handler: MovieAPIHandler = None,
+                 max_concurrent_requests=config.OMDB_MAX_CONCURRENT_REQUESTS):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='omdb-event-loop',
+                                        daemon=True)
+        self._thread.start()
+        self._async_handler = self._run(
+            self._create_async_handler(handler, max_concurrent_requests))
+
+    @property
+    def async_handler(self) -> AsyncMovieAPIHandler:
+        return self._async_handler
+
+    def get_movie_by_title(self, title: str) -> dict:
+        """Search for movie by title. Returns dict with data of found movie
+        and None if didn't find movie"""
+        return self._run(self._async_handler.get_movie_by_title(title))
+
+    def get_movie_by_imdb_id(self, imdb_id: str) -> dict:
+        """Search for movie by imdbID. Returns dict with data of found movie
+        and None if didn't find movie"""
+        return self._run(self._async_handler.get_movie_by_imdb_id(imdb_id))
+
+    def get_movies(self, search_texts: list) -> list:
+        """
+        Resolves many titles/imdbIDs concurrently. Returns list of movie
+        dicts (None for not found) in the same order as search_texts.
+        """
+        return self._run(self._async_handler.get_movies(search_texts))
+
+    def close(self):
+        self._async_handler.close()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def _run(self, coroutine):
+        """Runs coroutine in the event loop thread and waits for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    @staticmethod
+    async def _create_async_handler(handler, max_concurrent_requests):
+        # created inside the loop so the semaphore is bound to it
+        return AsyncMovieAPIHandler(handler, max_concurrent_requests)
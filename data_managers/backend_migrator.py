@@ -0,0 +1,257 @@
+"""
+Streaming migration of the library between the JSON file and the sqlite db.
+
+Source is read chunk_size users at a time and every chunk is written to the
+target in one transaction (sqlite) or appended to a temp file (JSON), so
+memory depends on the chunk, not on the size of the library. After every
+chunk a checkpoint file next to the target records the progress, a migration
+that was stopped continues from it when started again with the same paths.
+
+The sqlite db must be empty when the migration starts, users are never merged
+into existing ones. Movies shared by users of the JSON file are stored once,
+password hashes and avatars are copied as they are. Reviews of the sqlite db
+are kept in the JSON file as 'review' of the user's movie.
+"""
+import json
+import os
+from sqlalchemy import create_engine, event, func, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import config
+from .data_models_for_sql import db, User, Movie, Review, DataVersion, user_movie_association
+from .sql_migrations import upgrade_database, recount_movie_counters
+from .sqlite_profile import apply_pragmas
+
+MOVIE_FIELDS = ('id', 'name', 'director', 'year', 'rating', 'imdb_link', 'image_link')
+
+
+class MigrationCheckpoint():
+    """Progress of a migration kept in '<target>.checkpoint' JSON file"""
+
+    def __init__(self, source_path: str, target_path: str):
+        self._source_path = os.path.abspath(source_path)
+        self.path = target_path + '.checkpoint'
+
+    def load(self) -> dict:
+        """Returns saved progress or None if the migration didn't start yet"""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as file:
+            progress = json.load(file)
+        if progress.pop('source') != self._source_path:
+            raise ValueError(f"Checkpoint {self.path} belongs to migration from other source")
+        return progress
+
+    def save(self, **progress):
+        """Writes progress atomically, so a crash leaves the previous checkpoint"""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(dict(progress, source=self._source_path), file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def iter_json_array(file, read_size=1 << 16):
+    """Yields items of the JSON array in text file one by one, without reading the whole file"""
+    decoder = json.JSONDecoder()
+    file_name = getattr(file, 'name', 'file')
+    buffer, position, is_array_open, is_eof = '', 0, False, False
+    while True:
+        # skipping whitespace, commas between items and the opening bracket
+        while position < len(buffer) and (buffer[position] in ' \t\r\n,' or
+                                          buffer[position] == '[' and not is_array_open):
+            is_array_open = is_array_open or buffer[position] == '['
+            position += 1
+        if position < len(buffer):
+            if not is_array_open:
+                raise ValueError(f"{file_name} doesnt contain a JSON array")
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                pass  # item is not read whole yet
+            else:
+                read_size = 1 << 16
+                yield item
+                continue
+
+        if is_eof:
+            raise ValueError(f"Invalid or incomplete JSON array in {file_name}")
+        chunk = file.read(read_size)
+        is_eof = not chunk
+        buffer, position = buffer[position:] + chunk, 0
+        # item bigger than the buffer, reading more at once avoids decoding it many times
+        read_size *= 2
+
+
+def migrate_json_to_sqlite(json_path: str, sqlite_path: str, chunk_size=None) -> dict:
+    """
+    Copies users and their movies from JSON file to sqlite db (created if missing).
+    Returns number of rows of users, movies and user_movie tables of the db.
+    """
+    chunk_size = chunk_size or config.MIGRATION_CHUNK_SIZE
+    checkpoint = MigrationCheckpoint(json_path, sqlite_path)
+    progress = checkpoint.load()
+    users_done = progress['users_done'] if progress else 0
+
+    engine = _create_sqlite_engine(sqlite_path)
+    try:
+        if progress is None and not _is_empty(engine):
+            raise ValueError(f"{sqlite_path} already has users or movies, "
+                             f"migration is done only to an empty db")
+        with open(json_path, 'r') as json_file:
+            users = iter_json_array(json_file)
+            # users of chunks written before the stop are parsed again, but not written
+            for _ in zip(range(users_done), users):
+                pass
+            # the chunk after the checkpoint is written if the stop came before saving it
+            may_be_written = progress is not None
+            while chunk := [user for _, user in zip(range(chunk_size), users)]:
+                with engine.begin() as connection:
+                    if not (may_be_written and _is_chunk_written(connection, chunk)):
+                        _insert_users_chunk(connection, chunk)
+                may_be_written = False
+                users_done += len(chunk)
+                checkpoint.save(users_done=users_done)
+
+        with engine.begin() as connection:
+            recount_movie_counters(connection)
+            # data version changes, so nothing cached with the old data is used
+            connection.execute(sqlite_insert(DataVersion).values(id=1, version=1)
+                               .on_conflict_do_update(index_elements=[DataVersion.id],
+                                                      set_={'version': DataVersion.version + 1}))
+            counts = {table.name: connection.execute(
+                select(func.count()).select_from(table)).scalar()
+                for table in (User.__table__, Movie.__table__, user_movie_association)}
+    finally:
+        engine.dispose()
+    checkpoint.clear()
+    return counts
+
+
+def migrate_sqlite_to_json(sqlite_path: str, json_path: str, chunk_size=None) -> dict:
+    """
+    Writes users of sqlite db with their movies (and reviews) to JSON file in the
+    format of JSONDataManager. The file is replaced only when all users are written.
+    Returns number of written users and movies.
+    """
+    chunk_size = chunk_size or config.MIGRATION_CHUNK_SIZE
+    checkpoint = MigrationCheckpoint(sqlite_path, json_path)
+    temp_path = json_path + '.migrating'
+    progress = checkpoint.load()
+    if progress is None or not os.path.exists(temp_path):
+        progress = {'last_user_id': 0, 'users': 0, 'movies': 0, 'offset': 0}
+
+    engine = _create_sqlite_engine(sqlite_path)
+    try:
+        with open(temp_path, 'r+b' if progress['offset'] else 'wb') as json_file:
+            # dropping what was written after the last checkpoint
+            json_file.truncate(progress['offset'])
+            json_file.seek(progress['offset'])
+            if not progress['offset']:
+                json_file.write(b'[')
+            while True:
+                with engine.connect() as connection:
+                    users = _select_users_chunk(connection, progress['last_user_id'], chunk_size)
+                if not users:
+                    break
+                for user in users:
+                    separator = b',' if progress['users'] else b''
+                    json_file.write(separator + json.dumps(user).encode())
+                    progress['users'] += 1
+                    progress['movies'] += len(user['movies'])
+                progress['last_user_id'] = users[-1]['id']
+                json_file.flush()
+                os.fsync(json_file.fileno())
+                progress['offset'] = json_file.tell()
+                checkpoint.save(**progress)
+            json_file.write(b']')
+            json_file.flush()
+            os.fsync(json_file.fileno())
+    finally:
+        engine.dispose()
+    os.replace(temp_path, json_path)
+    checkpoint.clear()
+    return {'users': progress['users'], 'movies': progress['movies']}
+
+
+# -------------- inner logic methods--------------------------------
+
+def _create_sqlite_engine(sqlite_path: str):
+    """Engine of sqlite file with the app's pragmas and the current schema"""
+    engine = create_engine('sqlite:///' + os.path.abspath(sqlite_path))
+    event.listen(engine, 'connect', apply_pragmas)
+    # missing tables are created, migrations are safe on them and upgrade older tables
+    db.metadata.create_all(engine)
+    upgrade_database(engine)
+    return engine
+
+
+def _is_empty(engine) -> bool:
+    with engine.connect() as connection:
+        return not any(connection.execute(select(table).limit(1)).first()
+                       for table in (User.__table__, Movie.__table__))
+
+
+def _is_chunk_written(connection, users: list) -> bool:
+    """Checks if all users of the chunk are in the db (chunks are written in one transaction)"""
+    written_count = connection.execute(select(func.count()).select_from(User.__table__).where(
+        tuple_(User.id, User.name).in_([(user['id'], user['name']) for user in users]))).scalar()
+    return written_count == len(users)
+
+
+def _insert_users_chunk(connection, users: list):
+    """
+    Inserts users with movies and reviews. A user whose id or name is taken fails
+    the chunk, movies that already exist (shared with users of earlier chunks) are skipped.
+    """
+    movies_by_id, links, reviews = {}, [], []
+    for user in users:
+        for movie in user.get('movies', []):
+            movies_by_id.setdefault(movie['id'], {field: movie.get(field)
+                                                  for field in MOVIE_FIELDS})
+            links.append({'user_id': user['id'], 'movie_id': movie['id']})
+            if movie.get('review'):
+                reviews.append({'user_id': user['id'], 'movie_id': movie['id'],
+                                'review': movie['review']})
+
+    connection.execute(User.__table__.insert(), [
+        {'id': user['id'], 'name': user['name'], 'password': user.get('password'),
+         'avatar': user.get('avatar')} for user in users])
+    for table, rows in ((Movie.__table__, list(movies_by_id.values())),
+                        (user_movie_association, links), (Review.__table__, reviews)):
+        if rows:
+            connection.execute(sqlite_insert(table).on_conflict_do_nothing(), rows)
+
+
+def _select_users_chunk(connection, after_user_id: int, chunk_size: int) -> list:
+    """Returns users (dicts of JSONDataManager) with id > after_user_id, with their movies"""
+    users = [{'id': user_id, 'name': name, 'movies': [],
+              **({'password': password} if password else {}),
+              **({'avatar': avatar} if avatar else {})}
+             for user_id, name, password, avatar in connection.execute(
+                 select(User.id, User.name, User.password, User.avatar).where(
+                     User.id > after_user_id).order_by(User.id).limit(chunk_size))]
+    if not users:
+        return users
+
+    users_by_id = {user['id']: user for user in users}
+    movie_columns = [Movie.__table__.c[field] for field in MOVIE_FIELDS]
+    rows = connection.execute(
+        select(user_movie_association.c.user_id, *movie_columns, Review.review)
+        .join(Movie, Movie.id == user_movie_association.c.movie_id)
+        .outerjoin(Review, (Review.user_id == user_movie_association.c.user_id) &
+                   (Review.movie_id == user_movie_association.c.movie_id))
+        .where(user_movie_association.c.user_id.in_(users_by_id))
+        .order_by(user_movie_association.c.user_id, user_movie_association.c.movie_id))
+    for user_id, *movie_values, review in rows:
+        movie = dict(zip(MOVIE_FIELDS, movie_values))
+        if review:
+            movie['review'] = review
+        users_by_id[user_id]['movies'].append(movie)
+    return users
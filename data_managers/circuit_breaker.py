@@ -0,0 +1,61 @@
+import threading
+import time
+
+
+class CircuitBreaker():
+    """
+    Simple consecutive-failures circuit breaker.
+
+    closed    - calls are allowed, failures are counted.
+    open      - after failure_threshold failures in a row calls are rejected
+                for reset_timeout seconds without touching the network.
+    half-open - after reset_timeout one trial call is allowed, success closes
+                the circuit, failure opens it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow_request(self) -> bool:
+        """Returns True if the call may go to the upstream service"""
+        with self._lock:
+            state = self._current_state()
+            if state == CircuitBreaker.CLOSED:
+                return True
+            if state == CircuitBreaker.HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_progress = False
+            if self._failures >= self._failure_threshold or self._opened_at is not None:
+                self._opened_at = time.monotonic()
+
+    def _current_state(self) -> str:
+        if self._opened_at is None:
+            return CircuitBreaker.CLOSED
+        if time.monotonic() - self._opened_at >= self._reset_timeout:
+            return CircuitBreaker.HALF_OPEN
+        return CircuitBreaker.OPEN
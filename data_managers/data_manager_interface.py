@@ -28,8 +28,13 @@ from abc import ABC, abstractmethod
 #   }
 # ]
 class DataManagerInterface(ABC):
+    """
+    Listing methods support keyset (cursor) pagination: items are ordered by id,
+    'limit' is the max number of items to return and 'after' is the id of the
+    last item of the previous page (None for the first page).
+    """
     @abstractmethod
-    def get_user_movies(self, user_id):
+    def get_user_movies(self, user_id, limit=None, after=None):
         pass
 
     @abstractmethod
@@ -40,12 +45,32 @@ class DataManagerInterface(ABC):
     def delete_user(self, user_id: int):
         pass
 
+    @abstractmethod
+    def delete_users(self, user_ids: list) -> list:
+        pass
+
     @abstractmethod
     def add_movie_to_user(self,user_id: int, movie_to_add: dict):
         pass
 
     @abstractmethod
-    def get_user_by_id(self, user_id: int) -> dict:
+    def add_movies_to_user(self, user_id: int, movies_to_add: list) -> set:
+        pass
+
+    @abstractmethod
+    def get_user_by_id(self, user_id: int, movies_limit=None, movies_after=None) -> dict:
+        pass
+
+    @abstractmethod
+    def get_user_profile(self, user_id: int) -> dict:
+        pass
+
+    @abstractmethod
+    def get_data_version(self) -> int:
+        pass
+
+    @abstractmethod
+    def get_user_revision(self, user_id) -> int:
         pass
 
     @abstractmethod
@@ -61,9 +86,21 @@ class DataManagerInterface(ABC):
         pass
 
     @abstractmethod
-    def get_all_public_users(self):
+    def get_all_public_users(self, limit=None, after=None):
         pass
 
     @abstractmethod
     def get_user_by_name(self, user_name_to_search: str):
-        pass
\ No newline at end of file
+        pass
+
+    @abstractmethod
+    def get_user_id_by_name(self, user_name: str) -> int:
+        pass
+
+    @abstractmethod
+    def search_movies(self, search_text: str, limit=None) -> list:
+        pass
+
+    @abstractmethod
+    def find_movie(self, search_text: str):
+        pass
@@ -1,19 +1,29 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event, table, column
+from .sql_migrations import SEARCH_INDEX_DDL
+from .read_replica import RoutingSession
 
-db = SQLAlchemy()
+# session class routes statements of read only methods to the read replica
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 # association table for the many-to-many relationship between User and Movie
+# (user_id, movie_id) primary key also serves lookups by user, movie_id has its own index
 user_movie_association = db.Table('user_movie',
-                                  db.Column('user_id', db.Integer, db.ForeignKey('users.id')),
-                                  db.Column('movie_id', db.String, db.ForeignKey('movies.id')))
+                                  db.Column('user_id', db.Integer, db.ForeignKey('users.id'),
+                                            primary_key=True),
+                                  db.Column('movie_id', db.String, db.ForeignKey('movies.id'),
+                                            primary_key=True),
+                                  db.Index('ix_user_movie_movie_id', 'movie_id'))
 
 
 class User(db.Model):
     __tablename__ = 'users'
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
+    name = db.Column(db.String, unique=True, index=True)
     password = db.Column(db.String)
     avatar = db.Column(db.String)
+    # data version of the last change of the user's movies list, for API ETags
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     movies = db.relationship(
         "Movie",
         secondary=user_movie_association,
@@ -23,6 +33,8 @@ class User(db.Model):
 
 class Movie(db.Model):
     __tablename__ = 'movies'
+    # case insensitive lookups of a movie by its exact name
+    __table_args__ = (db.Index('ix_movies_name_nocase', db.text('name COLLATE NOCASE')),)
 
     id = db.Column(db.String, primary_key=True)
     name = db.Column(db.String)
@@ -31,21 +43,43 @@ class Movie(db.Model):
     rating = db.Column(db.String)
     imdb_link = db.Column(db.String)
     image_link = db.Column(db.String)
+    # data version of the last change of the movie data or its reviews, for API ETags
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    # number of users that got the movie and of its reviews, kept by the data manager
+    owners_count = db.Column(db.Integer, nullable=False, default=0, server_default='0',
+                             index=True)
+    reviews_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     users = db.relationship(
         "User",
         secondary=user_movie_association,
         back_populates="movies"
     )
 
+
+# db.create_all() creates the full text index of movies with the movies table
+for search_index_statement in SEARCH_INDEX_DDL:
+    event.listen(Movie.__table__, 'after_create', DDL(search_index_statement))
+# fts5 table is not a model, it is queried through this lightweight table construct
+movies_search_index = table('movies_fts', column('rowid'))
+
+
 class Review(db.Model):
     __tablename__ = 'reviews'
+    # one review per user and movie, the index also serves lookups by user
+    __table_args__ = (db.Index('uq_reviews_user_id_movie_id', 'user_id', 'movie_id', unique=True),)
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    movie_id = db.Column(db.String, db.ForeignKey('movies.id'))
+    movie_id = db.Column(db.String, db.ForeignKey('movies.id'), index=True)
     review = db.Column(db.String)
 
     user = db.relationship('User', backref='reviews')
     movie = db.relationship('Movie', backref='reviews')
 
 
+class DataVersion(db.Model):
+    """Single row (id 1) with counter increased by every change of the data"""
+    __tablename__ = 'data_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,389 @@
+import config
+from .json_data_manager import JSONDataManager, UserNotFoundError, _get_page, _search_movies
+import json
+import os
+import threading
+
+
+class IndexedJSONDataManager(JSONDataManager):
+    """
+    JSONDataManager storage mode for big data files.
+
+    The JSON file is loaded once, on first use, into memory with indexes of
+    users by id and by name, of every user's movies by id and of movies of all
+    users by id and by name, so lookups don't scan all users and movies.
+
+    Mutations are not rewriting the whole file. Each one is appended as a
+    single JSON line to a write-ahead log next to the data file
+    ('<file>.json.wal'). After compact_every logged mutations the data file
+    is rewritten atomically (temp file and rename) and the log is emptied.
+    On load the log is replayed on top of the data file, log records are
+    idempotent so replaying a record that already got into the data file is
+    harmless.
+
+    Data file must be used by one process only.
+    """
+
+    def __init__(self, filename: str, compact_every=None, fsync=False, password_hasher=None):
+        super().__init__(filename, password_hasher)
+        self._compact_every = compact_every or config.JSON_WAL_COMPACT_EVERY
+        self._fsync = fsync
+        self._lock = threading.RLock()
+        self._users = None  # user id -> user dict, None until loaded
+        self._user_ids_by_name = {}
+        self._movies_by_user_id = {}  # user id -> {movie id -> movie dict}
+        # lowercased movie id / casefolded movie name -> {(user id, movie id)} of users' movies
+        self._movie_keys_by_id = {}
+        self._movie_keys_by_name = {}
+        self._logged_mutations = 0
+
+    @property
+    def wal_file_name(self) -> str:
+        return self.file_name + '.wal'
+
+    def get_all_users(self) -> list:
+        """Returns copies of all users data"""
+        with self._lock:
+            return [self._copy_user(user) for user in self._get_users().values()]
+
+    def get_user_movies(self, user_id, limit=None, after=None):
+        """Will return list with movies if user id found. otherwise None"""
+        with self._lock:
+            user = self._get_users().get(user_id)
+            if user:
+                movies = [dict(movie) for movie in user['movies']]
+                if limit is None and after is None:
+                    return movies
+                return _get_page(movies, limit, after)
+
+    def get_all_public_users(self, limit=None, after=None):
+        """Returns a list of all public users. Public users are those who don't have a password."""
+        with self._lock:
+            users = self._get_users()
+            # page is selected before copying, only its users are copied
+            user_ids = sorted(user_id for user_id, user in users.items() if 'password' not in user
+                              and (after is None or user_id > int(after)))
+            if limit is not None:
+                user_ids = user_ids[:limit]
+            return [self._copy_user(users[user_id]) for user_id in user_ids]
+
+    def get_all_registered_users(self):
+        """Returns a list of all registered users. Registered users are those who have a password."""
+        with self._lock:
+            return [self._copy_user(user) for user in self._get_users().values()
+                    if 'password' in user]
+
+    def add_user(self, new_user_name: str, password=None, avatar_filename=None):
+        """
+        Adds a user to the json file db. User name must be a string and not empty.
+        Passwords are hashed and salted before being stored.
+        """
+        self._validate_new_user(new_user_name, password)
+        with self._lock:
+            users = self._get_users()
+            if new_user_name in self._user_ids_by_name:
+                raise ValueError(
+                    f"User name '{new_user_name}' already exists. Please choose a different name.")
+
+            new_user_id = max(users) + 1 if users else 1
+            new_user = self._create_user_dict(new_user_id, new_user_name, password,
+                                              avatar_filename)
+            self._log_and_apply({'op': 'add_user', 'user': new_user})
+
+    def delete_user(self, user_id: int):
+        with self._lock:
+            if user_id in self._get_users():
+                self._log_and_apply({'op': 'delete_user', 'user_id': user_id})
+
+    def delete_users(self, user_ids: list) -> list:
+        """Deletes many users. Returns ids of deleted users"""
+        with self._lock:
+            users = self._get_users()
+            deleted_ids = [user_id for user_id in dict.fromkeys(user_ids) if user_id in users]
+            for user_id in deleted_ids:
+                self._log_and_apply({'op': 'delete_user', 'user_id': user_id})
+            return deleted_ids
+
+    def add_movie_to_user(self, user_id: int, movie_to_add: dict):
+        """
+        Adds a new movie to a user's movie list if it doesn't exist.
+        Raises a UserNotFoundError if the user with passed id does not exist.
+        """
+        with self._lock:
+            if user_id not in self._get_users():
+                raise UserNotFoundError(f"User with ID {user_id} not found")
+            if movie_to_add['id'] not in self._movies_by_user_id[user_id]:
+                self._log_and_apply({'op': 'add_movie', 'user_id': user_id,
+                                     'movie': dict(movie_to_add)})
+
+    def add_movies_to_user(self, user_id: int, movies_to_add: list) -> set:
+        """
+        Adds many movies to a user's movie list. Movies the user already got are skipped.
+        Returns set of movie ids that were newly added to the user's movie list.
+        """
+        with self._lock:
+            if user_id not in self._get_users():
+                raise UserNotFoundError(f"User with ID {user_id} not found")
+            added_movie_ids = set()
+            for movie_to_add in movies_to_add:
+                if movie_to_add['id'] not in self._movies_by_user_id[user_id]:
+                    self._log_and_apply({'op': 'add_movie', 'user_id': user_id,
+                                         'movie': dict(movie_to_add)})
+                    added_movie_ids.add(movie_to_add['id'])
+            return added_movie_ids
+
+    def delete_movie_of_user(self, user_id: int, movie_id: str):
+        """Removes a specific movie from a user's movie list based on provided user_id and movie_id."""
+        with self._lock:
+            if user_id not in self._get_users():
+                raise ValueError(f"User with id {user_id} does not exist")
+            if movie_id not in self._movies_by_user_id[user_id]:
+                raise ValueError(
+                    f"Movie with id {movie_id} does not exist for user {user_id}")
+            self._log_and_apply({'op': 'delete_movie', 'user_id': user_id, 'movie_id': movie_id})
+
+    def get_user_movie(self, user_id: int, movie_id: str):
+        """Get the user's specific movie by its ID. return None if user or movies
+        with that id doesn't exist"""
+        with self._lock:
+            self._get_users()
+            movie = self._movies_by_user_id.get(user_id, {}).get(movie_id)
+            if movie:
+                return dict(movie)
+
+    def get_user_by_id(self, user_id: int, movies_limit=None, movies_after=None) -> dict:
+        """Retrieves a user's information based on the provided user_id.
+        Returns None if there is no user with that id"""
+        with self._lock:
+            user = self._get_users().get(user_id)
+            if user:
+                found_user = self._copy_user(user)
+                if movies_limit is not None or movies_after is not None:
+                    found_user['movies'] = _get_page(found_user['movies'], movies_limit,
+                                                     movies_after)
+                return found_user
+
+    def get_user_profile(self, user_id: int) -> dict:
+        """
+        Returns {'id', 'name', 'avatar'} of the user, without the movies and the password hash.
+        Returns None if there is no user with that id.
+        """
+        with self._lock:
+            user = self._get_users().get(user_id)
+            if user:
+                return {'id': user['id'], 'name': user['name'], 'avatar': user.get('avatar')}
+
+    def update_movie_of_user(self, user_id: int, movie_id: str,
+                             movie_data_to_update: dict):
+        """
+        This method is used to update a specific movie of a specific user
+        based on the user_id and movie_id provided.
+        """
+        with self._lock:
+            if user_id not in self._get_users():
+                raise ValueError(f"No user found with ID {user_id}")
+            if movie_id not in self._movies_by_user_id[user_id]:
+                raise ValueError(
+                    f"No movie found with ID {movie_id} for user {user_id}")
+            self._log_and_apply({'op': 'update_movie', 'user_id': user_id, 'movie_id': movie_id,
+                                 'movie': movie_data_to_update})
+
+    def is_password_valid(self, user_name: str, password_to_check: str) -> bool:
+        """
+           Checks the validity of a user's password by comparing a provided
+           password with the stored hash of the user's actual password.
+        """
+        with self._lock:
+            users = self._get_users()
+            user = users.get(self._user_ids_by_name.get(user_name))
+            stored_password = user.get('password') if user else None
+        # checking if stored password of user match the password_to_check
+        if stored_password:
+            is_valid = self._password_hasher.check(password_to_check, stored_password)
+            # hash made with other cost factor than configured one is replaced on login
+            if is_valid and self._password_hasher.needs_rehash(stored_password):
+                new_password = self._hash_and_encode_password(password_to_check)
+                with self._lock:
+                    if user_name in self._user_ids_by_name:
+                        self._log_and_apply({'op': 'set_password', 'user_id': user['id'],
+                                             'password': new_password})
+            return is_valid
+
+        return False  # return False for users without a password, or if the user doesn't exist
+
+    def get_user_by_name(self, user_name_to_search: str):
+        """Return user: dict with the same name. if not found returns None"""
+        with self._lock:
+            users = self._get_users()
+            user = users.get(self._user_ids_by_name.get(user_name_to_search))
+            if user:
+                return self._copy_user(user)
+
+    def get_user_id_by_name(self, user_name: str) -> int:
+        """Returns id of the user with that name, None if not found"""
+        with self._lock:
+            self._get_users()
+            return self._user_ids_by_name.get(user_name)
+
+    def search_movies(self, search_text: str, limit=None) -> list:
+        """
+        Searches movies of all users by name, director and year. Every word of search_text
+        must match the beginning of a word of the movie, name matches are returned first.
+        """
+        with self._lock:
+            self._get_users()
+            movies = [self._movies_by_user_id[user_id][movie_id]
+                      for user_id, movie_id in (next(iter(movie_keys)) for movie_keys
+                                                in self._movie_keys_by_id.values())]
+            return [dict(movie) for movie in _search_movies(movies, search_text, limit)]
+
+    def find_movie(self, search_text: str):
+        """
+        Finds movie of any user by imdb id or by exact (case insensitive) name with
+        the movies indexes. Returns movie dict or None.
+        """
+        search_text = ' '.join((search_text or '').split())
+        with self._lock:
+            self._get_users()
+            movie_keys = (self._movie_keys_by_id.get(search_text.lower()) or
+                          self._movie_keys_by_name.get(search_text.casefold()))
+            if movie_keys:
+                user_id, movie_id = next(iter(movie_keys))
+                return dict(self._movies_by_user_id[user_id][movie_id])
+
+    def get_data_version(self) -> int:
+        """Returns latest modification time of the data file and the log"""
+        with self._lock:
+            self._get_users()
+            versions = [os.stat(self.file_name).st_mtime_ns]
+            if os.path.exists(self.wal_file_name):
+                versions.append(os.stat(self.wal_file_name).st_mtime_ns)
+            return max(versions)
+
+    def compact(self):
+        """Writes current data to the data file atomically and empties the log"""
+        with self._lock:
+            users = self._get_users()
+            self._save_data(list(users.values()))
+            # log is emptied only after the new data file replaced the old one
+            with open(self.wal_file_name, 'w'):
+                pass
+            self._logged_mutations = 0
+
+    # -------------- inner logic methods--------------------------------
+
+    def _get_users(self) -> dict:
+        """Returns users index, loading data file and replaying the log on first call"""
+        if self._users is None:
+            with open(self.file_name, 'r') as file:
+                users = json.load(file)
+            self._users = {}
+            self._user_ids_by_name = {}
+            self._movies_by_user_id = {}
+            self._movie_keys_by_id = {}
+            self._movie_keys_by_name = {}
+            for user in users:
+                self._apply({'op': 'add_user', 'user': user})
+
+            if os.path.exists(self.wal_file_name):
+                with open(self.wal_file_name, 'r') as wal_file:
+                    for line in wal_file:
+                        # last line may be cut if the process died while writing it
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            break
+                        self._apply(record)
+                        self._logged_mutations += 1
+        return self._users
+
+    def _log_and_apply(self, record: dict):
+        """Appends mutation record to the log, applies it in memory and compacts if needed"""
+        with open(self.wal_file_name, 'a') as wal_file:
+            wal_file.write(json.dumps(record) + '\n')
+            if self._fsync:
+                wal_file.flush()
+                os.fsync(wal_file.fileno())
+        self._apply(record)
+        self._logged_mutations += 1
+        if self._logged_mutations >= self._compact_every:
+            self.compact()
+
+    def _apply(self, record: dict):
+        """Applies one idempotent mutation record to the in-memory data and indexes"""
+        operation = record['op']
+        if operation == 'add_user':
+            user = record['user']
+            # replayed record of a user already in the data file replaces the user
+            for movie in self._users.get(user['id'], {}).get('movies', []):
+                self._unindex_movie(user['id'], movie)
+            self._users[user['id']] = user
+            self._user_ids_by_name[user['name']] = user['id']
+            self._movies_by_user_id[user['id']] = {movie['id']: movie for movie in user['movies']}
+            for movie in user['movies']:
+                self._index_movie(user['id'], movie)
+
+        elif operation == 'delete_user':
+            user = self._users.pop(record['user_id'], None)
+            if user:
+                self._user_ids_by_name.pop(user['name'], None)
+                self._movies_by_user_id.pop(user['id'], None)
+                for movie in user['movies']:
+                    self._unindex_movie(user['id'], movie)
+
+        elif operation == 'add_movie':
+            user_movies = self._movies_by_user_id.get(record['user_id'])
+            movie = record['movie']
+            if user_movies is not None and movie['id'] not in user_movies:
+                user_movies[movie['id']] = movie
+                self._users[record['user_id']]['movies'].append(movie)
+                self._index_movie(record['user_id'], movie)
+
+        elif operation == 'delete_movie':
+            user_movies = self._movies_by_user_id.get(record['user_id'])
+            movie = user_movies.pop(record['movie_id'], None) if user_movies else None
+            if movie:
+                self._users[record['user_id']]['movies'].remove(movie)
+                self._unindex_movie(record['user_id'], movie)
+
+        elif operation == 'update_movie':
+            user_movies = self._movies_by_user_id.get(record['user_id'])
+            movie = user_movies.get(record['movie_id']) if user_movies else None
+            if movie:
+                self._unindex_movie(record['user_id'], movie)
+                movie.update(record['movie'])
+                self._index_movie(record['user_id'], movie)
+
+        elif operation == 'set_password':
+            user = self._users.get(record['user_id'])
+            if user:
+                user['password'] = record['password']
+
+        else:
+            raise ValueError(f"Unknown log record operation: {operation}")
+
+    def _index_movie(self, user_id: int, movie: dict):
+        """Adds user's movie to the indexes of movies by id and by name"""
+        movie_key = (user_id, movie['id'])
+        self._movie_keys_by_id.setdefault(str(movie['id']).lower(), set()).add(movie_key)
+        self._movie_keys_by_name.setdefault(str(movie.get('name', '')).casefold(),
+                                            set()).add(movie_key)
+
+    def _unindex_movie(self, user_id: int, movie: dict):
+        """Removes user's movie from the indexes of movies by id and by name"""
+        movie_key = (user_id, movie['id'])
+        for index, index_key in ((self._movie_keys_by_id, str(movie['id']).lower()),
+                                 (self._movie_keys_by_name,
+                                  str(movie.get('name', '')).casefold())):
+            movie_keys = index.get(index_key)
+            if movie_keys is not None:
+                movie_keys.discard(movie_key)
+                if not movie_keys:
+                    del index[index_key]
+
+    @staticmethod
+    def _copy_user(user: dict) -> dict:
+        """Copy of user dict, so callers can't change the data behind the indexes"""
+        user_copy = dict(user)
+        user_copy['movies'] = [dict(movie) for movie in user['movies']]
+        return user_copy
@@ -1,7 +1,8 @@
 from .data_manager_interface import DataManagerInterface
 import os
 import json
-import bcrypt
+import re
+from .password_hasher import PasswordHasher, get_default_hasher
 
 AVATAR_FILE_NAMES = {
     'default': 'avatar_default.png'
@@ -32,10 +33,12 @@ class JSONDataManager(DataManagerInterface):
     """
     ENCODING_TYPE = 'utf-8'
 
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, password_hasher: PasswordHasher = None):
         if not isinstance(filename, str) or not filename:
             raise ValueError('Filename should be a non-empty string')
 
+        self._password_hasher = password_hasher or get_default_hasher()
+
         self._data_folder = "data"
         self.file_name = filename
 
@@ -68,27 +71,22 @@ class JSONDataManager(DataManagerInterface):
             data = json.load(file)
         return data
 
-    def get_user_movies(self, user_id):
+    def get_user_movies(self, user_id, limit=None, after=None):
         """Will return list with movies if user id found. otherwise None"""
         all_users = self.get_all_users()
         found_user = next(
             (user for user in all_users if user['id'] == user_id), None)
         if found_user:
-            return found_user['movies']
+            if limit is None and after is None:
+                return found_user['movies']
+            return _get_page(found_user['movies'], limit, after)
 
     def add_user(self, new_user_name: str, password=None, avatar_filename=None):
         """
         Adds a user to the json file db. User name must be a string and not empty.
         Passwords are hashed and salted before being stored.
         """
-        # validate passed arguments
-        if not isinstance(new_user_name, str):
-            raise TypeError("User name need to be a string")
-        if not new_user_name:
-            raise ValueError("User name cannot be empty name")
-        if password and len(password) < 6:
-            raise ValueError("Password length must be at least 6 characters")
-
+        self._validate_new_user(new_user_name, password)
 
         users = self.get_all_users()
         # Check if the user name already exists
@@ -97,20 +95,8 @@ class JSONDataManager(DataManagerInterface):
                 raise ValueError(
                     f"User name '{new_user_name}' already exists. Please choose a different name.")
 
-        # creating new_user dict to be added
-        new_user = {
-            "id": self._get_unique_user_id(users),
-            "name": new_user_name,
-            "movies": []
-        }
-        # adding password and avatar to the new_user dict
-        if password:
-            new_user["password"] = self._hash_and_encode_password(password)
-            if avatar_filename is None or avatar_filename not in os.listdir(
-                    'static/images'):
-                avatar_filename = AVATAR_FILE_NAMES['default']
-            new_user["avatar"] = avatar_filename
-
+        new_user = self._create_user_dict(self._get_unique_user_id(users), new_user_name,
+                                          password, avatar_filename)
         users.append(new_user)
         self._save_data(users)
 
@@ -124,6 +110,16 @@ class JSONDataManager(DataManagerInterface):
             all_users.remove(user_to_delete)
             self._save_data(all_users)
 
+    def delete_users(self, user_ids: list) -> list:
+        """Deletes many users with one write of the file. Returns ids of deleted users"""
+        ids_to_delete = set(user_ids)
+        all_users = self.get_all_users()
+        users_to_keep = [user for user in all_users if user['id'] not in ids_to_delete]
+        deleted_ids = [user['id'] for user in all_users if user['id'] in ids_to_delete]
+        if deleted_ids:
+            self._save_data(users_to_keep)
+        return deleted_ids
+
     def add_movie_to_user(self, user_id: int, movie_to_add: dict):
         """
         Adds a new movie to a user's movie list if it doesn't exist.
@@ -148,6 +144,29 @@ class JSONDataManager(DataManagerInterface):
 
         self._save_data(users)
 
+    def add_movies_to_user(self, user_id: int, movies_to_add: list) -> set:
+        """
+        Adds many movies to a user's movie list with a single file write.
+        Movies the user already got are skipped.
+        Returns set of movie ids that were newly added to the user's movie list.
+        """
+        users = self.get_all_users()
+
+        user = next((user for user in users if user['id'] == user_id), None)
+        if user is None:
+            raise UserNotFoundError(f"User with ID {user_id} not found")
+
+        user_movie_ids = {movie['id'] for movie in user['movies']}
+        added_movie_ids = set()
+        for movie_to_add in movies_to_add:
+            if movie_to_add['id'] not in user_movie_ids:
+                user["movies"].append(movie_to_add)
+                user_movie_ids.add(movie_to_add['id'])
+                added_movie_ids.add(movie_to_add['id'])
+
+        self._save_data(users)
+        return added_movie_ids
+
     def delete_movie_of_user(self, user_id: int, movie_id: str):
         """Removes a specific movie from a user's movie list based on provided user_id and movie_id."""
         users = self.get_all_users()
@@ -179,15 +198,38 @@ class JSONDataManager(DataManagerInterface):
             if found_movie:
                 return found_movie
 
-    def get_user_by_id(self, user_id: int) -> dict:
+    def get_user_by_id(self, user_id: int, movies_limit=None, movies_after=None) -> dict:
         """Retrieves a user's information based on the provided user_id.
         Returns None if there is no user with that id"""
         users = self.get_all_users()
         found_user = next((user for user in users if user['id'] == user_id),
                           None)
         if found_user:
+            if movies_limit is not None or movies_after is not None:
+                found_user['movies'] = _get_page(found_user['movies'], movies_limit, movies_after)
             return found_user
 
+    def get_user_profile(self, user_id: int) -> dict:
+        """
+        Returns {'id', 'name', 'avatar'} of the user, without the movies and the password hash.
+        Returns None if there is no user with that id.
+        """
+        user = self.get_user_by_id(user_id)
+        if user:
+            return {'id': user['id'], 'name': user['name'], 'avatar': user.get('avatar')}
+
+    def get_data_version(self) -> int:
+        """Returns modification time of the data file, it changes with every saved change"""
+        return os.stat(self.file_name).st_mtime_ns
+
+    def get_user_revision(self, user_id) -> int:
+        """
+        Returns revision of the user's movies list, the data version of the file is used.
+        Returns None if there is no user with that id.
+        """
+        if self.get_user_profile(user_id):
+            return self.get_data_version()
+
     def update_movie_of_user(self, user_id: int, movie_id: str,
                              movie_data_to_update: dict):
         """
@@ -218,26 +260,19 @@ class JSONDataManager(DataManagerInterface):
         # Save all user data back to file.
         self._save_data(all_users)
 
-    def get_all_public_users(self):
+    def get_all_public_users(self, limit=None, after=None):
         """Returns a list of all public users. Public users are those who don't have a password."""
         all_users = self.get_all_users()
-        return [user for user in all_users if 'password' not in user]
+        public_users = [user for user in all_users if 'password' not in user]
+        if limit is None and after is None:
+            return public_users
+        return _get_page(public_users, limit, None if after is None else int(after))
 
     def get_all_registered_users(self):
         """Returns a list of all registered users. Registered users are those who have a password."""
         all_users = self.get_all_users()
         return [user for user in all_users if 'password' in user]
 
-        # check users password
-        user = self.get_user_by_name(user_name)
-        if user and 'password' in user:
-            stored_password_hash = user['password'].encode(JSONDataManager.ENCODING_TYPE)  # get the stored password hash
-            password_to_check_hash = bcrypt.hashpw(
-                password_to_check.encode(JSONDataManager.ENCODING_TYPE), stored_password_hash)
-            return stored_password_hash == password_to_check_hash
-
-        return False  # return False for users without a password, or if the user doesn't exist
-
     def is_password_valid(self, user_name: str, password_to_check: str) -> bool:
         """
            Checks the validity of a user's password by comparing a provided
@@ -247,9 +282,13 @@ class JSONDataManager(DataManagerInterface):
         user_name_matched = next((user for user in all_users if user['name'] == user_name), None)
         # checking if stored password of user match the password_to_check
         if user_name_matched and 'password' in user_name_matched:
-            stored_password_hash = user_name_matched['password'].encode(JSONDataManager.ENCODING_TYPE)
-            encoded_password_to_check = password_to_check.encode(JSONDataManager.ENCODING_TYPE)
-            return bcrypt.checkpw(encoded_password_to_check, stored_password_hash)
+            stored_password_hash = user_name_matched['password']
+            is_valid = self._password_hasher.check(password_to_check, stored_password_hash)
+            # hash made with other cost factor than configured one is replaced on login
+            if is_valid and self._password_hasher.needs_rehash(stored_password_hash):
+                user_name_matched['password'] = self._hash_and_encode_password(password_to_check)
+                self._save_data(all_users)
+            return is_valid
 
         return False  # return False for users without a password, or if the user doesn't exist
 
@@ -258,12 +297,74 @@ class JSONDataManager(DataManagerInterface):
         all_reg_users = self.get_all_users()
         return next((user for user in all_reg_users if user['name'] == user_name_to_search), None)
 
+    def get_user_id_by_name(self, user_name: str) -> int:
+        """Returns id of the user with that name, None if not found"""
+        return next((user['id'] for user in self.get_all_users() if user['name'] == user_name),
+                    None)
+
+    def search_movies(self, search_text: str, limit=None) -> list:
+        """
+        Searches movies of all users by name, director and year. Every word of search_text
+        must match the beginning of a word of the movie, name matches are returned first.
+        """
+        movies_by_id = {}
+        for user in self.get_all_users():
+            for movie in user['movies']:
+                movies_by_id.setdefault(movie['id'], movie)
+        return _search_movies(movies_by_id.values(), search_text, limit)
+
+    def find_movie(self, search_text: str):
+        """
+        Finds movie of any user by imdb id or by exact (case insensitive) name.
+        Returns movie dict or None.
+        """
+        search_text = ' '.join((search_text or '').split()).casefold()
+        for user in self.get_all_users():
+            for movie in user['movies']:
+                if search_text in (str(movie['id']).casefold(),
+                                   str(movie.get('name', '')).casefold()):
+                    return movie
+
     # -------------- inner logic methods--------------------------------
 
     def _save_data(self, users):
-        """Saves the users data to a file in JSON format"""
-        with open(self.file_name, "w") as file:
+        """
+        Saves the users data to a file in JSON format. Data is written to a temp file
+        that replaces the old file, so readers never see a half written file.
+        """
+        temp_file_name = self.file_name + '.tmp'
+        with open(temp_file_name, "w") as file:
             json.dump(users, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file_name, self.file_name)
+
+    @staticmethod
+    def _validate_new_user(new_user_name, password):
+        """Raises TypeError/ValueError if passed user name or password are invalid"""
+        if not isinstance(new_user_name, str):
+            raise TypeError("User name need to be a string")
+        if not new_user_name:
+            raise ValueError("User name cannot be empty name")
+        if password and len(password) < 6:
+            raise ValueError("Password length must be at least 6 characters")
+
+    def _create_user_dict(self, user_id: int, new_user_name: str, password=None,
+                          avatar_filename=None) -> dict:
+        """Creates new user dict, with hashed password and avatar if password passed"""
+        new_user = {
+            "id": user_id,
+            "name": new_user_name,
+            "movies": []
+        }
+        # adding password and avatar to the new_user dict
+        if password:
+            new_user["password"] = self._hash_and_encode_password(password)
+            if avatar_filename is None or avatar_filename not in os.listdir(
+                    'static/images'):
+                avatar_filename = AVATAR_FILE_NAMES['default']
+            new_user["avatar"] = avatar_filename
+        return new_user
 
     def _get_unique_user_id(self, users: list) -> int:
         """finds maximum id number, adds to it 1 and return the value"""
@@ -274,10 +375,42 @@ class JSONDataManager(DataManagerInterface):
         return unique_id
 
     def _hash_and_encode_password(self, password: str) -> str:
-        """Encodes, hashes, and decodes a given password using bcrypt."""
-        password_hash = bcrypt.hashpw(password.encode(JSONDataManager.ENCODING_TYPE),
-                                      bcrypt.gensalt())
-        return password_hash.decode(JSONDataManager.ENCODING_TYPE)
+        """Encodes, hashes, and decodes a given password using bcrypt in the hasher pool."""
+        return self._password_hasher.hash(password)
+
+
+def _get_page(items: list, limit=None, after=None) -> list:
+    """Keyset page of dicts: items with 'id' greater than after, ordered by 'id', up to limit"""
+    page = sorted((item for item in items if after is None or item['id'] > after),
+                  key=lambda item: item['id'])
+    return page if limit is None else page[:limit]
+
+
+def _words(text) -> list:
+    """Casefolded words of the text"""
+    return re.findall(r'\w+', str(text or '').casefold())
+
+
+def _search_movies(movies, search_text: str, limit=None) -> list:
+    """
+    Movies which name, director or year has a word starting with every word of
+    search_text, movies matching by name first, up to limit
+    """
+    search_words = _words(search_text)
+    if not search_words:
+        return []
+    name_matches, other_matches = [], []
+    for movie in movies:
+        name_words = _words(movie.get('name'))
+        movie_words = name_words + _words(movie.get('director')) + _words(movie.get('year'))
+        if all(any(word.startswith(search_word) for word in movie_words)
+               for search_word in search_words):
+            is_name_match = all(any(word.startswith(search_word) for word in name_words)
+                                for search_word in search_words)
+            (name_matches if is_name_match else other_matches).append(movie)
+    found_movies = name_matches + other_matches
+    return found_movies if limit is None else found_movies[:limit]
+
 
 class UserNotFoundError(Exception):
     pass
@@ -0,0 +1,89 @@
+"""
+Compact archive of the whole library (users, movies, user_movie and reviews).
+
+Archive is a gzip stream of JSON lines (frames):
+    {"format": "movieweb-library", "version": 1, ...header}
+    {"table": "users", "columns": ["id", "name", ...], "data": [[1, 2], ["bob", "amy"]]}
+    ...
+    {"end": true, "counts": {"users": 2, ...}}
+Every table frame holds one batch of rows stored by column, names are not
+repeated per row and equal values of a column stay close together, so the
+archive compresses well. Frames are written and read one at a time, memory
+doesn't depend on the size of the library. Missing end frame means the
+archive was cut.
+"""
+import gzip
+import json
+import zlib
+
+ARCHIVE_FORMAT = 'movieweb-library'
+ARCHIVE_VERSION = 1
+
+
+class ArchiveError(ValueError):
+    """Raised for a file that is not a valid library archive"""
+    pass
+
+
+def iter_archive(header: dict, batches):
+    """
+    Yields gzip compressed bytes of the archive made of header and batches,
+    iterable of (table name, column names, list of row tuples).
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    counts = {}
+    yield compressor.compress(_frame(dict(header, format=ARCHIVE_FORMAT,
+                                          version=ARCHIVE_VERSION)))
+    for table_name, columns, rows in batches:
+        counts[table_name] = counts.get(table_name, 0) + len(rows)
+        frame = {'table': table_name, 'columns': list(columns),
+                 'data': [list(values) for values in zip(*rows)]}
+        yield compressor.compress(_frame(frame))
+    yield compressor.compress(_frame({'end': True, 'counts': counts}))
+    yield compressor.flush()
+
+
+def write_archive(file, header: dict, batches) -> int:
+    """Writes the archive to binary file, returns number of written bytes"""
+    size = 0
+    for chunk in iter_archive(header, batches):
+        file.write(chunk)
+        size += len(chunk)
+    return size
+
+
+def read_archive(file):
+    """
+    Returns (header, batches) of the archive in binary file. batches is a generator
+    of (table name, column names, list of row tuples), ArchiveError is raised
+    by it if the archive is cut or damaged.
+    """
+    lines = _iter_lines(gzip.GzipFile(fileobj=file, mode='rb'))
+    header = next(lines, None)
+    if not header or header.get('format') != ARCHIVE_FORMAT:
+        raise ArchiveError("Not a library archive")
+    if header.get('version') != ARCHIVE_VERSION:
+        raise ArchiveError(f"Unsupported library archive version: {header.get('version')}")
+
+    def iter_batches():
+        for frame in lines:
+            if frame.get('end'):
+                return
+            yield frame['table'], frame['columns'], list(zip(*frame['data']))
+        raise ArchiveError("Library archive is incomplete")
+
+    return header, iter_batches()
+
+
+# -------------- inner logic methods--------------------------------
+
+def _frame(frame: dict) -> bytes:
+    return (json.dumps(frame, separators=(',', ':')) + '\n').encode()
+
+
+def _iter_lines(gzip_file):
+    try:
+        for line in gzip_file:
+            yield json.loads(line)
+    except (OSError, EOFError, zlib.error, json.JSONDecodeError) as e:
+        raise ArchiveError(f"Damaged library archive: {e}")
@@ -0,0 +1,217 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import config
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_default_limiter():
+    """Returns LoginRateLimiter shared by the login routes of the process, created on first use"""
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            store = None
+            if config.LOGIN_RATE_LIMIT_DB_FILE_NAME:
+                store = SQLiteRateLimitStore(config.get_absolute_path_login_rate_limit_db())
+            _default_limiter = LoginRateLimiter(
+                store=store,
+                user_capacity=config.LOGIN_USER_BUCKET_CAPACITY,
+                user_refill_seconds=config.LOGIN_USER_BUCKET_REFILL_SECONDS,
+                ip_capacity=config.LOGIN_IP_BUCKET_CAPACITY,
+                ip_refill_seconds=config.LOGIN_IP_BUCKET_REFILL_SECONDS,
+                backoff_after_failures=config.LOGIN_BACKOFF_AFTER_FAILURES,
+                backoff_base_seconds=config.LOGIN_BACKOFF_BASE_SECONDS,
+                backoff_max_seconds=config.LOGIN_BACKOFF_MAX_SECONDS)
+    return _default_limiter
+
+
+class MemoryRateLimitStore():
+    """
+    Bucket states of one process kept in a dict. Least recently used keys are
+    dropped when there are more than max_entries of them.
+    """
+
+    def __init__(self, max_entries=100000):
+        self._max_entries = max_entries
+        self._states = OrderedDict()  # key -> (tokens, updated_at, failures, blocked_until)
+        self._lock = threading.Lock()
+
+    def update(self, key: str, update_function):
+        """
+        Atomically replaces state of the key with update_function(state) where
+        state is None for unknown key. update_function returns (new_state, result),
+        result is returned.
+        """
+        with self._lock:
+            new_state, result = update_function(self._states.get(key))
+            self._states[key] = new_state
+            self._states.move_to_end(key)
+            if len(self._states) > self._max_entries:
+                self._states.popitem(last=False)
+            return result
+
+
+class SQLiteRateLimitStore():
+    """
+    Bucket states in a SQLite table, shared by every worker process that
+    points to the same file. Read-modify-write of a key runs in an IMMEDIATE
+    transaction, so workers don't overwrite each other's updates.
+    """
+
+    def __init__(self, db_path: str):
+        self._connection = sqlite3.connect(db_path, check_same_thread=False,
+                                           isolation_level=None, timeout=5)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS login_rate_limits ('
+            'key TEXT PRIMARY KEY, tokens REAL, updated_at REAL, '
+            'failures INTEGER, blocked_until REAL)')
+        self._lock = threading.Lock()
+
+    def update(self, key: str, update_function):
+        """Same as MemoryRateLimitStore.update"""
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._connection.execute(
+                    'SELECT tokens, updated_at, failures, blocked_until FROM login_rate_limits '
+                    'WHERE key = ?', (key,)).fetchone()
+                new_state, result = update_function(tuple(row) if row else None)
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO login_rate_limits '
+                    '(key, tokens, updated_at, failures, blocked_until) VALUES (?, ?, ?, ?, ?)',
+                    (key, *new_state))
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+            return result
+
+    def close(self):
+        self._connection.close()
+
+
+class LoginRateLimiter():
+    """
+    Token bucket limiter of login attempts per user name and per client ip.
+
+    Every attempt takes one token from the bucket of the user name and one from
+    the bucket of the ip. Buckets hold up to capacity tokens and get one token
+    back every refill_seconds. Attempt is allowed only if both buckets have a
+    token, so it is checked before any password hashing is done. Denied attempt
+    takes no token, e.g. an ip over its limit doesn't drain the user's bucket.
+
+    After backoff_after_failures failed logins in a row the key is blocked for
+    backoff_base_seconds, doubled with every next failure up to
+    backoff_max_seconds.
+    """
+
+    def __init__(self, store=None, user_capacity=5, user_refill_seconds=12.0,
+                 ip_capacity=20, ip_refill_seconds=3.0, backoff_after_failures=3,
+                 backoff_base_seconds=1.0, backoff_max_seconds=900.0, time_function=time.time):
+        self._store = store or MemoryRateLimitStore()
+        self._buckets = {'user': (user_capacity, user_refill_seconds),
+                         'ip': (ip_capacity, ip_refill_seconds)}
+        self._backoff_after_failures = backoff_after_failures
+        self._backoff_base_seconds = backoff_base_seconds
+        self._backoff_max_seconds = backoff_max_seconds
+        self._time = time_function
+
+    def check(self, user_name: str, ip: str) -> float:
+        """
+        Takes a token for the login attempt. Returns 0 if the attempt is allowed,
+        otherwise seconds after which the client may try again.
+        """
+        now = self._time()
+        bucket_keys = (('user', user_name), ('ip', ip))
+        # both buckets are checked first, denied attempt takes no token from any of them
+        retry_after = max(self._update_bucket(bucket, key, now, take_token=False)
+                          for bucket, key in bucket_keys)
+        if retry_after:
+            return retry_after
+
+        taken_bucket_keys = []
+        for bucket, key in bucket_keys:
+            retry_after = self._update_bucket(bucket, key, now, take_token=True)
+            if retry_after:
+                # other worker took the last token after the check, taken tokens are returned
+                for taken_bucket, taken_key in taken_bucket_keys:
+                    self._return_token(taken_bucket, taken_key, now)
+                return retry_after
+            taken_bucket_keys.append((bucket, key))
+        return 0.0
+
+    def record_failure(self, user_name: str, ip: str):
+        """Counts failed login, blocking the user name and ip with growing backoff"""
+        now = self._time()
+        for bucket, key in (('user', user_name), ('ip', ip)):
+            capacity, refill_seconds = self._buckets[bucket]
+
+            def add_failure(state):
+                tokens, failures, blocked_until = self._refilled(state, capacity, refill_seconds,
+                                                                 now)
+                failures += 1
+                extra_failures = failures - self._backoff_after_failures
+                if extra_failures >= 0:
+                    backoff = min(self._backoff_base_seconds * 2 ** extra_failures,
+                                  self._backoff_max_seconds)
+                    blocked_until = max(blocked_until, now + backoff)
+                return (tokens, now, failures, blocked_until), None
+
+            self._store.update(f'{bucket}:{key}', add_failure)
+
+    def record_success(self, user_name: str):
+        """
+        Clears failures and block of the user name after successful login.
+        Failures of the ip are kept, so logging into own account doesn't reset
+        the backoff of an ip guessing passwords of other users.
+        """
+        now = self._time()
+        capacity, refill_seconds = self._buckets['user']
+
+        def clear_failures(state):
+            tokens, _, _ = self._refilled(state, capacity, refill_seconds, now)
+            return (tokens, now, 0, 0.0), None
+
+        self._store.update(f'user:{user_name}', clear_failures)
+
+    # -------------- inner logic methods--------------------------------
+
+    def _update_bucket(self, bucket: str, key: str, now: float, take_token: bool) -> float:
+        """
+        Returns 0 if the bucket of the key allows an attempt, taking its token if take_token,
+        otherwise seconds after which the bucket allows it.
+        """
+        capacity, refill_seconds = self._buckets[bucket]
+
+        def update(state):
+            tokens, failures, blocked_until = self._refilled(state, capacity, refill_seconds, now)
+            if blocked_until > now:
+                return (tokens, now, failures, blocked_until), blocked_until - now
+            if tokens < 1:
+                return (tokens, now, failures, blocked_until), (1 - tokens) * refill_seconds
+            if take_token:
+                tokens -= 1
+            return (tokens, now, failures, blocked_until), 0.0
+
+        return self._store.update(f'{bucket}:{key}', update)
+
+    def _return_token(self, bucket: str, key: str, now: float):
+        capacity, refill_seconds = self._buckets[bucket]
+
+        def return_token(state):
+            tokens, failures, blocked_until = self._refilled(state, capacity, refill_seconds, now)
+            return (min(capacity, tokens + 1), now, failures, blocked_until), None
+
+        self._store.update(f'{bucket}:{key}', return_token)
+
+    @staticmethod
+    def _refilled(state, capacity, refill_seconds, now):
+        """Returns (tokens, failures, blocked_until) of the state with tokens refilled to now"""
+        if state is None:
+            return float(capacity), 0, 0.0
+        tokens, updated_at, failures, blocked_until = state
+        tokens = min(capacity, tokens + max(now - updated_at, 0) / refill_seconds)
+        return tokens, failures, blocked_until
@@ -0,0 +1,17 @@
+from .async_omdb_api_data_handler import get_default_handler
+
+
+def get_movies_local_first(data_manager, search_texts: list) -> list:
+    """
+    Looks movies up by titles or imdb ids in the local catalog of data_manager first,
+    only the ones not found there are requested from OMDb. Returns movie dict or None
+    for every search text, in the same order.
+    """
+    movies = [data_manager.find_movie(search_text) for search_text in search_texts]
+    missing_search_texts = [search_text for search_text, movie in zip(search_texts, movies)
+                            if movie is None]
+    if not missing_search_texts:
+        return movies
+
+    fetched_movies = iter(get_default_handler().get_movies(missing_search_texts))
+    return [movie if movie is not None else next(fetched_movies) for movie in movies]
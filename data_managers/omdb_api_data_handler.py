@@ -1,34 +1,166 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
+import re
+import threading
+import config
+from .circuit_breaker import CircuitBreaker
+from .omdb_cache import OmdbResponseCache, NOT_FOUND
+
+_default_cache = None
+_default_session = None
+_default_circuit_breaker = None
+_defaults_lock = threading.Lock()
+
+
+def get_default_cache() -> OmdbResponseCache:
+    """Returns cache shared by all handlers of the process, created on first use"""
+    global _default_cache
+    with _defaults_lock:
+        if _default_cache is None:
+            _default_cache = OmdbResponseCache(
+                db_path=config.get_absolute_path_omdb_cache(),
+                ttl_seconds=config.OMDB_CACHE_TTL_SECONDS,
+                negative_ttl_seconds=config.OMDB_CACHE_NEGATIVE_TTL_SECONDS,
+                lru_max_size=config.OMDB_CACHE_LRU_MAX_SIZE,
+                disk_max_size=config.OMDB_CACHE_DISK_MAX_SIZE,
+                disk_evict_every=config.OMDB_CACHE_DISK_EVICT_EVERY)
+    return _default_cache
+
+
+def create_session(pool_size=config.OMDB_POOL_SIZE, max_retries=config.OMDB_MAX_RETRIES,
+                   backoff_factor=config.OMDB_RETRY_BACKOFF_FACTOR) -> requests.Session:
+    """
+    Creates requests session with keep-alive connection pool and bounded retries.
+    Retries are done with exponential backoff on connection errors and on
+    429/5xx answers of idempotent GET requests.
+    """
+    retry = Retry(total=max_retries, connect=max_retries, read=max_retries,
+                  status=max_retries, backoff_factor=backoff_factor,
+                  status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET',),
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_default_session() -> requests.Session:
+    """Returns http session shared by all handlers of the process, created on first use"""
+    global _default_session
+    with _defaults_lock:
+        if _default_session is None:
+            _default_session = create_session()
+    return _default_session
+
+
+def get_default_circuit_breaker() -> CircuitBreaker:
+    """Returns circuit breaker shared by all handlers of the process, created on first use"""
+    global _default_circuit_breaker
+    with _defaults_lock:
+        if _default_circuit_breaker is None:
+            _default_circuit_breaker = CircuitBreaker(
+                failure_threshold=config.OMDB_CIRCUIT_FAILURE_THRESHOLD,
+                reset_timeout=config.OMDB_CIRCUIT_RESET_TIMEOUT_SECONDS)
+    return _default_circuit_breaker
+
 
 class MovieAPIHandler():
     IMDB_PATH = "https://www.imdb.com/title/"
+    IMDB_ID_PATTERN = re.compile(r'^tt\d{7,}$')
 
-    def __init__(self):
+    def __init__(self, cache: OmdbResponseCache = None, session: requests.Session = None,
+                 circuit_breaker: CircuitBreaker = None, url: str = None, timeout: tuple = None):
         self._api_key = "f994fda"
-        self._url = "https://www.omdbapi.com/"
+        self._url = url or config.OMDB_API_URL
         self._logger = logging.getLogger(__name__)
+        self._cache = cache
+        self._session = session or get_default_session()
+        self._circuit_breaker = circuit_breaker or get_default_circuit_breaker()
+        # (connect timeout, read timeout) in seconds
+        self._timeout = timeout or (config.OMDB_CONNECT_TIMEOUT_SECONDS,
+                                    config.OMDB_READ_TIMEOUT_SECONDS)
+
+    @property
+    def cache(self) -> OmdbResponseCache:
+        if self._cache is None:
+            self._cache = get_default_cache()
+        return self._cache
 
     def get_movie_by_title(self, title: str) -> dict:
         """Search for movie by title. Returns dict with data of found movie
         and None if didn't find movie"""
-        params = {
-            'apikey': self._api_key,
-            't': title
-        }
+        return self._get_movie(OmdbResponseCache.title_key(title), {'t': title})
+
+    def get_movie_by_imdb_id(self, imdb_id: str) -> dict:
+        """Search for movie by imdbID. Returns dict with data of found movie
+        and None if didn't find movie"""
+        return self._get_movie(OmdbResponseCache.imdb_id_key(imdb_id), {'i': imdb_id})
+
+    def get_cached_movie(self, cache_key: str):
+        """
+        Returns tuple (is_cached, movie data or None for cached 'not found').
+        Used with fetch_and_cache_movie by handlers that run the lookups themselves.
+        """
+        cached_movie = self.cache.get(cache_key)
+        if cached_movie is NOT_FOUND:
+            return True, None
+        return cached_movie is not None, cached_movie
+
+    def fetch_and_cache_movie(self, cache_key: str, search_params: dict) -> dict:
+        """Asks OMDb for the movie and stores the answer in cache"""
+        movie_data, is_definitive = self._request_movie(search_params)
+        if movie_data is not None:
+            self.cache.set(cache_key, movie_data)
+            self.cache.set(OmdbResponseCache.imdb_id_key(movie_data['id']), movie_data)
+        elif is_definitive:
+            # OMDb answered that there is no such movie, network errors are not cached
+            self.cache.set(cache_key, NOT_FOUND)
+        return movie_data
+
+    @staticmethod
+    def is_imdb_id(text: str) -> bool:
+        """Checks if passed search text looks like imdbID (for example 'tt0120338')"""
+        return bool(MovieAPIHandler.IMDB_ID_PATTERN.match(text.strip().lower()))
+
+    def _get_movie(self, cache_key: str, search_params: dict) -> dict:
+        """Returns movie from cache if possible, otherwise asks OMDb and caches the answer"""
+        is_cached, cached_movie = self.get_cached_movie(cache_key)
+        if is_cached:
+            return cached_movie
+        return self.fetch_and_cache_movie(cache_key, search_params)
+
+    def _request_movie(self, search_params: dict):
+        """
+        Makes request to OMDb. Returns tuple (movie data or None, is_definitive),
+        is_definitive is False when the answer came from a failed request.
+        """
+        # OMDb is degraded - fail fast instead of waiting for timeouts
+        if not self._circuit_breaker.allow_request():
+            self._logger.warning("OMDb circuit is open, skipping request")
+            return None, False
+
+        params = {'apikey': self._api_key}
+        params.update(search_params)
         try:
             # get the search result, transform the data to match app needs and return the data
-            response = requests.get(self._url, params=params)
+            response = self._session.get(self._url, params=params, timeout=self._timeout)
             response.raise_for_status()  # Raise an exception for 4xx or 5xx status codes
+            self._circuit_breaker.record_success()
             if response.json()["Response"] == 'True':
                 processed_movie_data = self._transform_movie_data(response.json())
-                return processed_movie_data
+                return processed_movie_data, True
+            # only "Movie not found!"/"Incorrect IMDb ID." are real answers, not quota errors
+            error_message = response.json().get('Error', '').lower()
+            return None, 'not found' in error_message or 'incorrect imdb id' in error_message
 
         except requests.exceptions.RequestException as e:
-            # self._logger.error(f"An error occurred: {str(e)}")
-            pass
-        # case of exceptions or movie didn't found
-        return None
+            self._circuit_breaker.record_failure()
+            self._logger.error(f"An error occurred: {str(e)}")
+        # case of exceptions
+        return None, False
 
     def _transform_movie_data(self, api_data: dict) -> dict:
         """Transform api data to match the data used in app"""
@@ -42,5 +174,3 @@ class MovieAPIHandler():
             'image_link': api_data['Poster']
         }
         return transformed_data
-
-
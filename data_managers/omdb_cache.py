@@ -0,0 +1,155 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# marker stored for titles that OMDb answered with "movie not found"
+NOT_FOUND = object()
+_NOT_FOUND_VALUE = 'null'
+
+
+class OmdbResponseCache():
+    """
+    Two tier cache for transformed OMDb movie data.
+
+    The first tier is an in-process LRU (OrderedDict) bounded by lru_max_size.
+    The second tier is a SQLite table that survives restarts and is shared by
+    every worker that points to the same file, bounded by disk_max_size.
+    Expired and overflowing rows are deleted every disk_evict_every writes of
+    the worker, not on every write.
+
+    Entries are keyed by a normalized title ('t:inception') or by imdbID
+    ('i:tt1375666'). "Not found" answers are cached too (negative caching),
+    with their own, usually shorter, TTL.
+    """
+
+    def __init__(self, db_path=None, ttl_seconds=7 * 24 * 3600, negative_ttl_seconds=3600,
+                 lru_max_size=512, disk_max_size=50000, disk_evict_every=100):
+        self._ttl_seconds = ttl_seconds
+        self._negative_ttl_seconds = negative_ttl_seconds
+        self._lru_max_size = lru_max_size
+        self._disk_max_size = disk_max_size
+        self._disk_evict_every = disk_evict_every
+        self._disk_writes = 0  # writes since the last eviction
+        self._lru = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0,
+                       'disk_evictions': 0, 'expired': 0}
+
+        self._connection = None
+        if db_path:
+            self._connection = sqlite3.connect(db_path, check_same_thread=False)
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS omdb_cache ('
+                'key TEXT PRIMARY KEY, value TEXT, expires_at REAL, stored_at REAL)')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS ix_omdb_cache_stored_at ON omdb_cache (stored_at)')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS ix_omdb_cache_expires_at ON omdb_cache (expires_at)')
+            self._connection.commit()
+
+    @staticmethod
+    def title_key(title: str) -> str:
+        """Normalize title: case insensitive, surrounding and repeated spaces ignored"""
+        return 't:' + ' '.join(title.split()).casefold()
+
+    @staticmethod
+    def imdb_id_key(imdb_id: str) -> str:
+        return 'i:' + imdb_id.strip().lower()
+
+    def get(self, key: str):
+        """
+        Returns cached movie dict, NOT_FOUND for cached negative answer
+        or None if there is no valid entry for the key.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._lru.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return value
+                del self._lru[key]
+                self._stats['expired'] += 1
+
+            # second tier - persistent sqlite cache
+            if self._connection is not None:
+                row = self._connection.execute(
+                    'SELECT value, expires_at FROM omdb_cache WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    raw_value, expires_at = row
+                    if expires_at > now:
+                        value = NOT_FOUND if raw_value == _NOT_FOUND_VALUE else json.loads(raw_value)
+                        self._put_in_lru(key, value, expires_at)
+                        self._stats['disk_hits'] += 1
+                        return value
+                    self._connection.execute('DELETE FROM omdb_cache WHERE key = ?', (key,))
+                    self._connection.commit()
+                    self._stats['expired'] += 1
+
+            self._stats['misses'] += 1
+            return None
+
+    def set(self, key: str, value):
+        """Stores movie dict (or NOT_FOUND) under key in both tiers"""
+        ttl = self._negative_ttl_seconds if value is NOT_FOUND else self._ttl_seconds
+        now = time.time()
+        expires_at = now + ttl
+        with self._lock:
+            self._put_in_lru(key, value, expires_at)
+            if self._connection is not None:
+                raw_value = _NOT_FOUND_VALUE if value is NOT_FOUND else json.dumps(value)
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO omdb_cache (key, value, expires_at, stored_at) '
+                    'VALUES (?, ?, ?, ?)', (key, raw_value, expires_at, now))
+                self._disk_writes += 1
+                if self._disk_writes >= self._disk_evict_every:
+                    self._evict_from_disk()
+                    self._disk_writes = 0
+                self._connection.commit()
+
+    def clear(self):
+        """Removes all entries from both tiers"""
+        with self._lock:
+            self._lru.clear()
+            if self._connection is not None:
+                self._connection.execute('DELETE FROM omdb_cache')
+                self._connection.commit()
+
+    def stats(self) -> dict:
+        """Returns copy of hit/miss/eviction counters and current sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['lru_size'] = len(self._lru)
+            if self._connection is not None:
+                stats['disk_size'] = self._connection.execute(
+                    'SELECT COUNT(*) FROM omdb_cache').fetchone()[0]
+        return stats
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    # -------------- inner logic methods--------------------------------
+
+    def _put_in_lru(self, key: str, value, expires_at: float):
+        self._lru[key] = (expires_at, value)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self._lru_max_size:
+            self._lru.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _evict_from_disk(self):
+        """Drops expired rows first, then the oldest rows above disk_max_size"""
+        self._connection.execute('DELETE FROM omdb_cache WHERE expires_at <= ?', (time.time(),))
+        size = self._connection.execute('SELECT COUNT(*) FROM omdb_cache').fetchone()[0]
+        overflow = size - self._disk_max_size
+        if overflow > 0:
+            self._connection.execute(
+                'DELETE FROM omdb_cache WHERE key IN '
+                '(SELECT key FROM omdb_cache ORDER BY stored_at LIMIT ?)', (overflow,))
+            self._stats['disk_evictions'] += overflow
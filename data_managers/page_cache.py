@@ -0,0 +1,86 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import request, session, make_response
+import config
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_page_cache():
+    """Returns PageCache shared by all page routes of the process, created on first use"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PageCache(max_size=config.PAGE_CACHE_MAX_SIZE)
+    return _default_cache
+
+
+def page_etag(*parts) -> str:
+    """Returns ETag of a page made from everything the page depends on"""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def conditional_page_response(etag: str, render_page):
+    """
+    Returns 304 response without rendering the page if the browser already got
+    the page with that ETag, otherwise renders the page with render_page().
+    Pages with waiting flashed messages are always rendered.
+    """
+    has_flashes = '_flashes' in session
+    if not has_flashes and request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render_page())
+    if not has_flashes:
+        response.set_etag(etag)
+    # page depends on the logged in user, browser must revalidate it before use
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+class PageCache():
+    """
+    In-process LRU of rendered page fragments.
+
+    Keys contain the data version of the data manager, which is increased by
+    every change, or the revision of the user whose movies the page shows, so
+    an entry is never stale: after a change the pages are rendered with new
+    keys and old entries are dropped by the LRU.
+    """
+
+    def __init__(self, max_size=256):
+        self._max_size = max_size
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def get_or_render(self, key: tuple, render_fragment):
+        """Returns cached fragment of the key or renders it with render_fragment() and caches it.
+        None results are not cached."""
+        with self._lock:
+            if key in self._fragments:
+                self._fragments.move_to_end(key)
+                self._stats['hits'] += 1
+                return self._fragments[key]
+            self._stats['misses'] += 1
+
+        fragment = render_fragment()
+        if fragment is not None:
+            with self._lock:
+                self._fragments[key] = fragment
+                if len(self._fragments) > self._max_size:
+                    self._fragments.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._fragments)
+        return stats
@@ -0,0 +1,139 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import bcrypt
+import config
+
+ENCODING_TYPE = 'utf-8'
+
+_default_hasher = None
+_default_hasher_lock = threading.Lock()
+
+
+def get_default_hasher():
+    """Returns PasswordHasher shared by all data managers of the process, created on first use"""
+    global _default_hasher
+    with _default_hasher_lock:
+        if _default_hasher is None:
+            _default_hasher = PasswordHasher(rounds=config.BCRYPT_ROUNDS,
+                                             workers=config.PASSWORD_HASHER_WORKERS,
+                                             max_queue=config.PASSWORD_HASHER_MAX_QUEUE,
+                                             use_processes=config.PASSWORD_HASHER_USE_PROCESSES)
+    return _default_hasher
+
+
+# module level functions - they are pickled and executed in worker processes
+def _hash_password(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _check_password(password: bytes, password_hash: bytes) -> bool:
+    return bcrypt.checkpw(password, password_hash)
+
+
+class PasswordHasherBusyError(RuntimeError):
+    """Raised when too many password operations are waiting for a worker"""
+    pass
+
+
+class PasswordHasher():
+    """
+    Runs bcrypt hashing and checking in a pool of worker processes sized to the
+    number of cores, so password work of many requests can't take more CPU than
+    the pool has. Request threads only wait for the result.
+
+    At most max_queue operations can be submitted (running or waiting) at a time,
+    PasswordHasherBusyError is raised for the next ones.
+    """
+
+    def __init__(self, rounds=12, workers=None, max_queue=64, use_processes=True):
+        self._rounds = rounds
+        self._workers = workers or os.cpu_count() or 1
+        self._max_queue = max_queue
+        self._use_processes = use_processes
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {'completed': 0, 'rejected': 0, 'total_latency_ms': 0.0,
+                       'max_latency_ms': 0.0}
+
+    @property
+    def rounds(self) -> int:
+        return self._rounds
+
+    def hash(self, password: str) -> str:
+        """Encodes, hashes with configured cost factor and decodes a given password"""
+        password_hash = self._run(_hash_password, password.encode(ENCODING_TYPE), self._rounds)
+        return password_hash.decode(ENCODING_TYPE)
+
+    def check(self, password: str, password_hash: str) -> bool:
+        """Checks password against stored bcrypt hash"""
+        return self._run(_check_password, password.encode(ENCODING_TYPE),
+                         password_hash.encode(ENCODING_TYPE))
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Checks if the hash was made with a cost factor other than the configured one"""
+        # bcrypt hash format: $2b$<cost>$<salt and hash>
+        parts = password_hash.split('$')
+        return len(parts) < 4 or not parts[2].isdigit() or int(parts[2]) != self._rounds
+
+    def stats(self) -> dict:
+        """Returns queue depth and latency (time in queue + hashing) metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queue_depth'] = self._pending
+            stats['workers'] = self._workers
+            stats['pool_started'] = self._executor is not None
+            stats['avg_latency_ms'] = (stats['total_latency_ms'] / stats['completed']
+                                       if stats['completed'] else 0.0)
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    # -------------- inner logic methods--------------------------------
+
+    def _get_executor(self):
+        """Creates the pool on first use"""
+        if self._executor is None:
+            if self._use_processes:
+                # workers are not forked from this process, it already runs threads (OMDb
+                # loop, db pools, session sweeper) and a forked child can deadlock on a lock
+                # one of them held. forkserver forks them from a clean single threaded
+                # process which imported only this module (config first, it imports the
+                # data managers and so this module)
+                if 'forkserver' in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context('forkserver')
+                    context.set_forkserver_preload(['config', __name__])
+                else:
+                    context = multiprocessing.get_context('spawn')
+                self._executor = ProcessPoolExecutor(max_workers=self._workers, mp_context=context)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers,
+                                                    thread_name_prefix='bcrypt')
+        return self._executor
+
+    def _run(self, function, *args):
+        """Submits password operation to the pool and waits for its result"""
+        with self._lock:
+            if self._pending >= self._max_queue:
+                self._stats['rejected'] += 1
+                raise PasswordHasherBusyError("Too many password operations, try again later")
+            self._pending += 1
+            executor = self._get_executor()
+
+        started = time.perf_counter()
+        try:
+            return executor.submit(function, *args).result()
+        finally:
+            latency_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._pending -= 1
+                self._stats['completed'] += 1
+                self._stats['total_latency_ms'] += latency_ms
+                self._stats['max_latency_ms'] = max(self._stats['max_latency_ms'], latency_ms)
@@ -0,0 +1,65 @@
+"""
+Routing of read-only queries to a read replica of the sqlite db.
+
+The replica is a second sqlite file, a snapshot of the primary refreshed
+with the sqlite backup API. Read methods of the data manager run inside
+reading_from(engine): every statement of the session without an explicit
+bind goes to that engine, flushes (writes) always go to the primary.
+"""
+import functools
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask_sqlalchemy.session import Session
+
+_read_bind = ContextVar('read_bind', default=None)
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends statements to the engine set by reading_from()"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        read_bind = _read_bind.get()
+        if bind is None and read_bind is not None and not self._flushing:
+            return read_bind
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def get_read_bind():
+    """Returns engine set by reading_from() in the current context, None for the primary"""
+    return _read_bind.get()
+
+
+@contextmanager
+def reading_from(engine):
+    """Statements in the with block read from engine (None keeps the primary)"""
+    token = _read_bind.set(engine)
+    try:
+        yield
+    finally:
+        _read_bind.reset(token)
+
+
+def read_only(method):
+    """Data manager method decorator, runs the method with the engine from self._get_read_engine()"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with reading_from(self._get_read_engine()):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def copy_database(source_path: str, target_path: str):
+    """
+    Copies sqlite db with the backup API, consistent even while the source is
+    written. Connections of the target see the new data on their next read.
+    """
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
@@ -0,0 +1,244 @@
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from werkzeug.datastructures import CallbackDict
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def create_session_interface():
+    """Returns ServerSideSessionInterface for config.SESSION_STORE ('sqlite' or 'memory')"""
+    if config.SESSION_STORE == 'sqlite':
+        store = SQLiteSessionStore(config.get_absolute_path_session_db())
+    elif config.SESSION_STORE == 'memory':
+        store = MemorySessionStore()
+    else:
+        raise ValueError(f"Unknown session store: {config.SESSION_STORE}")
+    return ServerSideSessionInterface(store, ttl_seconds=config.SESSION_TTL_SECONDS,
+                                      sweep_interval_seconds=config.SESSION_SWEEP_INTERVAL_SECONDS,
+                                      last_seen_batch_size=config.SESSION_LAST_SEEN_BATCH_SIZE)
+
+
+class MemorySessionStore():
+    """Sessions in a dict of the process, for a single worker deployment"""
+
+    def __init__(self):
+        self._sessions = {}  # session id -> [data, expires_at]
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, now: float):
+        """Returns session data string or None if there is no valid session with that id"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry and entry[1] > now:
+                return entry[0]
+
+    def save(self, session_id: str, data: str, expires_at: float):
+        with self._lock:
+            self._sessions[session_id] = [data, expires_at]
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def touch_many(self, expires_at_by_session_id: dict):
+        """Extends expiry time of many sessions at once"""
+        with self._lock:
+            for session_id, expires_at in expires_at_by_session_id.items():
+                entry = self._sessions.get(session_id)
+                if entry:
+                    entry[1] = max(entry[1], expires_at)
+
+    def delete_expired(self, now: float) -> int:
+        with self._lock:
+            expired_ids = [session_id for session_id, (_, expires_at) in self._sessions.items()
+                           if expires_at <= now]
+            for session_id in expired_ids:
+                del self._sessions[session_id]
+            return len(expired_ids)
+
+
+class SQLiteSessionStore():
+    """
+    Sessions in a SQLite table in WAL mode, shared by every worker process that
+    points to the same file. Readers don't wait for writers in WAL mode.
+    """
+
+    def __init__(self, db_path: str):
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        self._connection.execute('PRAGMA synchronous = NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'id TEXT PRIMARY KEY, data TEXT, expires_at REAL)')
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)')
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, now: float):
+        """Same as MemorySessionStore.get"""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT data FROM sessions WHERE id = ? AND expires_at > ?',
+                (session_id, now)).fetchone()
+        return row[0] if row else None
+
+    def save(self, session_id: str, data: str, expires_at: float):
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)',
+                (session_id, data, expires_at))
+
+    def delete(self, session_id: str):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+
+    def touch_many(self, expires_at_by_session_id: dict):
+        """Extends expiry time of many sessions in one transaction"""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'UPDATE sessions SET expires_at = MAX(expires_at, ?) WHERE id = ?',
+                [(expires_at, session_id)
+                 for session_id, expires_at in expires_at_by_session_id.items()])
+
+    def delete_expired(self, now: float) -> int:
+        with self._lock, self._connection:
+            return self._connection.execute(
+                'DELETE FROM sessions WHERE expires_at <= ?', (now,)).rowcount
+
+    def close(self):
+        self._connection.close()
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session data kept in the store, the cookie holds only the random session id"""
+
+    def __init__(self, initial=None, session_id=None, new=False):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.session_id = session_id
+        self.new = new
+        self.modified = False
+        self.opened_user_id = self.get('user_id')
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Flask session interface that keeps session data in a session store.
+
+    Session expires ttl_seconds after it was last seen. Requests that don't
+    change the session only record the last seen time in memory, these times
+    are written to the store in one batch every sweep_interval_seconds or when
+    last_seen_batch_size of them are waiting. The same background thread deletes
+    expired sessions. Clearing the session (logout) deletes it from the store
+    at once, so the old cookie is not accepted by any worker. When the logged
+    in user changes (login) the session gets a new id and the old one is
+    deleted, so an id known before the login (session fixation) is useless.
+    """
+
+    def __init__(self, store, ttl_seconds=7 * 24 * 3600, sweep_interval_seconds=60,
+                 last_seen_batch_size=100):
+        self._store = store
+        self._ttl_seconds = ttl_seconds
+        self._sweep_interval_seconds = sweep_interval_seconds
+        self._last_seen_batch_size = last_seen_batch_size
+        self._pending_touches = {}  # session id -> new expires_at
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    def open_session(self, app, request):
+        self._start_sweeper()
+        session_id = request.cookies.get(self.get_cookie_name(app))
+        if session_id:
+            data = self._store.get(session_id, time.time())
+            if data is not None:
+                return ServerSideSession(session_json_serializer.loads(data), session_id)
+        return ServerSideSession(session_id=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        cookie_name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                # session was cleared, e.g. on logout
+                with self._lock:
+                    self._pending_touches.pop(session.session_id, None)
+                self._store.delete(session.session_id)
+                response.delete_cookie(cookie_name, domain=domain, path=path)
+            return
+
+        if session.get('user_id') != session.opened_user_id:
+            self._regenerate_id(session)
+
+        expires_at = time.time() + self._ttl_seconds
+        if session.modified or session.new:
+            self._store.save(session.session_id, session_json_serializer.dumps(dict(session)),
+                             expires_at)
+        else:
+            self._record_last_seen(session.session_id, expires_at)
+
+        if session.modified or session.new or self.should_set_cookie(app, session):
+            response.set_cookie(cookie_name, session.session_id,
+                                expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
+
+    def flush_last_seen(self):
+        """Writes waiting last seen times to the store"""
+        with self._lock:
+            pending_touches, self._pending_touches = self._pending_touches, {}
+        if pending_touches:
+            self._store.touch_many(pending_touches)
+
+    def sweep(self) -> int:
+        """Flushes last seen times and deletes expired sessions, returns number of deleted"""
+        self.flush_last_seen()
+        return self._store.delete_expired(time.time())
+
+    # -------------- inner logic methods--------------------------------
+
+    def _regenerate_id(self, session: ServerSideSession):
+        """Moves the session to a new random id, data under the old id is deleted"""
+        if not session.new:
+            with self._lock:
+                self._pending_touches.pop(session.session_id, None)
+            self._store.delete(session.session_id)
+        session.session_id = secrets.token_urlsafe(32)
+        session.new = True
+        session.opened_user_id = session.get('user_id')
+
+    def _record_last_seen(self, session_id: str, expires_at: float):
+        with self._lock:
+            self._pending_touches[session_id] = expires_at
+            is_batch_full = len(self._pending_touches) >= self._last_seen_batch_size
+        if is_batch_full:
+            self.flush_last_seen()
+
+    def _start_sweeper(self):
+        """Starts the background sweeper thread on the first request of the process"""
+        if self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_forever, daemon=True,
+                                                 name='session-sweeper')
+                self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self._sweep_interval_seconds)
+            try:
+                self.sweep()
+            except Exception:
+                # store is busy or closed, next sweep will try again
+                logger.exception("Session store sweep failed")
@@ -1,41 +1,93 @@
 import config
 from .data_manager_interface import DataManagerInterface
-from .data_models_for_sql import Movie, User, Review, db
-import bcrypt
+from .data_models_for_sql import Movie, User, Review, DataVersion, db, user_movie_association, \
+    movies_search_index
+from .sql_migrations import upgrade_database, recount_movie_counters, SCHEMA_VERSION
+from .password_hasher import PasswordHasher, get_default_hasher
+from .sqlite_profile import get_engine_options, apply_pragmas, apply_read_only_pragmas, \
+    report_pragmas
+from .read_replica import read_only, get_read_bind, copy_database
+from .library_archive import ArchiveError
+from contextlib import contextmanager
 from datetime import datetime
-import shutil
+from flask import g, session, has_request_context
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import selectinload
+import os
+import re
+import time
 
 AVATAR_DEFAULT_NAME = 'avatar_default.png'
+IMDB_ID_PATTERN = re.compile(r'tt\d{7,}', re.IGNORECASE)  # movie ids are imdb ids
+# data version of the last change made by the client, kept in flask session and g
+WRITTEN_DATA_VERSION_KEY = 'written_data_version'
+# tables and columns of library archives, parents before children
+LIBRARY_TABLES = {
+    'users': (User.__table__, ('id', 'name', 'password', 'avatar')),
+    'movies': (Movie.__table__, ('id', 'name', 'director', 'year', 'rating', 'imdb_link',
+                                 'image_link')),
+    'user_movie': (user_movie_association, ('user_id', 'movie_id')),
+    'reviews': (Review.__table__, ('id', 'user_id', 'movie_id', 'review')),
+}
 
 
 class SQLiteDataManager(DataManagerInterface):
     ENCODING_TYPE = 'utf-8'
 
-    def __init__(self, name_of_db, app):
+    def __init__(self, name_of_db, app, password_hasher: PasswordHasher = None,
+                 read_replica_name=None):
+        self._password_hasher = password_hasher or get_default_hasher()
+        read_replica_name = read_replica_name or config.READ_REPLICA_DB_FILE_NAME
         app.config['SQLALCHEMY_DATABASE_URI'] = config.get_absolute_db_uri(name_of_db)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = get_engine_options()
         db.init_app(app)
-
-    def get_user_movies(self, user_id):
-        """return list of movies(dict) if user id found. otherwise None"""
+        # engine of the read replica file, None if reads go to the primary
+        self.read_replica_engine = None
+        if read_replica_name:
+            self.read_replica_engine = create_engine(
+                config.get_absolute_db_uri(read_replica_name), **get_engine_options())
+            event.listen(self.read_replica_engine, 'connect', apply_read_only_pragmas)
+        with app.app_context():
+            # WAL journal, page cache, foreign keys... on every connection of the pool
+            event.listen(db.engine, 'connect', apply_pragmas)
+
+    def upgrade_db(self) -> int:
+        """
+        Upgrades schema of the db file (indexes, constraints...) if it is outdated and
+        logs the effective pragmas. Runs before the first request of the app or with
+        'flask upgrade-db', creating the data manager doesnt touch the db file.
+        Returns number of executed migrations.
+        """
+        migrations_count = upgrade_database(db.engine)
+        with db.engine.connect() as connection:
+            report_pragmas(connection)
+        # replica must have the schema of the primary
+        replica_engine = self.read_replica_engine
+        if replica_engine and (migrations_count or
+                               not os.path.exists(replica_engine.url.database)):
+            copy_database(db.engine.url.database, replica_engine.url.database)
+        return migrations_count
+
+    @read_only
+    def get_user_movies(self, user_id, limit=None, after=None):
+        """
+        return list of movies(dict) if user id found. otherwise raises ValueError.
+        Movies are ordered by id, limit and after (id of the last movie of previous page)
+        return one page of the list.
+        """
         user_id = int(user_id)
-        user = db.session.execute(db.select(User).filter_by(id=user_id)).scalar_one_or_none()
-        if not user:
+        if not self._user_exists(user_id):
             raise ValueError(f"User with id {user_id}, doesnt exist")
 
-        user_movies_to_return = [{
-            'id': movie.id,
-            'name': movie.name,
-            'director': movie.director,
-            'year': movie.year,
-            'rating': movie.rating,
-            'imdb_link': movie.imdb_link,
-            'image_link': movie.image_link
-        } for movie in user.movies]
-
-        return user_movies_to_return
+        return [self._fetch_movie_data(movie)
+                for movie in self._get_user_movies_page(user_id, limit, after)]
 
-    def get_all_users(self):
-        users = db.session.execute(db.select(User)).scalars()
+    @read_only
+    def get_all_users(self, limit=None, after=None):
+        """Returns users ordered by id, limit and after (last user id of previous page) for paging"""
+        users = db.session.execute(
+            self._page(db.select(User.id, User.name), User.id, limit, self._to_int(after)))
 
         users_for_return = []
         for user in users:
@@ -46,6 +98,44 @@ class SQLiteDataManager(DataManagerInterface):
             users_for_return.append(new_user)
         return users_for_return
 
+    @read_only
+    def iter_all_users(self, batch_size=None):
+        """Returns iterator over all users (dict) ordered by id, fetching batch_size rows at a time"""
+        query = db.select(User.id, User.name).order_by(User.id)
+        return ({'id': user.id, 'name': user.name} for user in self._iter_rows(query, batch_size))
+
+    @read_only
+    def iter_user_movies(self, user_id, batch_size=None):
+        """
+        Returns iterator over all movies (dict) of user ordered by id, fetching batch_size
+        rows from db at a time. Raises ValueError right away if user doesnt exist.
+        """
+        user_id = int(user_id)
+        if not self._user_exists(user_id):
+            raise ValueError(f"User with id {user_id}, doesnt exist")
+
+        # plain rows instead of Movie instances, nothing is kept in the session identity map
+        query = db.select(Movie.id, Movie.name, Movie.director, Movie.year, Movie.rating,
+                          Movie.imdb_link, Movie.image_link).join(
+            user_movie_association, user_movie_association.c.movie_id == Movie.id
+        ).where(user_movie_association.c.user_id == user_id).order_by(
+            user_movie_association.c.movie_id)
+        return (dict(movie._mapping) for movie in self._iter_rows(query, batch_size))
+
+    @read_only
+    def iter_reviews_for_movie(self, movie_id, batch_size=None):
+        """
+        Returns iterator over all reviews (dict) of movie ordered by id, fetching batch_size
+        rows from db at a time. Raises ValueError right away if movie doesnt exist.
+        """
+        if not db.session.execute(db.select(db.exists().where(Movie.id == movie_id))).scalar():
+            raise ValueError(f"There is no movie with ID: {movie_id}")
+
+        query = db.select(Review.id, User.name, Review.review).select_from(Review).join(
+            Review.user).filter(Review.movie_id == movie_id).order_by(Review.id)
+        return ({'id': review_id, 'user_name': user_name, 'review': review_text}
+                for review_id, user_name, review_text in self._iter_rows(query, batch_size))
+
     def add_user(self, new_user_name: str, password=None, avatar_filename=None):
         """
         Adds a user to the sqlite db. User name must be a string and not empty.
@@ -74,64 +164,151 @@ class SQLiteDataManager(DataManagerInterface):
             new_user.password = self._hash_and_encode_password(password)
             new_user.avatar = AVATAR_DEFAULT_NAME
 
+        new_user.revision = self._bump_data_version()
         db.session.add(new_user)
         db.session.commit()
 
     def delete_user(self, user_id: int):
-        user: User = db.session.execute(db.select(User).filter_by(id=user_id)).scalar_one_or_none()
-        if not user:
+        """Deletes user with the user's reviews and library, movies nobody else got are deleted too"""
+        if not self.delete_users([user_id]):
             raise ValueError(f"User with that id: {user_id} doesnt exist.")
 
-        # running on user movies and deleting movie if it's not associated with other movies
-        for movie in user.movies:
-            if len(movie.users) == 1:
-                db.session.delete(movie)
-        # deleting users reviews
-        for review in user.reviews:
-            db.session.delete(review)
-
-        db.session.delete(user)
+    def delete_users(self, user_ids: list) -> list:
+        """
+        Deletes many users with their reviews and libraries in one transaction with
+        set based statements, the number of statements doesnt depend on the number of
+        users or movies. Movies left without owners are deleted with their reviews.
+        Returns ids of deleted users, ids of not existing users are ignored.
+        """
+        user_ids = db.session.execute(
+            db.select(User.id).where(User.id.in_(set(user_ids)))).scalars().all()
+        if not user_ids:
+            return []
+
+        revision = self._bump_data_version()
+        user_reviews = db.select(Review.movie_id).where(Review.user_id.in_(user_ids))
+        user_movies = db.select(user_movie_association.c.movie_id).where(
+            user_movie_association.c.user_id.in_(user_ids))
+
+        # counters and revisions of movies that lose reviews or owners
+        db.session.execute(db.update(Movie).where(Movie.id.in_(user_reviews)).values(
+            reviews_count=Movie.reviews_count - db.select(db.func.count()).where(
+                Review.movie_id == Movie.id, Review.user_id.in_(user_ids)).scalar_subquery(),
+            revision=revision))
+        db.session.execute(db.update(Movie).where(Movie.id.in_(user_movies)).values(
+            owners_count=Movie.owners_count - db.select(db.func.count()).where(
+                user_movie_association.c.movie_id == Movie.id,
+                user_movie_association.c.user_id.in_(user_ids)).scalar_subquery()))
+
+        db.session.execute(db.delete(Review).where(Review.user_id.in_(user_ids)))
+        db.session.execute(db.delete(user_movie_association).where(
+            user_movie_association.c.user_id.in_(user_ids)))
+
+        # orphaned movies: found by owners_count index, anti-join guards against wrong counter
+        orphaned_movies = db.select(Movie.id).where(
+            Movie.owners_count <= 0,
+            ~db.exists().where(user_movie_association.c.movie_id == Movie.id))
+        db.session.execute(db.delete(Review).where(Review.movie_id.in_(orphaned_movies)))
+        db.session.execute(db.delete(Movie).where(Movie.id.in_(orphaned_movies)))
+
+        db.session.execute(db.delete(User).where(User.id.in_(user_ids)))
         db.session.commit()
+        return user_ids
 
     def add_movie_to_user(self, user_id: int, movie_data: dict):
         """if the movies doesnt exist in db - adds a new movie and associate it with user."""
-        user = db.session.execute(db.select(User).filter_by(id=user_id)).scalar_one_or_none()
-        if user is None:
+        if not self._user_exists(user_id):
             raise ValueError(f"User with that ID: {user_id},doesnt exist")
 
-        # checking if the movie exist in db, if not - adding it to db.
-        movie = db.session.execute(
-            db.select(Movie).filter_by(id=movie_data['id'])).scalar_one_or_none()
-        if not movie:
-            movie = Movie(id=movie_data['id'], name=movie_data['name'],
-                          director=movie_data['director'], year=movie_data['year'],
-                          rating=movie_data['rating'], imdb_link=movie_data['imdb_link'],
-                          image_link=movie_data['image_link']
-                          )
-            db.session.add(movie)
+        revision = self._bump_data_version()
+        # adding the movie to db if it doesnt exist yet, single insert-or-ignore statement
+        db.session.execute(sqlite_insert(Movie).values(
+            id=movie_data['id'], name=movie_data['name'],
+            director=movie_data['director'], year=movie_data['year'],
+            rating=movie_data['rating'], imdb_link=movie_data['imdb_link'],
+            image_link=movie_data['image_link'], revision=revision
+        ).on_conflict_do_nothing())
+
+        # Adding a relationship to user_movie_association, ignored if user already got the movie
+        result = db.session.execute(sqlite_insert(user_movie_association).values(
+            user_id=user_id, movie_id=movie_data['id']).on_conflict_do_nothing())
+        if result.rowcount:
+            self._add_to_counter(Movie.owners_count, 1, Movie.id == movie_data['id'])
+        self._set_revision(User, revision, User.id == user_id)
+
+        db.session.commit()
+
+    def add_movies_to_user(self, user_id: int, movies_data: list) -> set:
+        """
+        Adds many movies to user in a single transaction. Movies that doesnt exist in db
+        are created, movies the user already got are skipped.
+        Returns set of movie ids that were newly added to the user's collection.
+        """
+        if not self._user_exists(user_id):
+            raise ValueError(f"User with that ID: {user_id},doesnt exist")
 
-        # Adding a relationship to user_movie_association
-        if user not in movie.users:
-            movie.users.append(user)
+        # dedupe passed movies by id, keeping the first one
+        movies_by_id = {}
+        for movie_data in movies_data:
+            movies_by_id.setdefault(movie_data['id'], movie_data)
+        movie_ids = list(movies_by_id)
+        if not movie_ids:
+            return set()
+
+        # first write takes the db write lock, movies of the user read after it can't change
+        # until the commit, movies added meanwhile by other users are ignored by the insert
+        revision = self._bump_data_version()
+        user_movie_ids = set(db.session.execute(
+            db.select(user_movie_association.c.movie_id).where(
+                user_movie_association.c.user_id == user_id,
+                user_movie_association.c.movie_id.in_(movie_ids))).scalars())
+        db.session.execute(sqlite_insert(Movie).on_conflict_do_nothing(index_elements=['id']), [
+            {'id': movie_data['id'], 'name': movie_data['name'],
+             'director': movie_data['director'], 'year': movie_data['year'],
+             'rating': movie_data['rating'], 'imdb_link': movie_data['imdb_link'],
+             'image_link': movie_data['image_link'], 'revision': revision}
+            for movie_data in movies_by_id.values()])
+
+        added_movie_ids = [movie_id for movie_id in movie_ids if movie_id not in user_movie_ids]
+        if added_movie_ids:
+            db.session.execute(sqlite_insert(user_movie_association).on_conflict_do_nothing(), [
+                {'user_id': user_id, 'movie_id': movie_id} for movie_id in added_movie_ids])
+            self._add_to_counter(Movie.owners_count, 1, Movie.id.in_(added_movie_ids))
+            self._set_revision(User, revision, User.id == user_id)
 
         db.session.commit()
+        return set(added_movie_ids)
 
-    def get_user_by_id(self, user_id: int) -> dict:
+    @read_only
+    def get_user_by_id(self, user_id: int, movies_limit=None, movies_after=None) -> dict:
         """
         Retrieves a user's data based on the provided user_id.
-        Returns None if there is no user with that id
+        Returns None if there is no user with that id.
+        movies_limit and movies_after (last movie id of previous page) return one page of movies.
         """
-        user = db.session.execute(db.select(User).filter_by(id=user_id)).scalar_one_or_none()
+        user = db.session.get(User, user_id)
 
         if user:
             user_to_return = {
                 'id': user.id,
                 'name': user.name,
-                'movies': [self._fetch_movie_data(movie) for movie in user.movies]
+                'movies': [self._fetch_movie_data(movie) for movie in
+                           self._get_user_movies_page(user.id, movies_limit, movies_after)]
             }
 
             return user_to_return
 
+    @read_only
+    def get_user_profile(self, user_id: int) -> dict:
+        """
+        Returns {'id', 'name', 'avatar'} of the user, without the movies and the password hash.
+        Returns None if there is no user with that id.
+        """
+        row = db.session.execute(
+            db.select(User.id, User.name, User.avatar).filter_by(id=user_id)).one_or_none()
+        if row:
+            return {'id': row.id, 'name': row.name, 'avatar': row.avatar}
+
     def delete_movie_of_user(self, user_id: int, movie_id: str):
         """
         Deletes a movie from a user's collection and also removes the movie if there are no
@@ -143,40 +320,44 @@ class SQLiteDataManager(DataManagerInterface):
         are deleted. If there are no remaining users associated with the movie, the movie itself
         is deleted from the database.
         """
-        # getting movie and user instances
-        user = db.session.execute(db.select(User).filter_by(id=user_id)).scalar_one_or_none()
-        movie = db.session.execute(db.select(Movie).filter_by(id=movie_id)).scalar_one_or_none()
+        # getting movie instance
+        movie = db.session.get(Movie, movie_id)
 
         # data validation
-        if not user:
+        if not self._user_exists(user_id):
             raise ValueError(f"User with that id: {user_id} doesnt exist.")
         if not movie:
             raise ValueError(f"Movie with that id: {movie_id} doesnt exist.")
-        if movie not in user.movies:
+        if not self._user_has_movie(user_id, movie_id):
             raise ValueError(f"This user doesnt got movie with ID: {movie_id} in he's collection")
+        deleted_movie_data = self._fetch_movie_data(movie)
+        revision = self._bump_data_version()
+        self._set_revision(User, revision, User.id == user_id)
+        self._set_revision(Movie, revision, Movie.id == movie_id)
 
         # removing reviews of movie
-        for review in movie.reviews:
-            db.session.delete(review)
-
-        # removing the movie from user.movies and if the movies doesnt have any users associated, remove the movie too
-        user.movies.remove(movie)
-        if len(movie.users) == 0:
-            db.session.delete(movie)
+        db.session.execute(db.delete(Review).where(Review.movie_id == movie_id))
+
+        # removing the movie from user movies and if the movies doesnt have any users associated, remove the movie too
+        db.session.execute(db.delete(user_movie_association).where(
+            user_movie_association.c.user_id == user_id,
+            user_movie_association.c.movie_id == movie_id))
+        db.session.execute(db.update(Movie).where(Movie.id == movie_id).values(
+            owners_count=Movie.owners_count - 1, reviews_count=0))
+        db.session.execute(db.delete(Movie).where(Movie.id == movie_id, Movie.owners_count <= 0))
         db.session.commit()
-        return self._fetch_movie_data(movie)
+        return deleted_movie_data
 
+    @read_only
     def get_user_movie(self, user_id: int, movie_id: str):
-        movie: Movie = db.session.execute(
-            db.select(Movie).filter_by(id=movie_id)).scalar_one_or_none()
-        user: User = db.session.execute(db.select(User).filter_by(id=user_id)).scalar_one_or_none()
+        movie: Movie = db.session.get(Movie, movie_id)
 
         # data validation
         if not movie:
             raise ValueError(f"Movie with that id: {movie_id} doesnt exist.")
-        if not user:
+        if not self._user_exists(user_id):
             raise ValueError(f"User with that id: {user_id} doesnt exist.")
-        if movie not in user.movies:
+        if not self._user_has_movie(user_id, movie_id):
             raise ValueError(f"User doesnt have that movie.")
 
         return self._fetch_movie_data(movie)
@@ -199,10 +380,17 @@ class SQLiteDataManager(DataManagerInterface):
         movie.director = movie_for_update['director']
         movie.year = movie_for_update['year']
         movie.rating = str(float(movie_for_update['rating']))
+        # movie data is part of movies lists of all its owners
+        movie.revision = self._bump_data_version()
+        self._set_revision(User, movie.revision, self._owners_of_movie(movie_id))
         db.session.commit()
 
-    def get_all_public_users(self):
-        users = db.session.execute(db.select(User).filter_by(password=None)).scalars()
+    @read_only
+    def get_all_public_users(self, limit=None, after=None):
+        """Returns users without password ordered by id, limit and after (last user id) for paging"""
+        users = db.session.execute(self._page(
+            db.select(User.id, User.name).filter_by(password=None), User.id, limit,
+            self._to_int(after)))
 
         users_for_return = []
         for user in users:
@@ -215,7 +403,8 @@ class SQLiteDataManager(DataManagerInterface):
 
     def get_user_by_name(self, user_name_to_search: str):
         user: User = db.session.execute(
-            db.select(User).filter_by(name=user_name_to_search)).scalar_one_or_none()
+            db.select(User).filter_by(name=user_name_to_search).options(selectinload(User.movies))
+        ).scalar_one_or_none()
         if user and user.password:
             user_to_return = {
                 'id': user.id,
@@ -226,6 +415,12 @@ class SQLiteDataManager(DataManagerInterface):
             }
             return user_to_return
 
+    def get_user_id_by_name(self, user_name: str) -> int:
+        """Returns id of the user with that name read with the users name index, None if not found"""
+        return db.session.execute(
+            db.select(User.id).filter_by(name=user_name)).scalar_one_or_none()
+
+    @read_only
     def get_users_movie_review(self, user_id: int, movie_id: str) -> str:
         """Returns users review on specific film, if review doesnt exist, returns '' """
         review = db.session.execute(
@@ -250,6 +445,7 @@ class SQLiteDataManager(DataManagerInterface):
             db.select(Review).filter_by(user_id=users_id, movie_id=movie_id)).scalar_one_or_none()
 
         # update existing review
+        movie.revision = self._bump_data_version()
         if review:
             review.review = review_text_to_update
             db.session.commit()
@@ -258,10 +454,16 @@ class SQLiteDataManager(DataManagerInterface):
         # creating new review case when there was no review instance for specific user and movie
         new_review = Review(review=review_text_to_update, movie_id=movie_id, user_id=users_id)
         db.session.add(new_review)
+        self._add_to_counter(Movie.reviews_count, 1, Movie.id == movie_id)
         db.session.commit()
 
+    @read_only
     def get_movie_by_id(self, movie_id):
-        movie = db.session.execute(db.select(Movie).filter_by(id=movie_id)).scalar_one_or_none()
+        """Returns movie instance with its reviews and their users already loaded"""
+        movie = db.session.execute(
+            db.select(Movie).filter_by(id=movie_id).options(
+                selectinload(Movie.reviews).joinedload(Review.user))
+        ).scalar_one_or_none()
         return movie
 
     def delete_review(self, user_id: int, movie_id: str) -> bool:
@@ -273,13 +475,11 @@ class SQLiteDataManager(DataManagerInterface):
         """
 
         # VALIDATION
-        user: User = db.session.execute(db.select(User).filter_by(id=user_id)).scalar_one_or_none()
-        if user is None:
+        if not self._user_exists(user_id):
             raise ValueError(f"there is no user with ID: {user_id}.")
-        movie = db.session.execute(db.select(Movie).filter_by(id=movie_id)).scalar_one_or_none()
-        if movie is None:
+        if db.session.get(Movie, movie_id) is None:
             raise ValueError(f"there is no movie with ID: {movie_id}.")
-        if movie not in user.movies:
+        if not self._user_has_movie(user_id, movie_id):
             raise ValueError(f"User with ID:{user_id} doesnt have movie with ID:{movie_id}")
         review = db.session.execute(
             db.select(Review).filter_by(movie_id=movie_id, user_id=user_id)).scalar_one_or_none()
@@ -287,35 +487,406 @@ class SQLiteDataManager(DataManagerInterface):
             raise ValueError("there is no review for that movie from that user")
 
         db.session.delete(review)
+        self._add_to_counter(Movie.reviews_count, -1, Movie.id == movie_id)
+        self._set_revision(Movie, self._bump_data_version(), Movie.id == movie_id)
         db.session.commit()
 
 
-    def get_all_reviews_for_movie(self, movie_id):
+    @read_only
+    def get_all_reviews_for_movie(self, movie_id, limit=None, after=None):
         """
-        Retrieves all reviews for a movie by its ID.
+        Retrieves all reviews for a movie by its ID, ordered by review id.
 
         :param movie_id: The ID of the movie.
+        :param limit: Max number of reviews to return.
+        :param after: Review id of the last review of previous page.
         :return: A list of dictionaries containing reviews.
         :raises ValueError: If there is no movie in db with movie_id.
         """
         # Validation
-        movie: Movie = db.session.execute(db.select(Movie).filter_by(id=movie_id)).scalar_one_or_none()
-        if movie is None:
+        if not db.session.execute(db.select(db.exists().where(Movie.id == movie_id))).scalar():
             raise ValueError(f"There is no movie with ID: {movie_id}")
 
-        # creating list with dict of reviews for return
-        reviews: list = db.session.execute(db.select(Review).filter_by(movie_id=movie_id)).scalars()
+        # creating list with dict of reviews for return, user names are joined in the same query
+        reviews = db.session.execute(self._page(
+            db.select(Review.id, User.name, Review.review).select_from(Review).join(Review.user)
+            .filter(Review.movie_id == movie_id), Review.id, limit, self._to_int(after)))
         reviews_to_return = []
-        for review in reviews:
-            reviews_to_return.append({'user_name': review.user.name, "review": review.review})
+        for review_id, user_name, review_text in reviews:
+            reviews_to_return.append({'id': review_id, 'user_name': user_name,
+                                      "review": review_text})
 
         return reviews_to_return
 
-    def restore_db_to_default(self):
-        """Replace current sqlite db with default one """
-        db.session.remove()  # This will close the session
-        db.engine.dispose()
-        shutil.copy(config.get_absolute_path_default_db(), config.get_absolute_path_current_db())
+    @read_only
+    def search_movies(self, search_text: str, limit=None) -> list:
+        """
+        Searches movies catalog by name, director and year with the full text index.
+        Every word of search_text must match the beginning of a word of the movie,
+        best matches (name matches weigh most) are returned first.
+        """
+        words = re.findall(r'\w+', search_text or '')
+        if not words:
+            return []
+        # every word is quoted so fts query syntax in user input has no effect
+        match_query = ' '.join(f'"{word}"*' for word in words)
+        movies = db.session.execute(
+            db.select(Movie).join(movies_search_index,
+                                  movies_search_index.c.rowid == db.literal_column('movies.rowid'))
+            .where(db.text('movies_fts MATCH :match_query'))
+            .order_by(db.text('bm25(movies_fts, 10.0, 2.0, 1.0)'))
+            .limit(limit or config.DEFAULT_PAGE_SIZE),
+            {'match_query': match_query}).scalars()
+        return [self._fetch_movie_data(movie) for movie in movies]
+
+    @read_only
+    def find_movie(self, search_text: str):
+        """
+        Finds movie in the local catalog by imdb id or by exact (case insensitive)
+        name, read with the ix_movies_name_nocase index. Returns movie dict or None.
+        """
+        search_text = ' '.join((search_text or '').split())
+        if IMDB_ID_PATTERN.fullmatch(search_text):
+            movie = db.session.get(Movie, search_text.lower())
+        else:
+            movie = db.session.execute(db.select(Movie).where(
+                Movie.name.collate('NOCASE') == search_text).limit(1)).scalar_one_or_none()
+        return self._fetch_movie_data(movie) if movie else None
+
+    @read_only
+    def get_movie_titles(self, changed_after=None) -> list:
+        """
+        Returns id, name and year of movies created or changed after the data
+        version changed_after (all movies for None), read with the ix_movies_revision index.
+        """
+        query = db.select(Movie.id, Movie.name, Movie.year)
+        if changed_after is not None:
+            query = query.where(Movie.revision > changed_after)
+        rows = db.session.execute(query)
+        return [{'id': movie_id, 'name': name, 'year': year} for movie_id, name, year in rows]
+
+    @read_only
+    def get_movies_count(self) -> int:
+        """Returns number of movies in db"""
+        return db.session.execute(db.select(db.func.count()).select_from(Movie)).scalar()
+
+    @read_only
+    def get_most_collected_movies(self, limit=None) -> list:
+        """
+        Returns movies with the most owners first, each with 'owners_count' and
+        'reviews_count'. Counters are kept on movie rows, so the query walks the
+        ix_movies_owners_count index instead of counting user_movie rows.
+        """
+        movies = db.session.execute(
+            db.select(Movie).order_by(Movie.owners_count.desc(), Movie.id).limit(
+                limit or config.DEFAULT_PAGE_SIZE)).scalars()
+        return [dict(self._fetch_movie_data(movie), owners_count=movie.owners_count,
+                     reviews_count=movie.reviews_count) for movie in movies]
+
+    def repair_movie_counters(self) -> int:
+        """
+        Recomputes owners_count and reviews_count of all movies from user_movie
+        and reviews tables. Returns number of movies which counters were wrong.
+        """
+        repaired_count = recount_movie_counters(db.session.connection())
+        if repaired_count:
+            self._bump_data_version()
+        db.session.commit()
+        return repaired_count
+
+    @read_only
+    def get_user_revision(self, user_id) -> int:
+        """
+        Returns revision of the user, it changes with every change of the user's
+        movies list. Returns None if there is no user with that id.
+        """
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        return db.session.execute(
+            db.select(User.revision).filter_by(id=user_id)).scalar_one_or_none()
+
+    @read_only
+    def get_movie_revision(self, movie_id: str) -> int:
+        """
+        Returns revision of the movie, it changes with every change of the movie
+        data or its reviews. Returns None if there is no movie with that id.
+        """
+        return db.session.execute(
+            db.select(Movie.revision).filter_by(id=movie_id)).scalar_one_or_none()
+
+    @read_only
+    def get_data_version(self) -> int:
+        """
+        Returns data version counter, it is increased by every change of users,
+        movies or reviews, so anything cached with older version is stale.
+        """
+        return db.session.execute(
+            db.select(DataVersion.version).filter_by(id=1)).scalar_one_or_none() or 0
+
+    @contextmanager
+    def export_library(self, batch_size=None):
+        """
+        Context manager giving (header, batches) of the whole library for
+        library_archive.write_archive: with manager.export_library() as (header, batches).
+        Batches of batch_size rows of every table of LIBRARY_TABLES are read lazily,
+        all of them in one read transaction, so from the same snapshot of the db.
+        """
+        batch_size = batch_size or config.LIBRARY_ARCHIVE_BATCH_SIZE
+        with (self._get_read_engine() or db.engine).connect() as connection:
+            # pysqlite doesnt begin a transaction for selects, without BEGIN every
+            # query would see the commits made after the previous one
+            connection.exec_driver_sql('BEGIN')
+            header = {'schema_version': SCHEMA_VERSION,
+                      'data_version': connection.execute(
+                          db.select(DataVersion.version).filter_by(id=1)).scalar() or 0}
+
+            def iter_batches():
+                for table_name, (table, column_names) in LIBRARY_TABLES.items():
+                    query = db.select(*(table.c[name] for name in column_names)).order_by(
+                        *table.primary_key.columns)
+                    result = connection.execute(query.execution_options(yield_per=batch_size))
+                    for rows in result.partitions():
+                        yield table_name, column_names, [tuple(row) for row in rows]
+
+            yield header, iter_batches()
+
+    def import_library(self, header: dict, batches) -> dict:
+        """
+        Replaces the whole library with header and batches of library_archive.read_archive
+        in one transaction, every batch is a single executemany insert. Nothing is changed
+        if the archive is invalid or made by other schema version. Returns number of
+        imported rows of every table.
+        """
+        if header.get('schema_version') != SCHEMA_VERSION:
+            raise ArchiveError(f"Library archive of schema version {header.get('schema_version')} "
+                               f"cannot be imported to schema version {SCHEMA_VERSION}")
+        try:
+            revision = self._bump_data_version()
+            # children before parents, foreign keys are enforced
+            for table, _ in reversed(LIBRARY_TABLES.values()):
+                db.session.execute(db.delete(table))
+
+            counts = dict.fromkeys(LIBRARY_TABLES, 0)
+            for table_name, column_names, rows in batches:
+                if table_name not in LIBRARY_TABLES:
+                    raise ArchiveError(f"Unknown table in library archive: {table_name}")
+                table, allowed_column_names = LIBRARY_TABLES[table_name]
+                if not set(column_names) <= set(allowed_column_names):
+                    raise ArchiveError(f"Unknown columns of {table_name} in library archive")
+                values = [dict(zip(column_names, row)) for row in rows]
+                if 'revision' in table.c:
+                    for row_values in values:
+                        row_values['revision'] = revision
+                if values:
+                    db.session.execute(table.insert(), values)
+                counts[table_name] += len(values)
+
+            recount_movie_counters(db.session.connection())
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return counts
+
+    def refresh_read_replica(self):
+        """Copies the db to the read replica file. Returns data version of the copy"""
+        if self.read_replica_engine is None:
+            raise ValueError("Read replica is not configured")
+        db.session.commit()  # the copy waits for write transactions of the session
+        copy_database(db.engine.url.database, self.read_replica_engine.url.database)
+        return self._read_data_version(bind=self.read_replica_engine)
+
+    def restore_db_to_default(self) -> dict:
+        """
+        Replaces data of the current db with the default db while the app keeps serving.
+        The default db is copied and upgraded in a temp file first, then its rows are
+        written into the live db in one BEGIN IMMEDIATE transaction: in-flight reads
+        finish on their snapshot, writers of all workers wait for the lock, no connection
+        is closed. Returns {'data_version': .., 'duration_ms': ..}
+        """
+        started = time.perf_counter()
+        db.session.remove()  # ends transactions of this session, the restore needs the write lock
+        restore_db_path = db.engine.url.database + '.restore'
+        try:
+            copy_database(config.get_absolute_path_default_db(), restore_db_path)
+            restore_engine = create_engine('sqlite:///' + restore_db_path)
+            try:
+                upgrade_database(restore_engine)
+            finally:
+                restore_engine.dispose()
+            data_version = self._replace_data(restore_db_path)
+        finally:
+            if os.path.exists(restore_db_path):
+                os.remove(restore_db_path)
+
+        self._prewarm()
+        if self.read_replica_engine is not None:
+            self.refresh_read_replica()
+        return {'data_version': data_version,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+    @staticmethod
+    def _replace_data(source_db_path: str) -> int:
+        """
+        Replaces rows of the db tables with rows of the source db. Data version is read
+        and the rows are written under one write lock, so a change of other worker can't
+        get between them. Returns data version of the replaced data.
+        """
+        with db.engine.connect() as connection:
+            # attaching works only outside of a transaction
+            connection.exec_driver_sql('ATTACH DATABASE ? AS restore', (source_db_path,))
+            try:
+                connection.exec_driver_sql('BEGIN IMMEDIATE')
+                # restored data must not reuse a version that was already seen with other data
+                data_version = (connection.execute(
+                    db.select(DataVersion.version).filter_by(id=1)).scalar() or 0) + 1
+                tables = [table for table in db.metadata.sorted_tables
+                          if table is not DataVersion.__table__]
+                for table in reversed(tables):
+                    connection.execute(table.delete())
+                for table in tables:
+                    column_names = [column.name for column in table.columns]
+                    # revisions start from the new version, caches keyed by them are fresh
+                    selected_columns = ['?' if column_name == 'revision' else column_name
+                                        for column_name in column_names]
+                    connection.exec_driver_sql(
+                        f'INSERT INTO main.{table.name} ({", ".join(column_names)}) '
+                        f'SELECT {", ".join(selected_columns)} FROM restore.{table.name}',
+                        (data_version,) * selected_columns.count('?'))
+                connection.execute(sqlite_insert(DataVersion).values(
+                    id=1, version=data_version).on_conflict_do_update(
+                    index_elements=[DataVersion.id], set_={'version': data_version}))
+                connection.commit()
+            finally:
+                connection.rollback()
+                connection.exec_driver_sql('DETACH DATABASE restore')
+        return data_version
+
+    def _bump_data_version(self) -> int:
+        """
+        Increases data version counter in the transaction of the change, returns new version.
+        The version is remembered as written by the client, so its next reads see the change.
+        """
+        db.session.execute(sqlite_insert(DataVersion).values(id=1, version=1).on_conflict_do_update(
+            index_elements=[DataVersion.id], set_={'version': DataVersion.version + 1}))
+        data_version = self._read_data_version()
+        if self.read_replica_engine is not None:
+            g.written_data_version = data_version
+            if has_request_context():
+                session[WRITTEN_DATA_VERSION_KEY] = data_version
+        return data_version
+
+    @staticmethod
+    def _prewarm():
+        """Reads every table of the db, so first requests after a restore find pages in cache"""
+        table_names = db.session.execute(db.text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN "
+            "('users', 'movies', 'user_movie', 'reviews')")).scalars().all()
+        for table_name in table_names:
+            # counting rows without an index walks every page of the table b-tree
+            db.session.execute(db.text(f'SELECT COUNT(*) FROM {table_name} NOT INDEXED'))
+        db.session.commit()
+
+    @staticmethod
+    def _read_data_version(bind=None) -> int:
+        """Returns data version of the primary db, or of the bind engine"""
+        return db.session.execute(db.select(DataVersion.version).filter_by(id=1),
+                                  bind_arguments={'bind': bind}).scalar_one_or_none() or 0
+
+    def _get_read_engine(self):
+        """
+        Returns the read replica engine if it got all changes made by the client
+        (read-your-writes), otherwise None so the primary is read.
+        """
+        if self.read_replica_engine is None:
+            return None
+        written_versions = [g.get('written_data_version')]
+        if has_request_context():
+            written_versions.append(session.get(WRITTEN_DATA_VERSION_KEY))
+        written_version = max((version for version in written_versions if version), default=0)
+
+        if written_version:
+            if self._read_data_version(bind=self.read_replica_engine) < written_version:
+                return None
+            # replica caught up, the client doesnt need the primary anymore
+            g.pop('written_data_version', None)
+            if has_request_context():
+                session.pop(WRITTEN_DATA_VERSION_KEY, None)
+        return self.read_replica_engine
+
+    @staticmethod
+    def _set_revision(model, revision: int, *conditions):
+        """Sets revision of changed users or movies (model) matching the conditions"""
+        db.session.execute(db.update(model).where(*conditions).values(revision=revision))
+
+    @staticmethod
+    def _owners_of_movie(movie_id: str):
+        """Condition matching users that got the movie"""
+        return User.id.in_(db.select(user_movie_association.c.user_id).where(
+            user_movie_association.c.movie_id == movie_id))
+
+    def _get_user_movies_page(self, user_id: int, limit=None, after=None):
+        """Returns Movie instances of user ordered by id, walking user_movie primary key"""
+        query = db.select(Movie).join(
+            user_movie_association, user_movie_association.c.movie_id == Movie.id
+        ).where(user_movie_association.c.user_id == user_id)
+        return db.session.execute(
+            self._page(query, user_movie_association.c.movie_id, limit, after)).scalars()
+
+    @staticmethod
+    def _iter_rows(query, batch_size=None):
+        """
+        Returns generator executing the query only when iteration starts (so it can be
+        consumed in a streamed response) and fetching batch_size rows at a time.
+        """
+        # engine of the read method is taken now, the query runs after the method returned
+        read_bind = get_read_bind()
+
+        def iterate_rows():
+            yield from db.session.execute(
+                query.execution_options(yield_per=batch_size or config.STREAM_BATCH_SIZE),
+                bind_arguments={'bind': read_bind})
+
+        return iterate_rows()
+
+    @staticmethod
+    def _page(query, key_column, limit=None, after=None):
+        """Applies keyset pagination: rows with key_column > after, ordered by it, up to limit"""
+        if after is not None:
+            query = query.where(key_column > after)
+        query = query.order_by(key_column)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    @staticmethod
+    def _to_int(after):
+        """Converts integer cursor passed as a string, ValueError if it is not a number"""
+        if after is None:
+            return None
+        try:
+            return int(after)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid page cursor: {after}")
+
+    def _user_exists(self, user_id: int) -> bool:
+        """Primary key lookup of user without loading the row"""
+        return db.session.execute(
+            db.select(db.exists().where(User.id == user_id))).scalar()
+
+    def _user_has_movie(self, user_id: int, movie_id: str) -> bool:
+        """Checks user_movie by its primary key instead of loading user movies"""
+        return db.session.execute(db.select(db.exists().where(
+            user_movie_association.c.user_id == user_id,
+            user_movie_association.c.movie_id == movie_id))).scalar()
+
+    @staticmethod
+    def _add_to_counter(counter_column, amount: int, *conditions):
+        """Changes owners_count or reviews_count of movies matching the conditions by amount"""
+        db.session.execute(db.update(Movie).where(*conditions).values(
+            {counter_column: counter_column + amount}))
 
     def _fetch_movie_data(self, movie: Movie) -> dict:
         """Creates dict from movie instance and returns it"""
@@ -335,17 +906,18 @@ class SQLiteDataManager(DataManagerInterface):
 
         # checking if stored password of user match the password_to_check
         if user and user.password:
-            stored_password_hash = user.password.encode(SQLiteDataManager.ENCODING_TYPE)
-            encoded_password_to_check = password_to_check.encode(SQLiteDataManager.ENCODING_TYPE)
-            return bcrypt.checkpw(encoded_password_to_check, stored_password_hash)
+            is_valid = self._password_hasher.check(password_to_check, user.password)
+            # hash made with other cost factor than configured one is replaced on login
+            if is_valid and self._password_hasher.needs_rehash(user.password):
+                user.password = self._hash_and_encode_password(password_to_check)
+                db.session.commit()
+            return is_valid
 
         return False  # return False for users without a password, or if the user doesn't exist
 
     def _hash_and_encode_password(self, password: str) -> str:
-        """Encodes, hashes, and decodes a given password using bcrypt."""
-        password_hash = bcrypt.hashpw(password.encode(SQLiteDataManager.ENCODING_TYPE),
-                                      bcrypt.gensalt())
-        return password_hash.decode(SQLiteDataManager.ENCODING_TYPE)
+        """Encodes, hashes, and decodes a given password using bcrypt in the hasher pool."""
+        return self._password_hasher.hash(password)
 
     @staticmethod
     def is_valid_rating(rating):
@@ -0,0 +1,184 @@
+"""
+In place schema upgrades for existing sqlite db files.
+
+Schema version of a db file is kept in sqlite 'PRAGMA user_version'. Every
+migration is a function that gets sqlalchemy connection and upgrades the
+schema by one version, all of them are executed in one transaction.
+Migrations must be safe to run on a db created by db.create_all() with the
+current models, so they check the schema before changing it.
+"""
+import logging
+from sqlalchemy import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+
+def _add_indexes_and_constraints(connection: Connection):
+    """version 1: composite primary key on user_movie, indexes on hot lookup columns"""
+    duplicated_names = connection.exec_driver_sql(
+        'SELECT name FROM users GROUP BY name HAVING COUNT(*) > 1').scalars().all()
+    if duplicated_names:
+        raise ValueError(f"Cannot add unique index on users.name, duplicated names: "
+                         f"{', '.join(map(str, duplicated_names))}")
+
+    user_movie_pk = [row[1] for row in connection.exec_driver_sql('PRAGMA table_info(user_movie)')
+                     if row[5]]
+    if not user_movie_pk:
+        # sqlite cannot add primary key to existing table, rebuilding it without duplicated rows
+        connection.exec_driver_sql(
+            'CREATE TABLE user_movie_new ('
+            'user_id INTEGER NOT NULL REFERENCES users (id), '
+            'movie_id VARCHAR NOT NULL REFERENCES movies (id), '
+            'PRIMARY KEY (user_id, movie_id))')
+        connection.exec_driver_sql(
+            'INSERT OR IGNORE INTO user_movie_new (user_id, movie_id) '
+            'SELECT user_id, movie_id FROM user_movie '
+            'WHERE user_id IS NOT NULL AND movie_id IS NOT NULL')
+        connection.exec_driver_sql('DROP TABLE user_movie')
+        connection.exec_driver_sql('ALTER TABLE user_movie_new RENAME TO user_movie')
+
+    # keeping only the latest review of user for the same movie
+    removed_reviews_count = connection.exec_driver_sql(
+        'DELETE FROM reviews WHERE id NOT IN '
+        '(SELECT MAX(id) FROM reviews GROUP BY user_id, movie_id)').rowcount
+    if removed_reviews_count:
+        logger.warning(f"Removed {removed_reviews_count} older reviews of users who reviewed "
+                       f"the same movie more than once")
+
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_user_movie_movie_id ON user_movie (movie_id)')
+    connection.exec_driver_sql(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_users_name ON users (name)')
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_reviews_movie_id ON reviews (movie_id)')
+    connection.exec_driver_sql(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_reviews_user_id_movie_id '
+        'ON reviews (user_id, movie_id)')
+
+
+def _add_data_version(connection: Connection):
+    """version 2: data version counter increased by every change, for cache invalidation"""
+    connection.exec_driver_sql(
+        'CREATE TABLE IF NOT EXISTS data_version ('
+        'id INTEGER NOT NULL PRIMARY KEY, version INTEGER NOT NULL)')
+
+
+def _add_revisions(connection: Connection):
+    """version 3: revision columns of users and movies, for ETags of the API"""
+    for table_name in ('users', 'movies'):
+        columns = [row[1] for row in connection.exec_driver_sql(f'PRAGMA table_info({table_name})')]
+        if 'revision' not in columns:
+            connection.exec_driver_sql(
+                f'ALTER TABLE {table_name} ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+
+
+def recount_movie_counters(connection: Connection) -> int:
+    """
+    Sets owners_count and reviews_count of every movie from user_movie and
+    reviews tables. Returns number of movies which counters were changed.
+    """
+    return connection.exec_driver_sql(
+        'UPDATE movies SET '
+        'owners_count = (SELECT COUNT(*) FROM user_movie WHERE movie_id = movies.id), '
+        'reviews_count = (SELECT COUNT(*) FROM reviews WHERE movie_id = movies.id) '
+        'WHERE owners_count != (SELECT COUNT(*) FROM user_movie WHERE movie_id = movies.id) '
+        'OR reviews_count != (SELECT COUNT(*) FROM reviews WHERE movie_id = movies.id)').rowcount
+
+
+def _add_movie_counters(connection: Connection):
+    """version 4: owners and reviews counters of movies"""
+    columns = [row[1] for row in connection.exec_driver_sql('PRAGMA table_info(movies)')]
+    for column_name in ('owners_count', 'reviews_count'):
+        if column_name not in columns:
+            connection.exec_driver_sql(
+                f'ALTER TABLE movies ADD COLUMN {column_name} INTEGER NOT NULL DEFAULT 0')
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_movies_owners_count ON movies (owners_count)')
+    recount_movie_counters(connection)
+
+
+# full text index of movies name, director and year. External content table: the index
+# keeps no copy of the text and is kept in sync with movies table by the triggers.
+# It refers to movies by rowid, VACUUM may change rowids so the index must be rebuilt after it
+SEARCH_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5("
+    "name, director, year, content='movies', content_rowid='rowid', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS movies_fts_after_insert AFTER INSERT ON movies BEGIN "
+    "INSERT INTO movies_fts (rowid, name, director, year) "
+    "VALUES (new.rowid, new.name, new.director, new.year); END",
+    "CREATE TRIGGER IF NOT EXISTS movies_fts_after_delete AFTER DELETE ON movies BEGIN "
+    "INSERT INTO movies_fts (movies_fts, rowid, name, director, year) "
+    "VALUES ('delete', old.rowid, old.name, old.director, old.year); END",
+    "CREATE TRIGGER IF NOT EXISTS movies_fts_after_update "
+    "AFTER UPDATE OF name, director, year ON movies BEGIN "
+    "INSERT INTO movies_fts (movies_fts, rowid, name, director, year) "
+    "VALUES ('delete', old.rowid, old.name, old.director, old.year); "
+    "INSERT INTO movies_fts (rowid, name, director, year) "
+    "VALUES (new.rowid, new.name, new.director, new.year); END",
+]
+
+
+def rebuild_search_index(connection: Connection):
+    """Fills the full text index again from movies table"""
+    connection.exec_driver_sql("INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')")
+
+
+def _add_search_index(connection: Connection):
+    """version 5: full text search index of movies"""
+    for statement in SEARCH_INDEX_DDL:
+        connection.exec_driver_sql(statement)
+    rebuild_search_index(connection)
+
+
+def _add_movie_revision_index(connection: Connection):
+    """version 6: index on movies.revision, for loading movies changed after a data version"""
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_movies_revision ON movies (revision)')
+
+
+def _add_movie_name_index(connection: Connection):
+    """version 7: case insensitive index on movies.name, for finding a movie by its exact name"""
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_movies_name_nocase ON movies (name COLLATE NOCASE)')
+
+
+# index + 1 is the schema version the migration upgrades to
+MIGRATIONS = [
+    _add_indexes_and_constraints,
+    _add_data_version,
+    _add_revisions,
+    _add_movie_counters,
+    _add_search_index,
+    _add_movie_revision_index,
+    _add_movie_name_index,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(connection: Connection) -> int:
+    return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def upgrade_database(engine: Engine) -> int:
+    """
+    Runs all migrations newer than the schema version of the db file.
+    Empty db (without tables) is left untouched, db.create_all() creates it
+    with the current schema. Returns the number of executed migrations.
+    """
+    with engine.begin() as connection:
+        # pysqlite doesnt open transaction for DDL statements, opening it explicitly.
+        # IMMEDIATE takes the write lock, so workers starting together migrate one by one
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+        tables = connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'users'").scalars().all()
+        if not tables:
+            return 0
+
+        current_version = get_schema_version(connection)
+        for version in range(current_version, SCHEMA_VERSION):
+            logger.info(f"Upgrading db schema to version {version + 1}")
+            MIGRATIONS[version](connection)
+        # pragma values cannot be bound parameters
+        connection.exec_driver_sql(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    return max(SCHEMA_VERSION - current_version, 0)
@@ -0,0 +1,55 @@
+"""
+Connection profile of the sqlite engine: pool options and pragmas that are
+applied to every new connection. Pragmas are kept in config.SQLITE_PRAGMAS.
+"""
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def get_engine_options() -> dict:
+    """Returns SQLALCHEMY_ENGINE_OPTIONS of the sqlite engine"""
+    return {
+        'pool_size': config.SQLITE_POOL_SIZE,
+        'max_overflow': config.SQLITE_MAX_OVERFLOW,
+        'pool_timeout': config.SQLITE_POOL_TIMEOUT_SECONDS,
+        # pooled connections are used by many request threads, one at a time
+        'connect_args': {'check_same_thread': False,
+                         'timeout': config.SQLITE_PRAGMAS.get('busy_timeout', 5000) / 1000},
+    }
+
+
+def apply_pragmas(dbapi_connection, connection_record):
+    """'connect' event listener, sets config.SQLITE_PRAGMAS on a new connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in config.SQLITE_PRAGMAS.items():
+            # pragma values cannot be bound parameters
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+
+def apply_read_only_pragmas(dbapi_connection, connection_record):
+    """'connect' event listener of read replica connections, statements can only read"""
+    apply_pragmas(dbapi_connection, connection_record)
+    dbapi_connection.execute('PRAGMA query_only = ON')
+
+
+def read_pragmas(connection) -> dict:
+    """Returns effective values of config.SQLITE_PRAGMAS on sqlalchemy connection"""
+    return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+            for name in config.SQLITE_PRAGMAS}
+
+
+def report_pragmas(connection) -> dict:
+    """Logs effective pragmas, warning about the ones sqlite didn't accept. Returns them"""
+    effective_pragmas = read_pragmas(connection)
+    logger.info(f"sqlite pragmas: {effective_pragmas}")
+    journal_mode = config.SQLITE_PRAGMAS.get('journal_mode')
+    if journal_mode and str(effective_pragmas['journal_mode']).lower() != journal_mode.lower():
+        # e.g. WAL is not possible on some network file systems
+        logger.warning(f"sqlite journal_mode is {effective_pragmas['journal_mode']}, "
+                       f"not {journal_mode}")
+    return effective_pragmas
@@ -0,0 +1,130 @@
+import re
+import threading
+from bisect import bisect_left, insort
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_title_index():
+    """Returns MovieTitleIndex shared by the suggestion routes of the process, created on first use"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = MovieTitleIndex()
+    return _default_index
+
+
+def _normalize(text: str) -> str:
+    """Casefolded words of the text joined by single spaces"""
+    return ' '.join(re.findall(r'\w+', (text or '').casefold()))
+
+
+class MovieTitleIndex():
+    """
+    In-process prefix index of movie titles for typeahead suggestions.
+
+    Every word start of a title is a key in a sorted array ('dark knight' and
+    'knight' for 'The Dark Knight'), so suggestions for a prefix are a binary
+    search and a short scan, without a db query. Titles matching from their
+    first word are suggested first.
+
+    The index remembers the data version it was updated to and update() loads
+    only movies changed after it, so movies added by any worker are picked up
+    on the next update. When the db has fewer movies than the index, ids of all
+    movies are loaded and deleted movies are dropped from the index.
+    """
+
+    # keys scanned for one suggestion at most, bounds the time of very short prefixes
+    MAX_SCANNED_KEYS = 2000
+
+    def __init__(self):
+        self._keys = []  # sorted (key, word position, movie id)
+        self._movies = {}  # movie id -> {'id', 'name', 'year'}
+        self._data_version = None  # None until all movies are loaded
+        self._lock = threading.Lock()
+
+    def update(self, data_manager):
+        """Adds movies created or changed since the last update of the index, drops deleted ones"""
+        data_version = data_manager.get_data_version()
+        if data_version == self._data_version:
+            return
+        with self._lock:
+            if data_version != self._data_version:
+                movies = data_manager.get_movie_titles(changed_after=self._data_version)
+                if self._data_version is None:
+                    self._load(movies)
+                else:
+                    for movie in movies:
+                        self._add(movie)
+                    # changed movies are in the index, so it holds more movies only after deletes
+                    if data_manager.get_movies_count() < len(self._movies):
+                        self._remove_deleted(
+                            {movie['id'] for movie in data_manager.get_movie_titles()})
+                self._data_version = data_version
+
+    def suggest(self, prefix: str, limit=10) -> list:
+        """Returns up to limit movies ({'id', 'name', 'year'}) whose title has a word starting with prefix"""
+        prefix = _normalize(prefix)
+        if not prefix:
+            return []
+        title_starts, other_matches, seen_ids = [], [], set()
+        with self._lock:
+            start = bisect_left(self._keys, (prefix,))
+            end = min(start + self.MAX_SCANNED_KEYS, len(self._keys))
+            for key, position, movie_id in self._keys[start:end]:
+                if not key.startswith(prefix) or len(title_starts) >= limit:
+                    break
+                if movie_id not in seen_ids:
+                    seen_ids.add(movie_id)
+                    (other_matches if position else title_starts).append(movie_id)
+            return [dict(self._movies[movie_id])
+                    for movie_id in (title_starts + other_matches)[:limit]]
+
+    def clear(self):
+        """Empties the index, the next update loads all movies again"""
+        with self._lock:
+            self._keys = []
+            self._movies = {}
+            self._data_version = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'titles': len(self._movies), 'keys': len(self._keys),
+                    'data_version': self._data_version}
+
+    # -------------- inner logic methods--------------------------------
+
+    def _load(self, movies: list):
+        """Fills the empty index with all movies, keys are sorted once instead of inserted one by one"""
+        self._movies = {movie['id']: {'id': movie['id'], 'name': movie['name'],
+                                      'year': movie['year']} for movie in movies}
+        self._keys = sorted(key for movie in self._movies.values()
+                            for key in self._title_keys(movie))
+
+    def _add(self, movie: dict):
+        """Adds movie keys, replacing keys of the movie's old title"""
+        old_movie = self._movies.get(movie['id'])
+        if old_movie and old_movie['name'] == movie['name']:
+            old_movie['year'] = movie['year']
+            return
+        if old_movie:
+            for key in self._title_keys(old_movie):
+                del self._keys[bisect_left(self._keys, key)]
+        self._movies[movie['id']] = {'id': movie['id'], 'name': movie['name'],
+                                     'year': movie['year']}
+        for key in self._title_keys(movie):
+            insort(self._keys, key)
+
+    def _remove_deleted(self, existing_ids: set):
+        """Drops movies that are not in existing_ids, keys are filtered in one pass"""
+        deleted_ids = self._movies.keys() - existing_ids
+        for movie_id in deleted_ids:
+            del self._movies[movie_id]
+        self._keys = [key for key in self._keys if key[2] not in deleted_ids]
+
+    @staticmethod
+    def _title_keys(movie: dict) -> list:
+        words = _normalize(movie['name']).split(' ')
+        return [(' '.join(words[position:]), position, movie['id'])
+                for position in range(len(words)) if words[position]]
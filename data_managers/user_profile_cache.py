@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+import config
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_profile_cache():
+    """Returns UserProfileCache shared by all routes of the process, created on first use"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = UserProfileCache(max_size=config.USER_PROFILE_CACHE_MAX_SIZE,
+                                              ttl_seconds=config.USER_PROFILE_CACHE_TTL_SECONDS)
+    return _default_cache
+
+
+class UserProfileCache():
+    """
+    Small in-process LRU of user profiles ({'id', 'name', 'avatar'}) by user id,
+    used to render the logged in user on every page without a db query.
+    Entries expire after ttl_seconds, so changes made by other workers are
+    seen after at most that time.
+    """
+
+    def __init__(self, max_size=1024, ttl_seconds=60):
+        self._max_size = max_size
+        self._ttl_seconds = ttl_seconds
+        self._profiles = OrderedDict()  # user id -> (expires_at, profile)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, load_profile):
+        """
+        Returns cached profile of the user, loading it with load_profile(user_id)
+        on miss. Returns None if the user doesn't exist.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._profiles.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._profiles.move_to_end(user_id)
+                return entry[1]
+
+        profile = load_profile(user_id)
+        with self._lock:
+            if profile is None:
+                self._profiles.pop(user_id, None)
+            else:
+                self._profiles[user_id] = (now + self._ttl_seconds, profile)
+                self._profiles.move_to_end(user_id)
+                if len(self._profiles) > self._max_size:
+                    self._profiles.popitem(last=False)
+        return profile
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._profiles.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
@@ -0,0 +1,118 @@
+import config  # imported first, config imports the data managers
+from data_managers.backend_migrator import migrate_json_to_sqlite, migrate_sqlite_to_json, \
+    iter_json_array, MigrationCheckpoint
+from sqlalchemy.exc import IntegrityError
+import io
+import json
+import os
+import sqlite3
+import pytest
+
+DATA_FOLDER_NAME = 'data'
+JSON_PATH = os.path.join(DATA_FOLDER_NAME, 'test_migration.json')
+SQLITE_PATH = os.path.join(DATA_FOLDER_NAME, 'test_migration.sqlite')
+JSON_COPY_PATH = os.path.join(DATA_FOLDER_NAME, 'test_migration_copy.json')
+
+
+def make_movie(movie_id, name="Pirates"):
+    return {"id": movie_id, "name": name, "director": "Roman Polanski",
+            "year": "1986", "rating": "6.0", "imdb_link": "https://www.test.com",
+            "image_link": "https:test-link.jpg"}
+
+
+USERS = [
+    {"id": 1, "name": "bob", "password": "$2b$12$hash-of-bob", "avatar": "avatar_default.png",
+     "movies": [make_movie("tt0000001"), dict(make_movie("tt0000002"), review="a" * 50)]},
+    {"id": 2, "name": "amy", "movies": [make_movie("tt0000002")]},
+    {"id": 5, "name": "joe", "movies": []},
+    {"id": 7, "name": "kim", "movies": [make_movie("tt0000001"), make_movie("tt0000003")]},
+]
+
+
+@pytest.fixture(autouse=True)
+def remove_files():
+    with open(JSON_PATH, 'w') as file:
+        json.dump(USERS, file, indent=2)
+    yield
+    for path in (JSON_PATH, SQLITE_PATH, JSON_COPY_PATH):
+        for suffix in ('', '-wal', '-shm', '.checkpoint', '.migrating'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def stop_after_checkpoints(monkeypatch, count):
+    """Makes the migration crash when it saves the count + 1 checkpoint"""
+    save = MigrationCheckpoint.save
+    saved = []
+
+    def failing_save(checkpoint, **progress):
+        if len(saved) == count:
+            raise KeyboardInterrupt
+        saved.append(progress)
+        save(checkpoint, **progress)
+
+    monkeypatch.setattr(MigrationCheckpoint, 'save', failing_save)
+
+
+def test_iter_json_array_reads_items_in_small_pieces():
+    text = json.dumps(USERS)
+    assert list(iter_json_array(io.StringIO(text), read_size=7)) == USERS
+    assert list(iter_json_array(io.StringIO(' [ ] '))) == []
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text[:-10])))
+
+
+def test_json_to_sqlite_dedupes_movies_and_resumes(monkeypatch):
+    stop_after_checkpoints(monkeypatch, 1)
+    with pytest.raises(KeyboardInterrupt):
+        migrate_json_to_sqlite(JSON_PATH, SQLITE_PATH, chunk_size=2)
+    monkeypatch.undo()
+
+    counts = migrate_json_to_sqlite(JSON_PATH, SQLITE_PATH, chunk_size=2)
+    assert counts == {'users': 4, 'movies': 3, 'user_movie': 5}
+    assert not os.path.exists(SQLITE_PATH + '.checkpoint')
+
+    connection = sqlite3.connect(SQLITE_PATH)
+    try:
+        assert connection.execute("SELECT password FROM users WHERE name = 'bob'").fetchone() == (
+            "$2b$12$hash-of-bob",)
+        assert connection.execute(
+            'SELECT id, owners_count, reviews_count FROM movies ORDER BY id').fetchall() == [
+            ("tt0000001", 2, 0), ("tt0000002", 2, 1), ("tt0000003", 1, 0)]
+    finally:
+        connection.close()
+
+
+def test_json_to_sqlite_never_merges_users():
+    migrate_json_to_sqlite(JSON_PATH, SQLITE_PATH)
+    with open(JSON_PATH, 'w') as file:
+        json.dump([{"id": 1, "name": "alice", "movies": [make_movie("tt0000009")]}], file)
+    with pytest.raises(ValueError):
+        migrate_json_to_sqlite(JSON_PATH, SQLITE_PATH)
+
+    # users with the same name fail their chunk instead of being dropped
+    os.remove(SQLITE_PATH)
+    with open(JSON_PATH, 'w') as file:
+        json.dump([USERS[1], dict(USERS[3], name="amy")], file)
+    with pytest.raises(IntegrityError):
+        migrate_json_to_sqlite(JSON_PATH, SQLITE_PATH)
+    connection = sqlite3.connect(SQLITE_PATH)
+    try:
+        assert connection.execute('SELECT COUNT(*) FROM user_movie').fetchone() == (0,)
+    finally:
+        connection.close()
+
+
+def test_sqlite_to_json_round_trip_resumes(monkeypatch):
+    migrate_json_to_sqlite(JSON_PATH, SQLITE_PATH)
+
+    stop_after_checkpoints(monkeypatch, 1)
+    with pytest.raises(KeyboardInterrupt):
+        migrate_sqlite_to_json(SQLITE_PATH, JSON_COPY_PATH, chunk_size=3)
+    monkeypatch.undo()
+    assert not os.path.exists(JSON_COPY_PATH)
+
+    assert migrate_sqlite_to_json(SQLITE_PATH, JSON_COPY_PATH, chunk_size=3) == {
+        'users': 4, 'movies': 5}
+    with open(JSON_COPY_PATH) as file:
+        assert json.load(file) == USERS
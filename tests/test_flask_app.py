@@ -1,8 +1,24 @@
 # python -m pytest .\tests\test_flask_app.py::test_add_user  to run specific function test from terminal
 import pytest
+import os
+import shutil
 from unittest.mock import MagicMock, patch
 from flask import url_for
-from app import app
+import config
+# set before the app is imported, tests don't touch data/movies.sqlite
+config.SQL_DB_FILE_NAME = 'test_app_movies.sqlite'
+from app import app, page_cache
+
+
+@pytest.fixture(scope='module', autouse=True)
+def test_db():
+    # the app connects to the db on the first request, the copy is used from the start
+    shutil.copy(config.get_absolute_path_default_db(), config.get_absolute_path_current_db())
+    yield
+    for suffix in ('', '-wal', '-shm'):
+        db_path = config.get_absolute_path_current_db() + suffix
+        if os.path.exists(db_path):
+            os.remove(db_path)
 
 
 @pytest.fixture
@@ -17,6 +33,76 @@ def client():
     ctx.pop()  # Don't forget to pop the context to clean up at the end
 
 
+def make_movie(movie_id, name):
+    return {"id": movie_id, "name": name, "director": "James Cameron", "year": "1997",
+            "rating": "7.9", "imdb_link": "https://www.imdb.com/title/" + movie_id,
+            "image_link": "https:test-link.jpg"}
+
+
+def test_user_movies_page_is_cached_by_user_revision(client):
+    data_manager = app.data_manager
+    client.get(url_for('list_users'))  # first request upgrades the db
+    data_manager.add_user("page_owner")
+    data_manager.add_user("page_other")
+    user_id, other_user_id = [user['id'] for user in data_manager.get_all_users()[-2:]]
+    page_url = url_for('movie_routes.user_movies', user_id=user_id)
+
+    response = client.get(page_url)
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    # browser that got the page gets 304 without a body
+    response = client.get(page_url, headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.data == b''
+
+    # changes of other users don't render the page again
+    hits = page_cache.stats()['hits']
+    data_manager.add_movie_to_user(other_user_id, make_movie("tt9000001", "Other Movie"))
+    assert client.get(page_url, headers={'If-None-Match': etag}).status_code == 304
+    assert page_cache.stats()['hits'] == hits + 1
+
+    data_manager.add_movie_to_user(user_id, make_movie("tt9000002", "Owner Movie"))
+    response = client.get(page_url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag and b'Owner Movie' in response.data
+    assert page_cache.stats()['hits'] == hits + 1
+
+
+def test_users_page_etag_changes_with_data(client):
+    response = client.get(url_for('list_users'))
+    etag = response.headers['ETag']
+    assert client.get(url_for('list_users'),
+                      headers={'If-None-Match': etag}).status_code == 304
+
+    app.data_manager.add_user("new_public")
+    response = client.get(url_for('list_users'), headers={'If-None-Match': etag})
+    assert response.status_code == 200 and b'new_public' in response.data
+
+
+def test_delete_users_command(client):
+    data_manager = app.data_manager
+    client.get(url_for('list_users'))  # first request upgrades the db
+    data_manager.add_user("to_delete")
+    user_id = data_manager.get_all_users()[-1]['id']
+    data_manager.add_movie_to_user(user_id, make_movie("tt9000003", "Deleted Movie"))
+
+    result = app.test_cli_runner().invoke(args=['delete-users', str(user_id), '999999'])
+
+    assert result.output == "Deleted 1 users, not found: [999999]\n"
+    assert data_manager.get_user_by_id(user_id) is None
+    assert data_manager.find_movie("Deleted Movie") is None
+    # bulk delete is not exposed over http
+    assert client.post('/api/users/bulk_delete', json={'user_ids': [1]}).status_code in (404, 405)
+
+
+def test_stats_are_only_for_local_requests(client):
+    response = client.get('/api/stats', environ_base={'REMOTE_ADDR': '10.0.0.7'})
+    assert response.status_code == 403
+
+    response = client.get('/api/stats', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    assert response.status_code == 200
+    assert 'queue_depth' in response.get_json()['password_hasher']
+
+
 @patch('app.json_data_manager.get_all_users')
 def test_main_page(mock_get_all_users, client):
     mock_get_all_users.return_value = [{"id": 1, "name": "Alice", "movies": []},
@@ -130,4 +216,5 @@ def test_update_movie(mock_movie_update, mock_get_user_movie, client):
 
 
 
-pytest.main()
\ No newline at end of file
+if __name__ == '__main__':
+    pytest.main()
\ No newline at end of file
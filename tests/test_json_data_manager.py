@@ -1,4 +1,7 @@
+import config  # imported first, config imports the data managers
 from data_managers.json_data_manager import JSONDataManager
+from data_managers.indexed_json_data_manager import IndexedJSONDataManager
+import json
 import os
 import pytest
 
@@ -78,4 +81,126 @@ def test_delete_movie_that_does_not_exist(json_manager):
     with pytest.raises(ValueError, match=error_message):
         json_manager.delete_movie_of_user(1, movie_id_doesnt_exist)
 
-pytest.main()
+
+def test_user_movies_pagination(json_manager):
+    json_manager.add_user("bob")
+    for movie_id in ("tt3", "tt1", "tt2"):
+        json_manager.add_movie_to_user(1, {"id": movie_id, "name": movie_id})
+
+    first_page = json_manager.get_user_movies(1, limit=2)
+    assert [movie['id'] for movie in first_page] == ["tt1", "tt2"]
+    assert [movie['id'] for movie in json_manager.get_user_movies(1, limit=2, after="tt2")] == ["tt3"]
+
+
+@pytest.fixture
+def indexed_manager():
+    manager = IndexedJSONDataManager(FILE_NAME, compact_every=3)
+    yield manager
+    # Teardown
+    for path in (FILE_PATH, FILE_PATH + '.wal'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_indexed_manager_logs_mutations_and_compacts(indexed_manager):
+    indexed_manager.add_user("bob")
+    indexed_manager.add_movie_to_user(1, {"id": "tt1", "name": "Pirates"})
+    # two mutations are only in the log, data file is untouched
+    with open(FILE_PATH) as file:
+        assert json.load(file) == []
+
+    indexed_manager.add_user("alice")  # third mutation - compaction
+    with open(FILE_PATH) as file:
+        assert [user['name'] for user in json.load(file)] == ["bob", "alice"]
+    assert os.path.getsize(FILE_PATH + '.wal') == 0
+
+
+def test_indexed_manager_replays_log_on_load(indexed_manager):
+    indexed_manager.add_user("bob")
+    indexed_manager.add_movie_to_user(1, {"id": "tt1", "name": "Pirates", "year": "1986"})
+
+    reloaded_manager = IndexedJSONDataManager(FILE_NAME, compact_every=3)
+    assert reloaded_manager.get_user_by_name("bob")['id'] == 1
+    assert reloaded_manager.get_user_movie(1, "tt1")['year'] == "1986"
+
+    reloaded_manager.update_movie_of_user(1, "tt1", {"year": "1987"})
+    reloaded_manager.delete_movie_of_user(1, "tt1")  # compaction
+    assert IndexedJSONDataManager(FILE_NAME).get_user_movies(1) == []
+    with pytest.raises(ValueError):
+        reloaded_manager.add_user("bob")
+
+
+@pytest.mark.parametrize('manager_class', [JSONDataManager, IndexedJSONDataManager])
+def test_search_and_find_movies_of_all_users(manager_class):
+    manager = manager_class(FILE_NAME)
+    try:
+        manager.add_user("bob")
+        manager.add_user("alice")
+        manager.add_movie_to_user(1, {"id": "tt1", "name": "Pirates", "director": "Roman Polanski",
+                                      "year": "1986"})
+        manager.add_movie_to_user(2, {"id": "tt2", "name": "Polanski's Story",
+                                      "director": "Jim Cameron", "year": "2001"})
+        manager.add_movie_to_user(2, {"id": "tt1", "name": "Pirates", "director": "Roman Polanski",
+                                      "year": "1986"})
+
+        # name matches first, movies of many users are returned once
+        assert [movie['id'] for movie in manager.search_movies("pol")] == ["tt2", "tt1"]
+        assert [movie['id'] for movie in manager.search_movies("jim 20")] == ["tt2"]
+        assert manager.search_movies("pol", limit=1)[0]['id'] == "tt2"
+        assert manager.search_movies("  ") == []
+
+        assert manager.find_movie(" PIRATES ")['id'] == "tt1"
+        assert manager.find_movie("TT2")['name'] == "Polanski's Story"
+        assert manager.find_movie("Pirate") is None
+        manager.update_movie_of_user(2, "tt2", {"name": "Cameron's Story"})
+        manager.delete_movie_of_user(1, "tt1")
+        assert manager.find_movie("polanski's story") is None
+        assert manager.find_movie("cameron's story")['id'] == "tt2"
+        assert manager.find_movie("pirates")['id'] == "tt1"  # alice still got it
+        manager.delete_user(2)
+        assert manager.find_movie("pirates") is None
+    finally:
+        for path in (FILE_PATH, FILE_PATH + '.wal'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+@pytest.mark.parametrize('manager_class', [JSONDataManager, IndexedJSONDataManager])
+def test_public_and_registered_users(manager_class):
+    with open(FILE_PATH, 'w') as file:
+        json.dump([{"id": 1, "name": "bob", "movies": [{"id": "tt1", "name": "Pirates"}]},
+                   {"id": 2, "name": "amy", "password": "hash", "avatar": "amy.png", "movies": []},
+                   {"id": 3, "name": "joe", "movies": []},
+                   {"id": 4, "name": "kim", "movies": []}], file)
+    manager = manager_class(FILE_NAME)
+    try:
+        assert [user['name'] for user in manager.get_all_public_users()] == ["bob", "joe", "kim"]
+        assert [user['id'] for user in manager.get_all_public_users(limit=1, after=1)] == [3]
+        assert [user['name'] for user in manager.get_all_registered_users()] == ["amy"]
+        assert manager.get_user_profile(2) == {'id': 2, 'name': "amy", 'avatar': "amy.png"}
+        assert manager.get_user_profile(5) is None
+        assert manager.get_user_id_by_name("amy") == 2
+        assert manager.get_user_id_by_name("nobody") is None
+        # returned users are copies
+        manager.get_all_public_users()[0]['movies'].clear()
+        assert manager.get_user_movies(1) == [{"id": "tt1", "name": "Pirates"}]
+    finally:
+        for path in (FILE_PATH, FILE_PATH + '.wal'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+@pytest.mark.parametrize('storage_mode, manager_class', [('file', JSONDataManager),
+                                                         ('indexed', IndexedJSONDataManager)])
+def test_json_storage_mode_selects_manager(storage_mode, manager_class, monkeypatch):
+    monkeypatch.setattr(config, 'JSON_STORAGE_MODE', storage_mode)
+    monkeypatch.setattr(config, 'JSON_DB_DEFAULT_NAME', FILE_NAME)
+    try:
+        assert type(config.get_json_data_manager()) is manager_class
+    finally:
+        if os.path.exists(FILE_PATH):
+            os.remove(FILE_PATH)
+
+
+if __name__ == '__main__':
+    pytest.main()
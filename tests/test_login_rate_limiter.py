@@ -0,0 +1,100 @@
+from data_managers.login_rate_limiter import LoginRateLimiter, SQLiteRateLimitStore
+import os
+import pytest
+
+DB_PATH = os.path.join('data', 'test_login_rate_limits.sqlite')
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_limiter(clock, store=None):
+    return LoginRateLimiter(store=store, user_capacity=2, user_refill_seconds=10,
+                            ip_capacity=3, ip_refill_seconds=1, backoff_after_failures=2,
+                            backoff_base_seconds=5, backoff_max_seconds=20, time_function=clock)
+
+
+def test_user_bucket_empties_and_refills(clock):
+    limiter = make_limiter(clock)
+
+    assert limiter.check("bob", "1.1.1.1") == 0
+    assert limiter.check("bob", "2.2.2.2") == 0
+    assert limiter.check("bob", "3.3.3.3") == pytest.approx(10)
+    assert limiter.check("alice", "4.4.4.4") == 0  # other user names are not affected
+
+    clock.now += 10
+    assert limiter.check("bob", "5.5.5.5") == 0
+
+
+def test_ip_bucket_limits_many_user_names(clock):
+    limiter = make_limiter(clock)
+
+    for user_name in ("a", "b", "c"):
+        assert limiter.check(user_name, "1.1.1.1") == 0
+    assert limiter.check("d", "1.1.1.1") == pytest.approx(1)
+
+
+def test_denied_attempt_takes_no_token_from_other_bucket(clock):
+    limiter = make_limiter(clock)
+    for user_name in ("a", "b", "c"):
+        limiter.check(user_name, "6.6.6.6")
+
+    # ip is over its limit, attempts on bob's name don't drain bob's bucket
+    for _ in range(5):
+        assert limiter.check("bob", "6.6.6.6") > 0
+    assert limiter.check("bob", "1.1.1.1") == 0
+    assert limiter.check("bob", "2.2.2.2") == 0
+
+    # bob's bucket is empty, attempts from a fresh ip don't drain the ip's bucket
+    for _ in range(5):
+        assert limiter.check("bob", "3.3.3.3") > 0
+    for user_name in ("x", "y", "z"):
+        assert limiter.check(user_name, "3.3.3.3") == 0
+
+
+def test_progressive_backoff_after_failures(clock):
+    limiter = make_limiter(clock)
+
+    limiter.record_failure("bob", "1.1.1.1")
+    assert limiter.check("bob", "2.2.2.2") == 0
+    limiter.record_failure("bob", "1.1.1.1")
+    assert limiter.check("bob", "2.2.2.2") == pytest.approx(5)
+
+    clock.now += 5
+    limiter.record_failure("bob", "1.1.1.1")
+    assert limiter.check("bob", "2.2.2.2") == pytest.approx(10)  # doubled
+
+    for _ in range(5):
+        limiter.record_failure("bob", "1.1.1.1")
+    assert limiter.check("bob", "2.2.2.2") == pytest.approx(20)  # capped
+
+    limiter.record_success("bob")
+    clock.now += 10
+    assert limiter.check("bob", "2.2.2.2") == 0
+    assert limiter.check("carol", "1.1.1.1") > 0  # ip is still blocked
+
+
+def test_sqlite_store_is_shared(clock):
+    first_store = SQLiteRateLimitStore(DB_PATH)
+    second_store = SQLiteRateLimitStore(DB_PATH)
+    try:
+        first_limiter = make_limiter(clock, first_store)
+        second_limiter = make_limiter(clock, second_store)
+
+        assert first_limiter.check("bob", "1.1.1.1") == 0
+        assert second_limiter.check("bob", "2.2.2.2") == 0
+        assert first_limiter.check("bob", "3.3.3.3") > 0
+    finally:
+        first_store.close()
+        second_store.close()
+        os.remove(DB_PATH)
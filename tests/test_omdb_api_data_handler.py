@@ -0,0 +1,219 @@
+from unittest.mock import MagicMock
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import json
+import os
+import threading
+import time
+import pytest
+from data_managers.async_omdb_api_data_handler import SyncMovieAPIHandler
+from data_managers.circuit_breaker import CircuitBreaker
+from data_managers.omdb_api_data_handler import MovieAPIHandler, create_session
+from data_managers.omdb_cache import OmdbResponseCache, NOT_FOUND
+
+CACHE_FILE_PATH = os.path.join('data', 'test_omdb_cache.sqlite')
+
+TITANIC_API_DATA = {"Response": "True", "imdbID": "tt0120338", "Title": "Titanic",
+                    "Director": "James Cameron", "Year": "1997", "imdbRating": "7.9",
+                    "Poster": "https:test-link.jpg"}
+
+
+def make_session(json_data):
+    session = MagicMock()
+    session.get.return_value.json.return_value = json_data
+    return session
+
+
+@pytest.fixture
+def cache():
+    omdb_cache = OmdbResponseCache(db_path=CACHE_FILE_PATH, lru_max_size=2, disk_max_size=3,
+                                   disk_evict_every=1)
+    yield omdb_cache
+    # Teardown
+    omdb_cache.close()
+    if os.path.exists(CACHE_FILE_PATH):
+        os.remove(CACHE_FILE_PATH)
+
+
+def test_repeated_title_served_from_cache(cache):
+    session = make_session(TITANIC_API_DATA)
+    handler = MovieAPIHandler(cache=cache, session=session, circuit_breaker=CircuitBreaker())
+
+    first = handler.get_movie_by_title('Titanic')
+    second = handler.get_movie_by_title('  titanic ')
+    by_id = handler.get_movie_by_imdb_id('tt0120338')
+
+    assert first == second == by_id
+    assert first['name'] == 'Titanic'
+    session.get.assert_called_once()
+    assert cache.stats()['hits'] == 2
+
+
+def test_not_found_title_is_cached(cache):
+    session = make_session({"Response": "False", "Error": "Movie not found!"})
+    handler = MovieAPIHandler(cache=cache, session=session, circuit_breaker=CircuitBreaker())
+
+    assert handler.get_movie_by_title('no such movie') is None
+    assert handler.get_movie_by_title('no such movie') is None
+    session.get.assert_called_once()
+
+
+def test_quota_error_is_not_cached(cache):
+    session = make_session({"Response": "False", "Error": "Request limit reached!"})
+    handler = MovieAPIHandler(cache=cache, session=session, circuit_breaker=CircuitBreaker())
+
+    handler.get_movie_by_title('Titanic')
+    handler.get_movie_by_title('Titanic')
+    assert session.get.call_count == 2
+
+
+def test_persistent_tier_survives_lru_eviction(cache):
+    cache.set('t:a', {'id': 'a'})
+    cache.set('t:b', {'id': 'b'})
+    cache.set('t:c', NOT_FOUND)
+
+    assert cache.stats()['evictions'] == 1  # 't:a' pushed out of the lru
+    assert cache.get('t:a') == {'id': 'a'}
+    assert cache.get('t:c') is NOT_FOUND
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_disk_tier_is_size_bounded(cache):
+    for key in ('t:a', 't:b', 't:c', 't:d'):
+        cache.set(key, {'id': key})
+
+    stats = cache.stats()
+    assert stats['disk_size'] == 3
+    assert stats['disk_evictions'] == 1
+
+
+def test_disk_eviction_runs_every_n_writes():
+    omdb_cache = OmdbResponseCache(db_path=CACHE_FILE_PATH, disk_max_size=2, disk_evict_every=3)
+    try:
+        for key in ('t:a', 't:b', 't:c', 't:d', 't:e'):
+            omdb_cache.set(key, {'id': key})
+        # evicted after the 3rd write, rows of the next writes wait for the next eviction
+        assert omdb_cache.stats()['disk_evictions'] == 1
+        assert omdb_cache.stats()['disk_size'] == 4
+
+        omdb_cache.set('t:f', {'id': 't:f'})
+        assert omdb_cache.stats()['disk_evictions'] == 4
+        assert omdb_cache.stats()['disk_size'] == 2
+    finally:
+        omdb_cache.close()
+        if os.path.exists(CACHE_FILE_PATH):
+            os.remove(CACHE_FILE_PATH)
+
+
+def test_expired_entry_is_a_miss():
+    omdb_cache = OmdbResponseCache(ttl_seconds=-1)
+    omdb_cache.set('t:a', {'id': 'a'})
+
+    assert omdb_cache.get('t:a') is None
+    assert omdb_cache.stats()['expired'] == 1
+
+
+class StubOmdbHandler(BaseHTTPRequestHandler):
+    """Local stand-in for omdbapi.com, behaviour is driven by the 't' parameter"""
+    calls = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        title = query.get('t', query.get('i', ['']))[0]
+        StubOmdbHandler.calls.append(title)
+        if title == 'slow':
+            time.sleep(0.5)
+        if title == 'broken':
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = json.dumps(dict(TITANIC_API_DATA, Title=title)).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    StubOmdbHandler.calls = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubOmdbHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+
+def make_stub_handler(url, **kwargs):
+    return MovieAPIHandler(cache=OmdbResponseCache(), url=url,
+                           session=create_session(pool_size=2, max_retries=2, backoff_factor=0),
+                           circuit_breaker=kwargs.pop('circuit_breaker', CircuitBreaker()),
+                           **kwargs)
+
+
+def test_stub_server_lookup(stub_server):
+    handler = make_stub_handler(stub_server)
+    assert handler.get_movie_by_title('Alien')['name'] == 'Alien'
+
+
+def test_read_timeout_is_bounded(stub_server):
+    handler = make_stub_handler(stub_server, timeout=(1, 0.1))
+    started = time.monotonic()
+
+    assert handler.get_movie_by_title('slow') is None
+    assert time.monotonic() - started < 2
+
+
+def test_5xx_is_retried_then_circuit_opens(stub_server):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    handler = make_stub_handler(stub_server, circuit_breaker=breaker)
+
+    assert handler.get_movie_by_title('broken') is None
+    assert StubOmdbHandler.calls.count('broken') == 3  # first try + 2 retries
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # circuit is open - no request leaves the process
+    assert handler.get_movie_by_title('Alien') is None
+    assert 'Alien' not in StubOmdbHandler.calls
+
+
+def test_circuit_half_open_trial_closes_it():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # only one trial call at a time
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_concurrent_identical_lookups_are_coalesced(stub_server):
+    handler = SyncMovieAPIHandler(make_stub_handler(stub_server), max_concurrent_requests=4)
+    titles = ['slow'] * 10 + ['Alien'] * 5
+
+    with ThreadPoolExecutor(max_workers=len(titles)) as executor:
+        movies = list(executor.map(handler.get_movie_by_title, titles))
+    handler.close()
+
+    assert [movie['name'] for movie in movies] == titles
+    assert StubOmdbHandler.calls.count('slow') == 1
+    assert StubOmdbHandler.calls.count('Alien') == 1
+    assert handler.async_handler.upstream_requests == len(StubOmdbHandler.calls)
+
+
+def test_get_movies_resolves_titles_and_imdb_ids(stub_server):
+    handler = SyncMovieAPIHandler(make_stub_handler(stub_server))
+
+    movies = handler.get_movies(['Alien', 'tt0120338', 'Alien'])
+    handler.close()
+
+    assert [movie['name'] for movie in movies] == ['Alien', 'tt0120338', 'Alien']
+    assert sorted(StubOmdbHandler.calls) == ['Alien', 'tt0120338']
@@ -0,0 +1,85 @@
+import config  # imported first, config imports the data managers
+from data_managers.password_hasher import PasswordHasher, PasswordHasherBusyError
+from data_managers.json_data_manager import JSONDataManager
+import os
+import threading
+import pytest
+
+FILE_NAME = "test_password_hasher"
+FILE_PATH = os.path.join('data', FILE_NAME + '.json')
+
+
+@pytest.fixture
+def hasher():
+    # minimal bcrypt cost keeps tests fast
+    password_hasher = PasswordHasher(rounds=4, workers=2, use_processes=False)
+    yield password_hasher
+    password_hasher.shutdown()
+
+
+def test_hash_and_check(hasher):
+    password_hash = hasher.hash("secret123")
+
+    assert password_hash.startswith("$2b$04$")
+    assert hasher.check("secret123", password_hash)
+    assert not hasher.check("wrong", password_hash)
+    assert hasher.stats()['completed'] == 3
+    assert hasher.stats()['queue_depth'] == 0
+    assert hasher.stats()['pool_started']
+
+
+def test_stats_dont_start_the_pool():
+    process_hasher = PasswordHasher(rounds=4, workers=1)
+    assert not process_hasher.stats()['pool_started']
+
+
+def test_hash_in_worker_process():
+    process_hasher = PasswordHasher(rounds=4, workers=1)
+    try:
+        assert process_hasher.check("secret123", process_hasher.hash("secret123"))
+    finally:
+        process_hasher.shutdown()
+
+
+def test_needs_rehash(hasher):
+    other_cost_hasher = PasswordHasher(rounds=5, use_processes=False)
+
+    assert not hasher.needs_rehash(hasher.hash("secret123"))
+    assert hasher.needs_rehash(other_cost_hasher.hash("secret123"))
+    assert hasher.needs_rehash("not a bcrypt hash")
+    other_cost_hasher.shutdown()
+
+
+def test_full_queue_is_rejected():
+    busy_hasher = PasswordHasher(rounds=4, workers=1, max_queue=1, use_processes=False)
+    release = threading.Event()
+    worker = threading.Thread(target=busy_hasher._run, args=(release.wait,))
+    worker.start()
+    try:
+        while busy_hasher.stats()['queue_depth'] == 0:
+            pass
+        with pytest.raises(PasswordHasherBusyError):
+            busy_hasher.hash("secret123")
+        assert busy_hasher.stats()['rejected'] == 1
+    finally:
+        release.set()
+        worker.join()
+        busy_hasher.shutdown()
+
+
+def test_login_rehashes_password_with_new_cost(hasher):
+    old_cost_hasher = PasswordHasher(rounds=5, use_processes=False)
+    JSONDataManager(FILE_NAME, old_cost_hasher).add_user("bob", password="secret123")
+    try:
+        manager = JSONDataManager(FILE_NAME, hasher)
+        old_hash = manager.get_user_by_name("bob")['password']
+
+        assert manager.is_password_valid("bob", "secret123")
+        new_hash = manager.get_user_by_name("bob")['password']
+        assert new_hash != old_hash and not hasher.needs_rehash(new_hash)
+        assert manager.is_password_valid("bob", "secret123")
+        assert not manager.is_password_valid("bob", "wrong")
+    finally:
+        old_cost_hasher.shutdown()
+        if os.path.exists(FILE_PATH):
+            os.remove(FILE_PATH)
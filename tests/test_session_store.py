@@ -0,0 +1,111 @@
+from flask import Flask, session
+from data_managers.session_store import ServerSideSessionInterface, MemorySessionStore, \
+    SQLiteSessionStore
+import os
+import time
+import pytest
+
+DB_PATH = os.path.join('data', 'test_sessions.sqlite')
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request):
+    if request.param == 'memory':
+        yield MemorySessionStore()
+    else:
+        sqlite_store = SQLiteSessionStore(DB_PATH)
+        yield sqlite_store
+        sqlite_store.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(DB_PATH + suffix):
+                os.remove(DB_PATH + suffix)
+
+
+def make_client(store, **kwargs):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.session_interface = ServerSideSessionInterface(store, sweep_interval_seconds=3600,
+                                                       **kwargs)
+
+    @app.route('/login/<int:user_id>')
+    def login(user_id):
+        session['user_id'] = user_id
+        return 'ok'
+
+    @app.route('/visit')
+    def visit():
+        session['visits'] = session.get('visits', 0) + 1
+        return 'ok'
+
+    @app.route('/me')
+    def me():
+        return str(session.get('user_id'))
+
+    @app.route('/logout')
+    def logout():
+        session.pop('user_id', None)
+        return 'ok'
+
+    return app, app.test_client()
+
+
+def test_cookie_holds_only_session_id(store):
+    app, client = make_client(store)
+    client.get('/login/7')
+
+    session_id = client.get_cookie('session').value
+    assert len(session_id) == 43  # random id, no signed session data
+    assert client.get('/me').get_data(as_text=True) == '7'
+    assert store.get(session_id, time.time()) is not None
+
+
+def test_logout_invalidates_session_at_once(store):
+    app, client = make_client(store)
+    client.get('/login/7')
+    session_id = client.get_cookie('session').value
+
+    client.get('/logout')
+    assert store.get(session_id, time.time()) is None
+    # stolen copy of the cookie doesn't work anymore
+    other_client = app.test_client()
+    other_client.set_cookie('session', session_id)
+    assert other_client.get('/me').get_data(as_text=True) == 'None'
+
+
+def test_login_issues_new_session_id(store):
+    app, client = make_client(store)
+    client.get('/visit')
+    fixed_session_id = client.get_cookie('session').value
+
+    client.get('/login/7')
+    session_id = client.get_cookie('session').value
+    assert session_id != fixed_session_id
+    assert store.get(fixed_session_id, time.time()) is None
+    # id known before the login is not logged in
+    other_client = app.test_client()
+    other_client.set_cookie('session', fixed_session_id)
+    assert other_client.get('/me').get_data(as_text=True) == 'None'
+    assert client.get('/me').get_data(as_text=True) == '7'
+
+
+def test_last_seen_writes_are_batched_and_sweeper_deletes_expired(store, monkeypatch):
+    touches = []
+    touch_many = store.touch_many
+    monkeypatch.setattr(store, 'touch_many', lambda expires_at_by_session_id: (
+        touches.append(expires_at_by_session_id), touch_many(expires_at_by_session_id)))
+    app, client = make_client(store, ttl_seconds=100, last_seen_batch_size=1000)
+    client.get('/login/7')
+    session_id = client.get_cookie('session').value
+
+    client.get('/me')
+    client.get('/me')
+    assert not touches
+    assert app.session_interface.sweep() == 0
+    assert [list(expires_at_by_session_id) for expires_at_by_session_id in touches] == [
+        [session_id]]
+    app.session_interface.flush_last_seen()
+    assert len(touches) == 1
+
+    store.save(session_id, store.get(session_id, time.time()), time.time() - 1)
+    assert app.session_interface.sweep() == 1
+    assert client.get('/me').get_data(as_text=True) == 'None'
@@ -0,0 +1,641 @@
+import config  # imported first, config imports the data managers
+from contextlib import contextmanager
+from flask import Flask, render_template_string, session
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import IntegrityError
+from data_managers.sql_data_manager import SQLiteDataManager
+from data_managers.data_models_for_sql import Review, db
+from data_managers.sql_migrations import upgrade_database, SCHEMA_VERSION
+from data_managers.password_hasher import PasswordHasher
+from data_managers.title_index import MovieTitleIndex
+from data_managers.library_archive import write_archive, read_archive, ArchiveError
+import os
+import io
+import shutil
+import sqlite3
+import threading
+import pytest
+
+FILE_NAME = "test_movies.sqlite"
+DATA_FOLDER_NAME = 'data'
+FILE_PATH = os.path.join(DATA_FOLDER_NAME, FILE_NAME)
+OLD_SCHEMA_DB_PATH = os.path.join(DATA_FOLDER_NAME, 'default_movies.sqlite')
+
+
+def make_movie(movie_id, name="Pirates"):
+    return {"id": movie_id, "name": name, "director": "Roman Polanski",
+            "year": "1986", "rating": "6.0", "imdb_link": "https://www.test.com",
+            "image_link": "https:test-link.jpg"}
+
+
+@contextmanager
+def count_queries():
+    """Counts sql statements sent to the db inside the with block: with count_queries() as q"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def fill_library(manager, user_name, movies_count, review_text=None):
+    """Adds user with movies_count movies (and reviews on every movie if review_text passed)"""
+    manager.add_user(user_name)
+    user_id = manager.get_all_users()[-1]['id']
+    movie_ids = [f"tt{user_id:03d}{number:04d}" for number in range(movies_count)]
+    manager.add_movies_to_user(user_id, [make_movie(movie_id) for movie_id in movie_ids])
+    if review_text:
+        for movie_id in movie_ids:
+            manager.update_users_movie_review(user_id, movie_id, review_text)
+    db.session.expire_all()
+    return user_id
+
+
+@pytest.fixture
+def sql_manager():
+    app = Flask(__name__)
+    manager = SQLiteDataManager(FILE_NAME, app)
+    with app.app_context():
+        db.create_all()
+        yield manager
+        db.session.remove()
+        db.engine.dispose()
+    # Teardown
+    if os.path.exists(FILE_PATH):
+        os.remove(FILE_PATH)
+
+
+def test_add_movies_to_user_in_bulk(sql_manager):
+    sql_manager.add_user("bob")
+    sql_manager.add_movie_to_user(1, make_movie("tt0000001"))
+
+    added_ids = sql_manager.add_movies_to_user(
+        1, [make_movie("tt0000001"), make_movie("tt0000002"), make_movie("tt0000002")])
+
+    assert added_ids == {"tt0000002"}
+    movie_ids = [movie['id'] for movie in sql_manager.get_user_movies(1)]
+    assert sorted(movie_ids) == ["tt0000001", "tt0000002"]
+
+
+def test_bulk_add_ignores_movie_added_concurrently(sql_manager):
+    sql_manager.add_user("bob")
+    sql_manager.add_user("amy")
+    other_writer = sqlite3.connect(FILE_PATH)
+    written = []
+
+    def add_movie_after_user_is_checked(conn, cursor, statement, parameters, context,
+                                        executemany):
+        # other worker adds the same movie right before this one checks what to insert
+        if not written and statement.startswith('SELECT') and (
+                'EXISTS' in statement or 'FROM movies' in statement):
+            other_writer.execute(
+                "INSERT INTO movies (id, name, director, year, rating, imdb_link, image_link, "
+                "owners_count) VALUES ('tt0000002', 'Pirates', '', '', '', '', '', 1)")
+            other_writer.execute("INSERT INTO user_movie (user_id, movie_id) VALUES (2, 'tt0000002')")
+            other_writer.commit()
+            written.append(statement)
+
+    event.listen(db.engine, 'after_cursor_execute', add_movie_after_user_is_checked)
+    try:
+        added_ids = sql_manager.add_movies_to_user(
+            1, [make_movie("tt0000001"), make_movie("tt0000002")])
+    finally:
+        event.remove(db.engine, 'after_cursor_execute', add_movie_after_user_is_checked)
+        other_writer.close()
+    assert written
+    assert added_ids == {"tt0000001", "tt0000002"}
+    assert sql_manager.repair_movie_counters() == 0
+
+
+def test_add_movies_to_unexisted_user(sql_manager):
+    with pytest.raises(ValueError):
+        sql_manager.add_movies_to_user(1, [make_movie("tt0000001")])
+
+
+@pytest.mark.parametrize('method_name', ['get_user_by_id', 'get_user_movies'])
+def test_user_library_read_costs_constant_queries(sql_manager, method_name):
+    small_user_id = fill_library(sql_manager, "small", 1)
+    big_user_id = fill_library(sql_manager, "big", 20)
+
+    with count_queries() as small_queries:
+        getattr(sql_manager, method_name)(small_user_id)
+    with count_queries() as big_queries:
+        getattr(sql_manager, method_name)(big_user_id)
+
+    assert len(big_queries) == len(small_queries) <= 2
+
+
+def test_movie_reviews_cost_constant_queries(sql_manager):
+    review_text = "a" * 50
+    first_user_id = fill_library(sql_manager, "first", 3, review_text)
+    # other users reviewing the same movie
+    for user_name in ("second", "third", "fourth"):
+        user_id = fill_library(sql_manager, user_name, 0)
+        sql_manager.add_movie_to_user(user_id, make_movie(f"tt{first_user_id:03d}0000"))
+        sql_manager.update_users_movie_review(user_id, f"tt{first_user_id:03d}0000", review_text)
+    db.session.expire_all()
+
+    with count_queries() as queries:
+        reviews = sql_manager.get_all_reviews_for_movie(f"tt{first_user_id:03d}0000")
+    assert len(reviews) == 4
+    assert len(queries) == 2
+
+    # page of movie reviews touches movie.reviews and review.user of every review
+    with count_queries() as queries:
+        movie = sql_manager.get_movie_by_id(f"tt{first_user_id:03d}0000")
+        rendered = render_template_string(
+            "{% for review in movie.reviews %}{{ review.user.name }};{% endfor %}", movie=movie)
+    assert rendered.count(';') == 4
+    assert len(queries) == 2
+
+
+def test_second_review_of_same_movie_is_rejected(sql_manager):
+    user_id = fill_library(sql_manager, "bob", 1, "a" * 50)
+    db.session.add(Review(
+        user_id=user_id, movie_id=f"tt{user_id:03d}0000", review="b" * 50))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+
+def test_db_is_upgraded_only_when_asked(caplog):
+    shutil.copy(OLD_SCHEMA_DB_PATH, FILE_PATH)
+    connection = sqlite3.connect(FILE_PATH)
+    user_id, movie_id = connection.execute('SELECT user_id, movie_id FROM user_movie').fetchone()
+    for review_text in ("first review", "second review"):
+        connection.execute('INSERT INTO reviews (user_id, movie_id, review) VALUES (?, ?, ?)',
+                           (user_id, movie_id, review_text))
+    connection.commit()
+    duplicated_count = connection.execute(
+        'SELECT COUNT(*) - COUNT(DISTINCT user_id || ":" || movie_id) FROM reviews').fetchone()[0]
+    connection.close()
+    with open(FILE_PATH, 'rb') as db_file:
+        old_db_content = db_file.read()
+
+    app = Flask(__name__)
+    manager = SQLiteDataManager(FILE_NAME, app)
+    try:
+        with open(FILE_PATH, 'rb') as db_file:
+            assert db_file.read() == old_db_content
+        with app.app_context(), caplog.at_level('WARNING'):
+            assert manager.upgrade_db() == SCHEMA_VERSION
+            assert manager.upgrade_db() == 0
+            db.engine.dispose()
+        assert f"Removed {duplicated_count} older reviews" in caplog.text
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(FILE_PATH + suffix):
+                os.remove(FILE_PATH + suffix)
+
+
+def test_upgrade_old_db_file_in_place():
+    shutil.copy(OLD_SCHEMA_DB_PATH, FILE_PATH)
+    connection = sqlite3.connect(FILE_PATH)
+    user_id, movie_id = connection.execute('SELECT user_id, movie_id FROM user_movie').fetchone()
+    links_count = connection.execute('SELECT COUNT(*) FROM user_movie').fetchone()[0]
+    # duplicated rows old schema allowed
+    connection.execute('INSERT INTO user_movie VALUES (?, ?)', (user_id, movie_id))
+    connection.commit()
+    connection.close()
+
+    engine = create_engine('sqlite:///' + os.path.abspath(FILE_PATH))
+    try:
+        assert upgrade_database(engine) == SCHEMA_VERSION
+        assert upgrade_database(engine) == 0  # already upgraded
+    finally:
+        engine.dispose()
+
+    connection = sqlite3.connect(FILE_PATH)
+    indexes = {row[0] for row in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'ix_users_name', 'ix_user_movie_movie_id', 'ix_reviews_movie_id',
+            'uq_reviews_user_id_movie_id'} <= indexes
+    assert connection.execute('SELECT COUNT(*) FROM user_movie').fetchone()[0] == links_count
+    with pytest.raises(sqlite3.IntegrityError):
+        connection.execute('INSERT INTO user_movie VALUES (?, ?)', (user_id, movie_id))
+    connection.close()
+    os.remove(FILE_PATH)
+
+
+def test_membership_checks_dont_load_library(sql_manager):
+    user_id = fill_library(sql_manager, "bob", 30, "a" * 50)
+    movie_id = f"tt{user_id:03d}0007"
+    other_user_id = fill_library(sql_manager, "alice", 0)
+    sql_manager.add_movie_to_user(other_user_id, sql_manager.get_user_movie(user_id, movie_id))
+    db.session.expire_all()
+
+    with count_queries() as queries:
+        sql_manager.add_movie_to_user(user_id, make_movie(movie_id))  # already got it
+        sql_manager.get_user_movie(user_id, movie_id)
+        sql_manager.delete_review(user_id, movie_id)
+        sql_manager.delete_movie_of_user(user_id, movie_id)
+    # lazy loads of user.movies/movie.users select 'FROM movies, user_movie' or 'FROM users, user_movie'
+    assert not any(', user_movie' in statement for statement in queries)
+
+    assert len(sql_manager.get_user_movies(user_id)) == 29
+    # movie still belongs to other user so it is kept in db
+    assert sql_manager.get_user_movie(other_user_id, movie_id)['id'] == movie_id
+    sql_manager.delete_movie_of_user(other_user_id, movie_id)
+    assert sql_manager.get_movie_by_id(movie_id) is None
+    with pytest.raises(ValueError):
+        sql_manager.get_user_movie(user_id, movie_id)
+
+
+def test_keyset_pagination(sql_manager):
+    user_id = fill_library(sql_manager, "bob", 5)
+    for user_name in ("alice", "carol"):
+        sql_manager.add_user(user_name)
+
+    first_page = sql_manager.get_user_movies(user_id, limit=2)
+    second_page = sql_manager.get_user_movies(user_id, limit=2, after=first_page[-1]['id'])
+    last_page = sql_manager.get_user_movies(user_id, limit=2, after=second_page[-1]['id'])
+    movie_ids = [movie['id'] for movie in first_page + second_page + last_page]
+    assert movie_ids == sorted(movie['id'] for movie in sql_manager.get_user_movies(user_id))
+    assert len(last_page) == 1
+
+    users_page = sql_manager.get_all_public_users(limit=2, after=str(user_id))
+    assert [user['name'] for user in users_page] == ["alice", "carol"]
+    with pytest.raises(ValueError):
+        sql_manager.get_all_users(after='not a number')
+
+
+def test_iter_user_movies_in_batches(sql_manager):
+    user_id = fill_library(sql_manager, "bob", 7)
+
+    movies = sql_manager.iter_user_movies(user_id, batch_size=3)
+    assert list(movies) == sql_manager.get_user_movies(user_id)
+    with pytest.raises(ValueError):
+        sql_manager.iter_user_movies(user_id + 1)
+
+
+def test_login_rehashes_password_with_new_cost(sql_manager):
+    sql_manager._password_hasher = PasswordHasher(rounds=4, use_processes=False)
+    sql_manager.add_user("bob", password="secret123")
+    sql_manager._password_hasher = PasswordHasher(rounds=5, use_processes=False)
+
+    assert sql_manager.is_password_valid("bob", "secret123")
+    new_hash = sql_manager.get_user_by_name("bob")['password']
+    assert new_hash.startswith("$2b$05$")
+    assert not sql_manager.is_password_valid("bob", "wrong")
+
+
+def test_user_profile_has_no_movies_and_password(sql_manager):
+    sql_manager._password_hasher = PasswordHasher(rounds=4, use_processes=False)
+    user_id = fill_library(sql_manager, "bob", 0)
+    sql_manager.add_user("alice", password="secret123")
+    alice = sql_manager.get_user_by_name("alice")
+
+    assert sql_manager.get_user_profile(alice['id']) == {
+        'id': alice['id'], 'name': "alice", 'avatar': alice['avatar']}
+    assert sql_manager.get_user_profile(user_id)['name'] == "bob"
+    assert sql_manager.get_user_profile(user_id + 100) is None
+
+
+def test_user_id_by_name_reads_only_the_id(sql_manager):
+    user_id = fill_library(sql_manager, "bob", 5)
+
+    with count_queries() as queries:
+        assert sql_manager.get_user_id_by_name("bob") == user_id
+    assert len(queries) == 1 and 'movies' not in queries[0] and 'password' not in queries[0]
+    assert sql_manager.get_user_id_by_name("alice") is None
+
+
+def test_every_change_increases_data_version(sql_manager):
+    versions = [sql_manager.get_data_version()]
+    user_id = fill_library(sql_manager, "bob", 2)  # add_user, add_movies_to_user
+    versions.append(sql_manager.get_data_version())
+    movie_id = f"tt{user_id:03d}0000"
+    sql_manager.add_movie_to_user(user_id, make_movie("tt9999999"))
+    versions.append(sql_manager.get_data_version())
+    sql_manager.update_movie_of_user(user_id, movie_id, dict(make_movie(movie_id), rating="7.5"))
+    versions.append(sql_manager.get_data_version())
+    sql_manager.update_users_movie_review(user_id, movie_id, "a" * 50)
+    versions.append(sql_manager.get_data_version())
+    sql_manager.delete_review(user_id, movie_id)
+    versions.append(sql_manager.get_data_version())
+    sql_manager.delete_movie_of_user(user_id, movie_id)
+    versions.append(sql_manager.get_data_version())
+    sql_manager.delete_user(user_id)
+    versions.append(sql_manager.get_data_version())
+
+    assert versions == sorted(set(versions))
+    assert versions[0] == 0
+    reads_version = sql_manager.get_data_version()
+    sql_manager.get_all_users()
+    assert sql_manager.get_data_version() == reads_version
+
+
+def test_revisions_change_only_with_own_resource(sql_manager):
+    first_user_id = fill_library(sql_manager, "bob", 2)
+    second_user_id = fill_library(sql_manager, "alice", 0)
+    movie_id = f"tt{first_user_id:03d}0000"
+    sql_manager.add_movie_to_user(second_user_id, make_movie(movie_id))
+    first_revision = sql_manager.get_user_revision(first_user_id)
+    second_revision = sql_manager.get_user_revision(second_user_id)
+    movie_revision = sql_manager.get_movie_revision(movie_id)
+
+    # review changes the reviews list of the movie only
+    sql_manager.update_users_movie_review(first_user_id, movie_id, "a" * 50)
+    assert sql_manager.get_movie_revision(movie_id) > movie_revision
+    assert sql_manager.get_user_revision(first_user_id) == first_revision
+
+    # movie data is part of movies lists of all its owners
+    sql_manager.update_movie_of_user(first_user_id, movie_id, dict(make_movie(movie_id),
+                                                                    rating="7.5"))
+    assert sql_manager.get_user_revision(first_user_id) > first_revision
+    assert sql_manager.get_user_revision(second_user_id) > second_revision
+
+    second_revision = sql_manager.get_user_revision(second_user_id)
+    sql_manager.add_movie_to_user(first_user_id, make_movie("tt9999999"))
+    assert sql_manager.get_user_revision(second_user_id) == second_revision
+    assert sql_manager.get_user_revision("not a number") is None
+    assert sql_manager.get_movie_revision("tt0000000") is None
+
+
+def test_movie_counters_stay_consistent(sql_manager):
+    first_user_id = fill_library(sql_manager, "bob", 3, "a" * 50)
+    second_user_id = fill_library(sql_manager, "alice", 0)
+    shared_movie_id = f"tt{first_user_id:03d}0000"
+    sql_manager.add_movies_to_user(second_user_id, [make_movie(shared_movie_id)])
+    sql_manager.add_movie_to_user(second_user_id, make_movie(shared_movie_id))  # already got it
+    sql_manager.update_users_movie_review(second_user_id, shared_movie_id, "b" * 50)
+
+    most_collected = sql_manager.get_most_collected_movies(limit=1)[0]
+    assert (most_collected['id'], most_collected['owners_count'],
+            most_collected['reviews_count']) == (shared_movie_id, 2, 2)
+
+    sql_manager.delete_review(second_user_id, shared_movie_id)
+    sql_manager.delete_movie_of_user(first_user_id, f"tt{first_user_id:03d}0001")
+    assert sql_manager.repair_movie_counters() == 0
+
+    sql_manager.delete_user(first_user_id)
+    assert sql_manager.repair_movie_counters() == 0
+    assert [movie['owners_count'] for movie in sql_manager.get_most_collected_movies()] == [1]
+
+    # counters changed outside of the data manager are fixed by the repair
+    db.session.execute(db.text("UPDATE movies SET owners_count = 5"))
+    db.session.commit()
+    assert sql_manager.repair_movie_counters() == 1
+    assert sql_manager.get_most_collected_movies()[0]['owners_count'] == 1
+
+
+def test_new_review_doesnt_lose_concurrent_counter_change(sql_manager):
+    user_id = fill_library(sql_manager, "bob", 1)
+    movie_id = f"tt{user_id:03d}0000"
+    other_writer = sqlite3.connect(FILE_PATH)
+    written = []
+
+    def write_after_movie_is_read(conn, cursor, statement, parameters, context, executemany):
+        # other worker adds a review while this one already read the movie row
+        if not written and statement.startswith('SELECT') and 'FROM movies' in statement:
+            other_writer.execute('UPDATE movies SET reviews_count = reviews_count + 1')
+            other_writer.commit()
+            written.append(statement)
+
+    event.listen(db.engine, 'after_cursor_execute', write_after_movie_is_read)
+    try:
+        sql_manager.update_users_movie_review(user_id, movie_id, "a" * 50)
+    finally:
+        event.remove(db.engine, 'after_cursor_execute', write_after_movie_is_read)
+        other_writer.close()
+    assert written
+    assert sql_manager.get_most_collected_movies()[0]['reviews_count'] == 2
+
+
+def test_title_index_drops_movies_deleted_with_users(sql_manager):
+    kept_user_id = fill_library(sql_manager, "kept", 1)
+    deleted_user_id = fill_library(sql_manager, "deleted", 2)
+    title_index = MovieTitleIndex()
+    title_index.update(sql_manager)
+    assert title_index.stats()['titles'] == sql_manager.get_movies_count() == 3
+
+    sql_manager.delete_users([deleted_user_id])
+    title_index.update(sql_manager)
+    assert [movie['id'] for movie in title_index.suggest("pirates")] == [
+        f"tt{kept_user_id:03d}0000"]
+
+
+def test_delete_users_with_set_based_statements(sql_manager):
+    small_user_id = fill_library(sql_manager, "small", 1, "a" * 50)
+    big_user_ids = [fill_library(sql_manager, name, 20, "a" * 50) for name in ("big", "bigger")]
+    keeper_id = fill_library(sql_manager, "keeper", 0)
+    shared_movie_id = f"tt{big_user_ids[0]:03d}0000"
+    sql_manager.add_movie_to_user(keeper_id, make_movie(shared_movie_id))
+
+    with count_queries() as small_queries:
+        assert sql_manager.delete_users([small_user_id]) == [small_user_id]
+    with count_queries() as big_queries:
+        deleted_ids = sql_manager.delete_users(big_user_ids + [big_user_ids[0], 999])
+    assert sorted(deleted_ids) == big_user_ids
+    assert len(big_queries) == len(small_queries)
+
+    # only the movie the keeper got is left, without reviews of deleted users
+    assert [user['name'] for user in sql_manager.get_all_users()] == ["keeper"]
+    assert sql_manager.get_all_reviews_for_movie(shared_movie_id) == []
+    assert db.session.execute(db.text("SELECT COUNT(*) FROM movies")).scalar() == 1
+    assert db.session.execute(db.text("SELECT COUNT(*) FROM reviews")).scalar() == 0
+    assert sql_manager.repair_movie_counters() == 0
+    with pytest.raises(ValueError):
+        sql_manager.delete_user(small_user_id)
+
+
+def test_search_movies_by_word_prefixes(sql_manager):
+    user_id = fill_library(sql_manager, "searcher", 0)
+    sql_manager.add_movies_to_user(user_id, [
+        make_movie("tt0000001", "Pirates"),
+        dict(make_movie("tt0000002", "Chinatown"), year="1974"),
+        dict(make_movie("tt0000003", "Titanic"), director="James Cameron", year="1997")])
+
+    assert [movie['id'] for movie in sql_manager.search_movies("pol")] == [
+        "tt0000001", "tt0000002"]
+    # name matches rank above director matches
+    sql_manager.add_movie_to_user(user_id, dict(make_movie("tt0000004", "Cameron's Story"),
+                                                year="2001"))
+    assert [movie['id'] for movie in sql_manager.search_movies("cameron")][0] == "tt0000004"
+    assert sql_manager.search_movies('titan "OR') == sql_manager.search_movies("titan or")
+    assert sql_manager.search_movies("  ") == []
+
+    # index follows changes of the movies table
+    sql_manager.update_movie_of_user(user_id, "tt0000003", dict(
+        make_movie("tt0000003", "Titanic"), director="Jim Cameron", year="1997"))
+    assert sql_manager.search_movies("james") == []
+    assert [movie['id'] for movie in sql_manager.search_movies("jim titan")] == ["tt0000003"]
+    sql_manager.delete_movie_of_user(user_id, "tt0000003")
+    assert sql_manager.search_movies("titanic") == []
+
+    with count_queries() as queries:
+        assert sql_manager.find_movie("CHINATOWN")['id'] == "tt0000002"
+    # exact name is looked up with the index, not with the full text search
+    query_plan = db.session.connection().exec_driver_sql(
+        'EXPLAIN QUERY PLAN ' + queries[-1], ("CHINATOWN", 1, 0)).all()
+    assert 'ix_movies_name_nocase' in query_plan[0][-1]
+    assert sql_manager.find_movie("TT0000001")['name'] == "Pirates"
+    assert sql_manager.find_movie("China") is None
+
+
+def test_movie_titles_changed_after_data_version(sql_manager):
+    user_id = fill_library(sql_manager, "titles", 2)
+    data_version = sql_manager.get_data_version()
+    sql_manager.add_movie_to_user(user_id, make_movie("tt0000001", "Titanic"))
+
+    assert len(sql_manager.get_movie_titles()) == 3
+    assert sql_manager.get_movie_titles(changed_after=data_version) == [
+        {'id': "tt0000001", 'name': "Titanic", 'year': "1986"}]
+
+
+def test_connections_use_wal_profile(sql_manager):
+    with db.engine.connect() as connection:
+        assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert connection.exec_driver_sql('PRAGMA foreign_keys').scalar() == 1
+        assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == \
+            config.SQLITE_PRAGMAS['busy_timeout']
+    with pytest.raises(IntegrityError):
+        db.session.execute(db.text("INSERT INTO user_movie VALUES (999, 'tt9999999')"))
+    db.session.rollback()
+
+    # reader is not blocked by a write transaction of another worker
+    sql_manager.add_user("reader")
+    writer = sqlite3.connect(FILE_PATH)
+    try:
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute("INSERT INTO users (name, revision) VALUES ('writer', 0)")
+        assert [user['name'] for user in sql_manager.get_all_users()] == ["reader"]
+    finally:
+        writer.rollback()
+        writer.close()
+
+
+def test_reads_go_to_replica_after_own_writes_are_copied():
+    replica_path = os.path.join(DATA_FOLDER_NAME, 'test_movies_replica.sqlite')
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    manager = SQLiteDataManager(FILE_NAME, app, read_replica_name='test_movies_replica.sqlite')
+    try:
+        with app.app_context():
+            db.create_all()
+            manager.refresh_read_replica()
+            manager.add_user("writer")
+            # the writing context reads its own change from the primary
+            assert [user['name'] for user in manager.get_all_users()] == ["writer"]
+
+        with app.app_context():
+            assert manager.get_all_users() == []
+            assert list(manager.iter_all_users()) == []
+            with pytest.raises(Exception):
+                db.session.execute(db.text("DELETE FROM users"),
+                                   bind_arguments={'bind': manager.read_replica_engine})
+            db.session.rollback()
+            assert manager.refresh_read_replica() == manager.get_data_version()
+            assert [user['name'] for user in manager.get_all_users()] == ["writer"]
+
+        # stickiness is kept in the flask session between requests of the client
+        with app.test_request_context():
+            manager.add_user("client")
+            cookie_session = dict(session)
+        with app.test_request_context():
+            session.update(cookie_session)
+            assert len(manager.get_all_users()) == 2
+        with app.test_request_context():
+            assert len(manager.get_all_users()) == 1
+    finally:
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        manager.read_replica_engine.dispose()
+        for path in (FILE_PATH, replica_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def test_hot_restore_doesnt_disturb_open_connections(sql_manager):
+    fill_library(sql_manager, "before", 3)
+    data_version = sql_manager.get_data_version()
+    # request in flight on other worker, reading a snapshot of the old data
+    reader = sqlite3.connect(FILE_PATH)
+    try:
+        reader.execute('BEGIN')
+        assert reader.execute('SELECT name FROM users').fetchall() == [("before",)]
+
+        result = sql_manager.restore_db_to_default()
+
+        assert reader.execute('SELECT name FROM users').fetchall() == [("before",)]
+        reader.rollback()
+        assert ("before",) not in reader.execute('SELECT name FROM users').fetchall()
+    finally:
+        reader.close()
+
+    assert result['data_version'] == sql_manager.get_data_version() == data_version + 1
+    assert result['duration_ms'] > 0
+    assert "before" not in [user['name'] for user in sql_manager.get_all_users()]
+    assert [movie['name'] for movie in sql_manager.search_movies("titanic")] == ["Titanic"]
+    assert sql_manager.repair_movie_counters() == 0
+    assert not os.path.exists(FILE_PATH + '.restore')
+
+
+def test_hot_restore_reads_data_version_under_write_lock(sql_manager):
+    fill_library(sql_manager, "before", 1)
+    data_version = sql_manager.get_data_version()
+    # other worker is writing a change when the restore starts
+    writer = sqlite3.connect(FILE_PATH, isolation_level=None, check_same_thread=False)
+    try:
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute('UPDATE data_version SET version = version + 1')
+        commit_timer = threading.Timer(0.3, writer.execute, ('COMMIT',))
+        commit_timer.start()
+
+        result = sql_manager.restore_db_to_default()
+        commit_timer.join()
+    finally:
+        writer.close()
+
+    # version of the writer's change is not reused by the restored data
+    assert result['data_version'] == sql_manager.get_data_version() == data_version + 2
+    assert not os.path.exists(FILE_PATH + '.restore')
+
+
+def test_library_archive_round_trip(sql_manager):
+    first_user_id = fill_library(sql_manager, "first", 7, "a" * 50)
+    fill_library(sql_manager, "second", 3)
+    sql_manager.add_movie_to_user(first_user_id, make_movie("tt0000001", "Titanic"))
+    users = sql_manager.get_all_users()
+    libraries = [sql_manager.get_user_by_id(user['id']) for user in users]
+
+    archive = io.BytesIO()
+    with sql_manager.export_library(batch_size=4) as (header, batches):
+        write_archive(archive, header, batches)
+    # a cut archive or archive of other schema is rejected without touching the data
+    with pytest.raises(ArchiveError):
+        header, batches = read_archive(io.BytesIO(archive.getvalue()[:-20]))
+        sql_manager.import_library(header, batches)
+    with pytest.raises(ArchiveError):
+        header, batches = read_archive(io.BytesIO(archive.getvalue()))
+        sql_manager.import_library(dict(header, schema_version=SCHEMA_VERSION - 1), batches)
+    assert sql_manager.get_all_users() == users
+
+    sql_manager.delete_users([user['id'] for user in users])
+    archive.seek(0)
+    header, batches = read_archive(archive)
+    with count_queries() as queries:
+        counts = sql_manager.import_library(header, batches)
+    assert counts == {'users': 2, 'movies': 11, 'user_movie': 11, 'reviews': 7}
+    assert len(queries) < 20  # batches, not rows
+
+    db.session.expire_all()
+    assert [sql_manager.get_user_by_id(user['id']) for user in users] == libraries
+    assert [movie['id'] for movie in sql_manager.search_movies("titanic")] == ["tt0000001"]
+    assert sql_manager.repair_movie_counters() == 0
+
+
+def test_library_export_reads_one_snapshot(sql_manager):
+    user_id = fill_library(sql_manager, "first", 2)
+    with sql_manager.export_library() as (header, batches):
+        # changes committed while the archive is written are not in it
+        sql_manager.add_movie_to_user(user_id, make_movie("tt0000001", "Titanic"))
+        exported = {table_name: rows for table_name, _, rows in batches}
+    assert header['data_version'] == sql_manager.get_data_version() - 1
+    assert len(exported['movies']) == len(exported['user_movie']) == 2
@@ -0,0 +1,101 @@
+from data_managers.title_index import MovieTitleIndex
+
+
+class FakeDataManager():
+    """Movies with revisions, like the movies table of the sql data manager"""
+
+    def __init__(self):
+        self.data_version = 0
+        self.movies = {}  # movie id -> (movie dict, revision)
+        self.loads = []
+
+    def add_movie(self, movie_id, name, year="2000"):
+        self.data_version += 1
+        self.movies[movie_id] = ({'id': movie_id, 'name': name, 'year': year}, self.data_version)
+
+    def delete_movie(self, movie_id):
+        self.data_version += 1
+        del self.movies[movie_id]
+
+    def get_data_version(self):
+        return self.data_version
+
+    def get_movie_titles(self, changed_after=None):
+        self.loads.append(changed_after)
+        return [dict(movie) for movie, revision in self.movies.values()
+                if changed_after is None or revision > changed_after]
+
+    def get_movies_count(self):
+        return len(self.movies)
+
+
+def names(movies):
+    return [movie['name'] for movie in movies]
+
+
+def test_suggests_title_starts_before_other_words():
+    data_manager = FakeDataManager()
+    for movie_id, name in enumerate(["The Dark Knight", "Darkman", "Titanic", "Dark City"]):
+        data_manager.add_movie(f"tt{movie_id}", name)
+    index = MovieTitleIndex()
+    index.update(data_manager)
+
+    assert names(index.suggest("dark")) == ["Dark City", "Darkman", "The Dark Knight"]
+    assert names(index.suggest("DARK K")) == ["The Dark Knight"]
+    assert names(index.suggest("dark", limit=1)) == ["Dark City"]
+    assert index.suggest("  ") == []
+    assert index.suggest("star") == []
+
+
+def test_update_loads_only_changed_movies():
+    data_manager = FakeDataManager()
+    data_manager.add_movie("tt1", "Titanic")
+    index = MovieTitleIndex()
+    index.update(data_manager)
+    index.update(data_manager)  # nothing changed, no load
+    assert data_manager.loads == [None]
+
+    data_manager.add_movie("tt2", "Titan A.E.")
+    data_manager.add_movie("tt1", "Titanic II")  # changed title replaces the old one
+    index.update(data_manager)
+    assert data_manager.loads == [None, 1]
+    assert names(index.suggest("titan")) == ["Titan A.E.", "Titanic II"]
+    assert index.stats()['titles'] == 2
+
+    index.clear()
+    assert index.suggest("titan") == []
+    index.update(data_manager)
+    assert names(index.suggest("titanic ii")) == ["Titanic II"]
+
+
+def test_update_drops_deleted_movies():
+    data_manager = FakeDataManager()
+    for movie_id, name in enumerate(["Titanic", "Titan A.E.", "Dark City"]):
+        data_manager.add_movie(f"tt{movie_id}", name)
+    index = MovieTitleIndex()
+    index.update(data_manager)
+
+    data_manager.delete_movie("tt0")
+    data_manager.add_movie("tt3", "Titanic II")
+    index.update(data_manager)
+    assert names(index.suggest("titan")) == ["Titan A.E.", "Titanic II"]
+    assert index.stats()['titles'] == 3
+    assert data_manager.loads == [None, 3, None]  # all ids loaded only after the delete
+
+    data_manager.add_movie("tt4", "Darkman")
+    index.update(data_manager)
+    assert data_manager.loads == [None, 3, None, 5]
+
+
+def test_first_load_builds_same_index_as_updates():
+    data_manager = FakeDataManager()
+    loaded_index, updated_index = MovieTitleIndex(), MovieTitleIndex()
+    updated_index.update(data_manager)  # empty catalog, next updates are incremental
+    for movie_id in range(300):
+        data_manager.add_movie(f"tt{movie_id}", f"Movie {movie_id % 7} Part {movie_id}")
+        updated_index.update(data_manager)
+    loaded_index.update(data_manager)
+
+    assert loaded_index.stats() == updated_index.stats()
+    for prefix in ("movie", "movie 3", "part 1", "part 29", "p"):
+        assert loaded_index.suggest(prefix, limit=50) == updated_index.suggest(prefix, limit=50)